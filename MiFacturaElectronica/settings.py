@@ -39,6 +39,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Modulos.Facturacion.middleware.ContextoUsuarioMiddleware',
+    'Modulos.Facturacion.middleware.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -76,6 +78,83 @@ DATABASES = {
     )
 }
 
+# Shards por empresa (opcional): "alias=url;alias=url", p. ej.
+# DATABASE_SHARDS="empresa2=sqlite:///shards/empresa2.sqlite3;grande=postgres://.../omnigest?options=-csearch_path%3Dgrande"
+# Cada Empresa elige el suyo en `base_datos` (ver Modulos/Facturacion/shards.py)
+for _shard in filter(None, os.getenv('DATABASE_SHARDS', '').split(';')):
+    _alias, _url = _shard.split('=', 1)
+    DATABASES[_alias.strip()] = dj_database_url.parse(_url.strip(), conn_max_age=600)
+
+# Réplica de lectura (opcional) para libros, reportes, exportaciones y búsquedas
+# (ver Modulos/Facturacion/replicas.py). En local puede ser otro archivo SQLite.
+if os.getenv('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = dj_database_url.parse(os.getenv('DATABASE_REPLICA_URL'), conn_max_age=600)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+# Segundos que una sesión lee de la principal después de escribir (retraso de la réplica)
+REPLICA_RETRASO_SEGUNDOS = int(os.getenv('REPLICA_RETRASO_SEGUNDOS', 5))
+
+# Perfil de producción para SQLite (principal, shards y réplica), aplicado al abrir
+# cada conexión: WAL (lectores y un escritor a la vez sin bloquearse), synchronous
+# NORMAL (seguro con WAL), 64 MB de caché de páginas, 256 MB de mmap y tablas
+# temporales en memoria. Las transacciones empiezan con BEGIN IMMEDIATE y esperan
+# el bloqueo de escritura hasta SQLITE_TIMEOUT segundos en vez de fallar con
+# "database is locked". Desactivado por defecto (desarrollo y pruebas); el
+# servidor de producción lo activa con SQLITE_PRODUCCION=1.
+SQLITE_OPCIONES_PRODUCCION = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA cache_size=-65536;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA temp_store=MEMORY;'
+    ),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': float(os.getenv('SQLITE_TIMEOUT', 20)),
+}
+if os.getenv('SQLITE_PRODUCCION', '0') == '1':
+    for _base in DATABASES.values():
+        if _base['ENGINE'] == 'django.db.backends.sqlite3':
+            _base.setdefault('OPTIONS', {}).update(SQLITE_OPCIONES_PRODUCCION)
+
+# Cola de escrituras en un solo hilo por proceso para registrar_venta, modal_dte y
+# registrar_compra (ver Modulos/Facturacion/cola_escrituras.py)
+SQLITE_COLA_ESCRITURAS = os.getenv('SQLITE_COLA_ESCRITURAS', '0') == '1'
+SQLITE_COLA_MAXIMO = int(os.getenv('SQLITE_COLA_MAXIMO', 64))
+
+DATABASE_ROUTERS = []
+if set(DATABASES) - {'default', 'replica'}:
+    DATABASE_ROUTERS.append('Modulos.Facturacion.shards.RouterEmpresas')
+if 'replica' in DATABASES:
+    DATABASE_ROUTERS.append('Modulos.Facturacion.replicas.RouterReplica')
+
+# Números que cada proceso reserva de una vez por serie (1 = series sin huecos;
+# más = sin espera entre workers, con huecos al reiniciar). Ver secuencias.py
+SECUENCIA_BLOQUE = int(os.getenv('SECUENCIA_BLOQUE', 1))
+
+# =====================================================
+# CACHÉ (por proceso; compartida entre workers si hay REDIS_URL)
+# =====================================================
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'omnigest',
+    }
+}
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
+# Segundos que se reutiliza el perfil/empresa cacheado de cada usuario (middleware de contexto).
+# Con LocMem la invalidación solo llega al worker que guardó el cambio: un rol
+# o empresa reasignados siguen vigentes en los demás hasta que vence la entrada
+CONTEXTO_CACHE_SEGUNDOS = int(os.getenv('CONTEXTO_CACHE_SEGUNDOS', 300 if os.getenv('REDIS_URL') else 5))
+
+# Segundos que se reutiliza el resultado de cada búsqueda del autocompletar de DTE
+AUTOCOMPLETAR_CACHE_SEGUNDOS = int(os.getenv('AUTOCOMPLETAR_CACHE_SEGUNDOS', 5))
+
 # =====================================================
 # VALIDACIÓN DE CONTRASEÑAS
 # =====================================================
@@ -130,6 +209,80 @@ SENDGRID_ECHO_TO_STDOUT = True
 # Dirección del remitente que verán tus clientes
 DEFAULT_FROM_EMAIL = "manuelito2327@gmail"
 
+# =====================================================
+# 📤 COLA DE EMISIÓN DE DTE (worker: manage.py procesar_emisiones)
+# =====================================================
+EMISION_MAX_INTENTOS = int(os.getenv('EMISION_MAX_INTENTOS', 3))
+MH_SIMULACION_SEGUNDOS = float(os.getenv('MH_SIMULACION_SEGUNDOS', 2))
+
+# Transmisión al Ministerio de Hacienda (Modulos/Facturacion/mh.py). Sin MH_URL la
+# aprobación se simula; para pruebas de carga: manage.py mh_simulado y
+# MH_URL=http://127.0.0.1:8765
+MH_URL = os.getenv('MH_URL', '')
+MH_USUARIO = os.getenv('MH_USUARIO', '')
+MH_CLAVE = os.getenv('MH_CLAVE', '')
+MH_AMBIENTE = os.getenv('MH_AMBIENTE', '00')  # 00 = pruebas, 01 = producción
+MH_POOL = int(os.getenv('MH_POOL', 10))
+MH_TIMEOUT_CONEXION = float(os.getenv('MH_TIMEOUT_CONEXION', 5))
+MH_TIMEOUT_LECTURA = float(os.getenv('MH_TIMEOUT_LECTURA', 30))
+MH_TOKEN_SEGUNDOS = int(os.getenv('MH_TOKEN_SEGUNDOS', 23 * 3600))
+MH_REINTENTOS = int(os.getenv('MH_REINTENTOS', 3))
+MH_ESPERA_BASE = float(os.getenv('MH_ESPERA_BASE', 0.5))
+MH_ESPERA_MAXIMA = float(os.getenv('MH_ESPERA_MAXIMA', 8))
+MH_CIRCUITO_FALLOS = int(os.getenv('MH_CIRCUITO_FALLOS', 5))
+MH_CIRCUITO_SEGUNDOS = float(os.getenv('MH_CIRCUITO_SEGUNDOS', 30))
+
+# Contingencia (Modulos/Facturacion/contingencia.py): MH_CONTINGENCIA=1 no intenta la
+# transmisión en línea; los DTE se envían en lotes con manage.py transmitir_contingencia.
+# MH_POOL debe ser al menos MH_LOTE_CONCURRENCIA.
+MH_CONTINGENCIA = os.getenv('MH_CONTINGENCIA', '0') == '1'
+MH_LOTE_TAMANO = int(os.getenv('MH_LOTE_TAMANO', 100))
+MH_LOTE_CONCURRENCIA = int(os.getenv('MH_LOTE_CONCURRENCIA', 4))
+MH_LOTE_ESPERA = float(os.getenv('MH_LOTE_ESPERA', 60))
+MH_LOTE_CONSULTA_SEGUNDOS = float(os.getenv('MH_LOTE_CONSULTA_SEGUNDOS', 2))
+
+# Firma JWS de los DTE (Modulos/Facturacion/firma.py): una llave PEM por empresa en
+# FIRMA_DIR (<NIT sin guiones>.pem), con contraseña FIRMA_CLAVE si está cifrada.
+# Los lotes de FIRMA_LOTE_MINIMO documentos o más se firman en FIRMA_PROCESOS procesos
+FIRMA_DIR = Path(os.getenv('FIRMA_DIR', BASE_DIR / 'certificados'))
+FIRMA_CLAVE = os.getenv('FIRMA_CLAVE', '')
+FIRMA_PROCESOS = int(os.getenv('FIRMA_PROCESOS', os.cpu_count() or 1))
+FIRMA_LOTE_MINIMO = int(os.getenv('FIRMA_LOTE_MINIMO', 64))
+
+# Firma de los PDF con pyHanko (Modulos/Facturacion/firma_pdf.py): certificado PKCS#12
+# por empresa en FIRMA_DIR (<NIT sin guiones>.p12) con contraseña FIRMA_CLAVE.
+# FIRMA_PDF_LTV=1 incrusta la información de validación (raíces en FIRMA_PDF_RAICES)
+FIRMA_PDF_ACTIVA = os.getenv('FIRMA_PDF_ACTIVA', '0') == '1'
+FIRMA_PDF_RAZON = os.getenv('FIRMA_PDF_RAZON', 'Documento tributario electrónico')
+FIRMA_PDF_LUGAR = os.getenv('FIRMA_PDF_LUGAR', 'El Salvador')
+FIRMA_PDF_RAICES = os.getenv('FIRMA_PDF_RAICES', '')
+FIRMA_PDF_LTV = os.getenv('FIRMA_PDF_LTV', '0') == '1'
+
+# Códigos QR de ver_dte (Modulos/Facturacion/qr.py): versión y máscara fijas,
+# SVG de QR_TAMANO px y LRU de QR_CACHE_TAMANO textos por proceso
+QR_VERSION = int(os.getenv('QR_VERSION', 6))
+QR_MASCARA = int(os.getenv('QR_MASCARA', 0))
+QR_TAMANO = int(os.getenv('QR_TAMANO', 120))
+QR_CACHE_TAMANO = int(os.getenv('QR_CACHE_TAMANO', 4096))
+
+# Caché en disco de PDFs renderizados (LRU por tamaño)
+PDF_CACHE_ACTIVO = os.getenv('PDF_CACHE_ACTIVO', '1') == '1'
+PDF_CACHE_DIR = Path(os.getenv('PDF_CACHE_DIR', BASE_DIR / 'media' / 'pdf_cache'))
+PDF_CACHE_MAX_MB = int(os.getenv('PDF_CACHE_MAX_MB', 256))
+
+# Pool de procesos WeasyPrint (0 = renderizar en el mismo proceso).
+# El pool es por proceso web: con gunicorn son workers x PDF_RENDER_PROCESOS
+# procesos de render en el host, por eso el valor por defecto es bajo.
+PDF_RENDER_PROCESOS = int(os.getenv('PDF_RENDER_PROCESOS', 1))
+PDF_RENDER_MAX_PENDIENTES = int(os.getenv('PDF_RENDER_MAX_PENDIENTES', PDF_RENDER_PROCESOS * 4))
+PDF_RENDER_ESPERA = float(os.getenv('PDF_RENDER_ESPERA', 30))
+
+# Máximo de documentos por petición a /dte/lote/
+LOTE_MAX_DOCUMENTOS = int(os.getenv('LOTE_MAX_DOCUMENTOS', 5000))
+
+# URL pública del sitio, usada como base_url al renderizar PDFs fuera de una petición
+SITIO_URL = os.getenv('SITIO_URL')
+
 # =====================================================
 # SEGURIDAD PARA RENDER
 # =====================================================
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from .models import Empresa, Cliente, Producto, DTE, DetalleDTE
-from .models import Perfil
+from .models import Perfil, TrabajoEmision, LoteContingencia
 
 @admin.register(Perfil)
 class PerfilAdmin(admin.ModelAdmin):
@@ -11,3 +11,15 @@ admin.site.register(Cliente)
 admin.site.register(Producto)
 admin.site.register(DTE)
 admin.site.register(DetalleDTE)
+
+
+@admin.register(TrabajoEmision)
+class TrabajoEmisionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'dte', 'motivo', 'estado', 'paso', 'intentos', 'actualizado')
+    list_filter = ('estado', 'motivo')
+
+
+@admin.register(LoteContingencia)
+class LoteContingenciaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'empresa', 'estado', 'documentos', 'procesados', 'rechazados', 'intentos', 'actualizado')
+    list_filter = ('estado',)
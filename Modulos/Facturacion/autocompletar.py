@@ -0,0 +1,110 @@
+# ======================================================
+# ⚡ AUTOCOMPLETAR DTE (buscador del menú de facturación)
+# ======================================================
+"""
+Sugerencias de DTE mientras se escribe.
+
+Solo se usan búsquedas por prefijo resueltas como rangos sobre índices
+B-tree (`col >= 'abc' AND col < 'abc\\U0010ffff'`), que SQLite y
+PostgreSQL recorren con el índice sin importar la collation de LIKE:
+
+1. `numero_control` (índice) que empieza con el texto; si el texto es
+   solo un número, también el DTE con ese correlativo en cada serie de la
+   empresa (búsqueda exacta por el mismo índice).
+2. NIT/DUI/NRC exacto del cliente, si el texto parece un documento.
+3. `Cliente.nombre_normalizado` que empieza con el texto; de cada uno de
+   esos clientes (máximo LIMITE) se leen solo sus DTE más recientes con el
+   índice (cliente, -fecha_emision) y se mezclan por fecha, sin ordenar
+   todos sus documentos.
+
+Todo se limita a la empresa activa (managers `por_empresa`). Cada
+consulta se guarda unos segundos en la caché de Django, por empresa, así las
+teclas repetidas y varios cajeros buscando lo mismo no tocan la base.
+Las filas son listas compactas (ver `COLUMNAS`), no diccionarios.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.timezone import localtime
+
+from .empresa_actual import ambito, empresa_actual
+from . import secuencias
+from .models import DTE, Cliente, Empresa, normalizar_texto, parece_documento
+
+MINIMO_CARACTERES = 2
+LIMITE = 10
+FIN_PREFIJO = '\U0010ffff'
+
+COLUMNAS = ('id', 'tipo_dte', 'numero_control', 'cliente', 'fecha', 'total', 'estado')
+_CAMPOS = ('id', 'tipo_dte', 'numero_control', 'cliente__nombre', 'fecha_emision', 'total', 'estado')
+_TIPOS = dict(DTE.TIPO_DTE_CHOICES)
+
+
+def _prefijo(campo, prefijo):
+    """Filtro "empieza con" expresado como rango para que use el índice."""
+    return Q(**{f'{campo}__gte': prefijo, f'{campo}__lt': prefijo + FIN_PREFIJO})
+
+
+def _fila(id_, tipo, numero, cliente, fecha, total, estado):
+    return [
+        id_, _TIPOS.get(tipo, tipo), numero, cliente,
+        localtime(fecha).strftime("%Y-%m-%d %H:%M"), f"{total:.2f}", estado,
+    ]
+
+
+def _consultar(texto):
+    dtes = DTE.por_empresa.values_list(*_CAMPOS)
+    vistos = set()
+    filas = []
+
+    def agregar(consulta):
+        for valores in consulta[:LIMITE - len(filas)]:
+            if valores[0] not in vistos:
+                vistos.add(valores[0])
+                filas.append(_fila(*valores))
+
+    # 1️⃣ Número de control (completo o solo el correlativo)
+    agregar(dtes.filter(_prefijo('numero_control', texto.upper())).order_by('numero_control'))
+    if len(filas) < LIMITE and texto.isascii() and texto.isdigit():
+        empresas = Empresa.objects.values('codigo_establecimiento', 'codigo_punto_venta').distinct()
+        if empresa_actual() is not None:
+            empresas = empresas.filter(id=empresa_actual())
+        numeros = secuencias.numeros_con_correlativo(empresas, int(texto))
+        agregar(dtes.filter(numero_control__in=numeros).order_by('-fecha_emision'))
+
+    # 2️⃣ Documento del cliente
+    if len(filas) < LIMITE and parece_documento(texto):
+        agregar(dtes.filter(cliente__in=Cliente.por_documento(texto)).order_by('-fecha_emision'))
+
+    # 3️⃣ Nombre del cliente
+    nombre = normalizar_texto(texto)
+    if len(filas) < LIMITE and nombre:
+        clientes = list(
+            Cliente.por_empresa.filter(_prefijo('nombre_normalizado', nombre))
+            .order_by('nombre_normalizado').values_list('id', flat=True)[:LIMITE]
+        )
+        if clientes:
+            faltan = LIMITE - len(filas)
+            recientes = []
+            for cliente_id in clientes:
+                recientes.extend(dtes.filter(cliente_id=cliente_id).order_by('-fecha_emision')[:faltan])
+            recientes.sort(key=lambda valores: valores[4], reverse=True)
+            agregar(recientes)
+
+    return filas
+
+
+def sugerencias(texto):
+    """Hasta LIMITE filas compactas (COLUMNAS) para el texto, con caché corta."""
+    texto = ' '.join((texto or '').split())
+    if len(texto) < MINIMO_CARACTERES:
+        return []
+
+    clave = f'autocompletar_dte:{ambito()}:' + hashlib.md5(texto.lower().encode('utf-8')).hexdigest()
+    filas = cache.get(clave)
+    if filas is None:
+        filas = _consultar(texto)
+        cache.set(clave, filas, settings.AUTOCOMPLETAR_CACHE_SEGUNDOS)
+    return filas
@@ -0,0 +1,282 @@
+# ======================================================
+# 🔎 BÚSQUEDA DE TEXTO COMPLETO
+# ======================================================
+"""
+Índice de búsqueda para clientes, proveedores, productos y DTE.
+
+- SQLite: tabla virtual FTS5 (`unicode61`, sin acentos, índices de prefijo).
+- PostgreSQL: tabla con `tsvector` generado + índice GIN, y trigramas
+  (`pg_trgm`) sobre el texto cuando la extensión está disponible.
+- Otros motores: se usan los filtros `icontains` de respaldo.
+
+Cada documento se guarda con rowid = id * 10 + código del tipo, así
+actualizar o borrar una entrada es una búsqueda por clave. El índice se
+mantiene con señales (signals.py); `manage.py reindexar_busqueda` lo
+reconstruye completo. Cada base de datos (también cada shard de empresa)
+tiene su propio índice: las funciones reciben el alias (`using`).
+"""
+import re
+
+from django.core.exceptions import EmptyResultSet
+from django.db import DEFAULT_DB_ALIAS, connections, transaction, DatabaseError
+from django.db.models.expressions import RawSQL
+
+TABLA = 'facturacion_busqueda'
+
+# tipo: (código, columnas de texto, columnas de documento (se indexan también solo dígitos))
+TIPOS = {
+    'cliente': (1, ('nombre', 'nit', 'dui', 'nrc'), ('nit', 'dui', 'nrc')),
+    'proveedor': (2, ('nombre', 'nit', 'nrc'), ('nit', 'nrc')),
+    'producto': (3, ('codigo', 'descripcion'), ()),
+    'dte': (4, ('numero_control', 'codigo_generacion'), ()),
+}
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def _motor(using=None):
+    vendor = connections[using or DEFAULT_DB_ALIAS].vendor
+    return vendor if vendor in ('sqlite', 'postgresql') else None
+
+
+def activo(using=None):
+    return _motor(using) is not None
+
+
+def _digitos(valor):
+    return ''.join(c for c in (valor or '') if c.isdigit())
+
+
+def texto_de(tipo, instancia):
+    """Texto indexado de una instancia (mismo contenido que genera `reconstruir`)."""
+    _, columnas, documentos = TIPOS[tipo]
+    partes = [getattr(instancia, c) or '' for c in columnas]
+    partes += [_digitos(getattr(instancia, c)) for c in documentos]
+    if tipo == 'dte':
+        partes.append(instancia.cliente.nombre if instancia.cliente_id else '')
+        partes.append(correlativo(instancia.numero_control))
+    return ' '.join(p for p in partes if p)
+
+
+def correlativo(numero_control):
+    """
+    Correlativo sin ceros a la izquierda (los 15 últimos caracteres del
+    formato MH), para que "15" encuentre DTE-01-M001P001-000000000000015.
+    """
+    return (numero_control or '')[-15:].lstrip('0')
+
+
+# ======================================================
+# 🏗️ CREACIÓN Y RECONSTRUCCIÓN (migración / comando)
+# ======================================================
+def crear_tabla(conexion):
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA} USING fts5("
+                "texto, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+            )
+        elif conexion.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLA} ("
+                " rowid bigint PRIMARY KEY,"
+                " texto text NOT NULL,"
+                " vector tsvector GENERATED ALWAYS AS (to_tsvector('simple', texto)) STORED)"
+            )
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {TABLA}_vector_idx ON {TABLA} USING gin (vector)")
+            try:
+                with transaction.atomic(using=conexion.alias), conexion.cursor() as extension:
+                    extension.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                    extension.execute(
+                        f"CREATE INDEX IF NOT EXISTS {TABLA}_trgm_idx ON {TABLA} USING gin (texto gin_trgm_ops)"
+                    )
+            except DatabaseError:
+                # Sin permisos para la extensión: ILIKE funciona igual, sin índice de trigramas
+                pass
+
+
+def eliminar_tabla(conexion):
+    with conexion.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLA}")
+
+
+def _expresion_texto(tipo, alias='t'):
+    """Concatenación SQL equivalente a `texto_de` (SQLite y PostgreSQL usan `||`)."""
+    _, columnas, documentos = TIPOS[tipo]
+    partes = [f"COALESCE({alias}.{c}, '')" for c in columnas]
+    partes += [f"REPLACE(REPLACE(COALESCE({alias}.{c}, ''), '-', ''), ' ', '')" for c in documentos]
+    if tipo == 'dte':
+        partes.append("COALESCE(c.nombre, '')")
+        # Igual que `correlativo` (substr con inicio <= 0 no es igual en SQLite y PostgreSQL)
+        numero = f"COALESCE({alias}.numero_control, '')"
+        partes.append(
+            f"LTRIM(CASE WHEN LENGTH({numero}) > 15 THEN SUBSTR({numero}, LENGTH({numero}) - 14) "
+            f"ELSE {numero} END, '0')"
+        )
+    return " || ' ' || ".join(partes)
+
+
+def _insertar_select(conexion, tipo, tablas, condicion='', parametros=()):
+    codigo = TIPOS[tipo][0]
+    desde = f"{tablas[tipo]} t"
+    if tipo == 'dte':
+        desde += f" LEFT JOIN {tablas['cliente']} c ON c.id = t.cliente_id"
+    sql = (
+        f"INSERT INTO {TABLA} (rowid, texto) "
+        f"SELECT t.id * 10 + {codigo}, {_expresion_texto(tipo)} FROM {desde} {condicion}"
+    )
+    with conexion.cursor() as cursor:
+        cursor.execute(sql, parametros)
+
+
+def _tablas():
+    from .models import Cliente, Proveedor, Producto, DTE
+    return tablas_de({'cliente': Cliente, 'proveedor': Proveedor, 'producto': Producto, 'dte': DTE})
+
+
+def tablas_de(modelos):
+    """Nombres de tabla (entre comillas) de los modelos de cada tipo."""
+    comillas = connections[DEFAULT_DB_ALIAS].ops.quote_name
+    return {tipo: comillas(m._meta.db_table) for tipo, m in modelos.items()}
+
+
+def reconstruir(tablas=None, using=None):
+    """Vacía el índice y lo vuelve a llenar con un INSERT ... SELECT por tipo."""
+    if not activo(using):
+        return
+    conexion = connections[using or DEFAULT_DB_ALIAS]
+    tablas = tablas or _tablas()
+    with conexion.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA}")
+    for tipo in TIPOS:
+        _insertar_select(conexion, tipo, tablas)
+
+
+# ======================================================
+# 🔄 SINCRONIZACIÓN (llamada desde signals.py)
+# ======================================================
+def _rowid(tipo, objeto_id):
+    return objeto_id * 10 + TIPOS[tipo][0]
+
+
+def _alias(instancia):
+    return instancia._state.db or DEFAULT_DB_ALIAS
+
+
+def indexar(tipo, instancia):
+    using = _alias(instancia)
+    if not activo(using):
+        return
+    rowid = _rowid(tipo, instancia.pk)
+    texto = texto_de(tipo, instancia)
+    with connections[using].cursor() as cursor:
+        if _motor(using) == 'sqlite':
+            cursor.execute(f"DELETE FROM {TABLA} WHERE rowid = %s", [rowid])
+            cursor.execute(f"INSERT INTO {TABLA} (rowid, texto) VALUES (%s, %s)", [rowid, texto])
+        else:
+            cursor.execute(
+                f"INSERT INTO {TABLA} (rowid, texto) VALUES (%s, %s) "
+                "ON CONFLICT (rowid) DO UPDATE SET texto = EXCLUDED.texto",
+                [rowid, texto],
+            )
+
+
+def indexar_lote(tipo, instancias):
+    """Indexa instancias creadas con bulk_create (que no disparan señales)."""
+    if not instancias or not activo(_alias(instancias[0])):
+        return
+    filas = [(_rowid(tipo, i.pk), texto_de(tipo, i)) for i in instancias]
+    with connections[_alias(instancias[0])].cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABLA} WHERE rowid = %s", [(r,) for r, _ in filas])
+        cursor.executemany(f"INSERT INTO {TABLA} (rowid, texto) VALUES (%s, %s)", filas)
+
+
+def quitar(tipo, objeto_id, using=None):
+    if not activo(using):
+        return
+    with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA} WHERE rowid = %s", [_rowid(tipo, objeto_id)])
+
+
+def reindexar_dtes_de_cliente(cliente_id, using=None):
+    """El nombre del cliente forma parte del texto de sus DTE."""
+    if not activo(using):
+        return
+    conexion = connections[using or DEFAULT_DB_ALIAS]
+    tablas = _tablas()
+    with conexion.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {TABLA} WHERE rowid IN (SELECT id * 10 + %s FROM {tablas['dte']} WHERE cliente_id = %s)",
+            [TIPOS['dte'][0], cliente_id],
+        )
+    _insertar_select(conexion, 'dte', tablas, 'WHERE t.cliente_id = %s', [cliente_id])
+
+
+# ======================================================
+# 🔍 CONSULTAS
+# ======================================================
+def _terminos(consulta):
+    return [t.lower() for t in _TOKEN.findall(consulta or '')][:8]
+
+
+def _subconsulta(tipo, terminos, consulta, using):
+    """SQL (ids del tipo que coinciden, con su puntaje) y parámetros."""
+    codigo = TIPOS[tipo][0]
+    if _motor(using) == 'sqlite':
+        expresion = ' AND '.join('"%s"*' % t.replace('"', '') for t in terminos)
+        return (
+            f"SELECT rowid / 10 AS id, bm25({TABLA}) AS puntaje FROM {TABLA} "
+            f"WHERE {TABLA} MATCH %s AND rowid %% 10 = {codigo}",
+            [expresion],
+        )
+    # PostgreSQL: prefijos con tsvector y, para fragmentos internos (p. ej. parte
+    # de un NIT), ILIKE apoyado en el índice de trigramas
+    expresion = ' & '.join(f"{t}:*" for t in terminos)
+    fragmento = '%' + consulta.strip().replace('\\', '').replace('%', '').replace('_', '') + '%'
+    return (
+        f"SELECT rowid / 10 AS id, -ts_rank(vector, to_tsquery('simple', %s)) AS puntaje FROM {TABLA} "
+        f"WHERE (vector @@ to_tsquery('simple', %s) OR texto ILIKE %s) AND rowid %% 10 = {codigo}",
+        [expresion, expresion, fragmento],
+    )
+
+
+def filtrar(queryset, tipo, consulta, respaldo):
+    """
+    Filtra el queryset por la búsqueda usando el índice.
+    `respaldo` (un Q con icontains) se usa si el motor no tiene índice.
+    """
+    terminos = _terminos(consulta)
+    if not terminos:
+        return queryset if not (consulta or '').strip() else queryset.filter(respaldo)
+    if not activo(queryset.db):
+        return queryset.filter(respaldo)
+    sql, parametros = _subconsulta(tipo, terminos, consulta, queryset.db)
+    return queryset.filter(pk__in=RawSQL(f"SELECT id FROM ({sql}) AS coincidencias", parametros))
+
+
+def buscar(queryset, tipo, consulta, respaldo, limite=10):
+    """Devuelve hasta `limite` instancias ordenadas por relevancia."""
+    terminos = _terminos(consulta)
+    if not terminos:
+        return []
+    if not activo(queryset.db):
+        return list(queryset.filter(respaldo)[:limite])
+
+    try:
+        filas, parametros_filas = queryset.order_by().values('pk').query.sql_with_params()
+    except EmptyResultSet:
+        # queryset.none(): p. ej. `por_empresa` sin empresa activa
+        return []
+    sql, parametros = _subconsulta(tipo, terminos, consulta, queryset.db)
+    # Los filtros del queryset (la empresa activa, entre otros) van en la misma
+    # consulta, antes del LIMIT: los mejores puntajes de otras empresas no
+    # desplazan a los de esta
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            f"SELECT id FROM ({sql}) AS coincidencias WHERE id IN ({filas}) ORDER BY puntaje LIMIT %s",
+            parametros + list(parametros_filas) + [limite],
+        )
+        ids = [fila[0] for fila in cursor.fetchall()]
+
+    encontrados = queryset.in_bulk(ids)
+    return [encontrados[i] for i in ids if i in encontrados]
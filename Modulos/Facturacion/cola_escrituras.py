@@ -0,0 +1,69 @@
+# ======================================================
+# ✍️ COLA DE ESCRITURAS (SQLite con varios hilos)
+# ======================================================
+"""
+SQLite admite un solo escritor a la vez. Con muchos hilos escribiendo, cada
+uno espera el bloqueo por su cuenta (busy_timeout) y los tiempos de
+respuesta se vuelven impredecibles.
+
+Con SQLITE_COLA_ESCRITURAS=1 las vistas marcadas con `@escritura_serializada`
+(registrar_venta, modal_dte, registrar_compra) ejecutan sus POST en un único
+hilo escritor por proceso, en orden de llegada y con su propia conexión.
+La petición espera su turno; si ya hay SQLITE_COLA_MAXIMO en espera se
+responde 503 para que el cliente reintente en lugar de acumular hilos.
+
+La cola es por proceso: entre workers de gunicorn sigue arbitrando el
+busy_timeout de SQLite (ver settings). Con PostgreSQL no hace falta.
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
+
+_escritor = None
+_candado = threading.Lock()
+_cupos = None
+
+
+def _iniciar():
+    global _escritor, _cupos
+    with _candado:
+        if _escritor is None:
+            _cupos = threading.BoundedSemaphore(settings.SQLITE_COLA_MAXIMO)
+            _escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='escritor-sqlite')
+    return _escritor
+
+
+def _en_escritor(vista, request, args, kwargs):
+    # Hilo largo sin request_started/finished: revisa la conexión en cada turno
+    close_old_connections()
+    try:
+        return vista(request, *args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def escritura_serializada(vista):
+    """Ejecuta los POST de la vista en el hilo escritor (si la cola está activa)."""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if not settings.SQLITE_COLA_ESCRITURAS or request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return vista(request, *args, **kwargs)
+
+        escritor = _iniciar()
+        if not _cupos.acquire(blocking=False):
+            return JsonResponse(
+                {'success': False, 'error': 'Servidor ocupado, intente de nuevo en unos segundos.'},
+                status=503, headers={'Retry-After': '2'},
+            )
+        try:
+            # El contexto lleva la empresa activa, el shard y la réplica de la petición
+            contexto = contextvars.copy_context()
+            return escritor.submit(contexto.run, _en_escritor, vista, request, args, kwargs).result()
+        finally:
+            _cupos.release()
+    return envoltura
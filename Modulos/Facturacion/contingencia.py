@@ -0,0 +1,203 @@
+# ======================================================
+# 🚨 CONTINGENCIA (transmisión en lote de DTE pendientes)
+# ======================================================
+"""
+Cuando el Ministerio no responde (o MH_CONTINGENCIA=1), el worker de
+emisión marca el DTE `estado_mh='Contingencia'` y termina el trabajo
+(JSON, PDF y correo) sin esperar: la emisión en caja no se detiene.
+
+`python manage.py transmitir_contingencia` drena esos documentos:
+
+1. Los agrupa por empresa en `LoteContingencia` de hasta MH_LOTE_TAMANO.
+   La asignación es condicional (solo DTE sin lote): dos procesos no
+   ponen el mismo documento en dos lotes.
+2. Envía MH_LOTE_CONCURRENCIA lotes a la vez por el cliente de mh.py
+   (pool, reintentos y circuito). Al salir de una caída primero va un
+   lote de prueba; si el circuito se abre, los lotes que faltan esperan a
+   la siguiente pasada sin insistir.
+3. Consulta el resultado de cada lote y lo concilia en el DTE:
+   `sello_recepcion` y `estado_mh` Procesado o Rechazado. Un lote sin
+   respuesta completa queda 'Enviado' y se vuelve a consultar después,
+   sin reenviarlo.
+"""
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import firma, mh, pdf_cache
+from .emision import asignar_codigo_generacion, documento_dte
+from .models import DTE, LoteContingencia
+
+
+# ======================================================
+# 📦 ARMAR LOTES
+# ======================================================
+def armar_lotes(tamano=None):
+    """Agrupa en lotes nuevos los DTE en contingencia que aún no tienen uno."""
+    tamano = tamano or settings.MH_LOTE_TAMANO
+    pendientes = (
+        DTE.objects.filter(estado_mh='Contingencia', lote_contingencia__isnull=True)
+        .order_by('empresa_id', 'id').values_list('empresa_id', 'id')
+    )
+    lotes = []
+    for empresa_id, filas in groupby(pendientes.iterator(), key=itemgetter(0)):
+        ids = [dte_id for _, dte_id in filas]
+        for inicio in range(0, len(ids), tamano):
+            grupo = ids[inicio:inicio + tamano]
+            with transaction.atomic(using=router.db_for_write(LoteContingencia)):
+                lote = LoteContingencia.objects.create(empresa_id=empresa_id)
+                lote.documentos = DTE.objects.filter(
+                    id__in=grupo, estado_mh='Contingencia', lote_contingencia__isnull=True,
+                ).update(lote_contingencia=lote)
+                if not lote.documentos:
+                    # Otro proceso ya los tomó
+                    lote.delete()
+                    continue
+                lote.save(update_fields=['documentos'])
+            lotes.append(lote)
+    return lotes
+
+
+# ======================================================
+# 📤 ENVIAR Y CONCILIAR UN LOTE
+# ======================================================
+def transmitir_lote(lote):
+    """Envía el lote (si no se envió antes), espera su resultado y lo concilia."""
+    cliente = mh.cliente()
+    dtes = list(lote.dtes.filter(estado_mh='Contingencia').select_related('empresa', 'cliente'))
+    if not dtes:
+        _cerrar(lote)
+        return lote
+
+    if not lote.codigo_lote:
+        for dte in dtes:
+            asignar_codigo_generacion(dte)
+        # Todo el lote se firma de una vez en el pool de firma
+        firmados = firma.firmar_lote(dtes[0].empresa, [documento_dte(dte) for dte in dtes])
+        documentos = [
+            {'codigoGeneracion': dte.codigo_generacion, 'tipoDte': dte.tipo_dte, 'documento': firmado}
+            for dte, firmado in zip(dtes, firmados)
+        ]
+        LoteContingencia.objects.filter(id=lote.id).update(intentos=F('intentos') + 1)
+        try:
+            lote.codigo_lote = cliente.enviar_lote(documentos, dtes[0].empresa.nit, lote.id)
+        except mh.DocumentoRechazado as e:
+            # Lote rechazado completo: sus documentos no se reenvían solos
+            DTE.objects.filter(id__in=[d.id for d in dtes]).update(estado_mh='Rechazado')
+            _invalidar_pdfs(dtes)
+            lote.estado, lote.rechazados, lote.error = 'Error', len(dtes), str(e)
+            lote.save(update_fields=['estado', 'rechazados', 'error', 'actualizado'])
+            return lote
+        lote.estado = 'Enviado'
+        lote.save(update_fields=['codigo_lote', 'estado', 'actualizado'])
+
+    resultado = _esperar_resultado(cliente, lote.codigo_lote, len(dtes))
+    conciliar(lote, dtes, resultado)
+    return lote
+
+
+def _esperar_resultado(cliente, codigo_lote, total):
+    """Consulta el lote hasta tener todos los documentos o agotar MH_LOTE_ESPERA."""
+    limite = time.monotonic() + settings.MH_LOTE_ESPERA
+    while True:
+        resultado = cliente.consultar_lote(codigo_lote)
+        listos = len(resultado.get('procesados') or []) + len(resultado.get('rechazados') or [])
+        if listos >= total or time.monotonic() >= limite:
+            return resultado
+        time.sleep(settings.MH_LOTE_CONSULTA_SEGUNDOS)
+
+
+def conciliar(lote, dtes, resultado):
+    """Aplica a cada DTE del lote su sello o su rechazo."""
+    por_codigo = {dte.codigo_generacion: dte for dte in dtes}
+    cambiados = []
+    for fila in resultado.get('procesados') or []:
+        dte = por_codigo.pop(fila.get('codigoGeneracion'), None)
+        if dte is not None:
+            dte.sello_recepcion = fila['selloRecibido']
+            dte.estado_mh = 'Procesado'
+            cambiados.append(dte)
+    for fila in resultado.get('rechazados') or []:
+        dte = por_codigo.pop(fila.get('codigoGeneracion'), None)
+        if dte is not None:
+            dte.estado_mh = 'Rechazado'
+            cambiados.append(dte)
+
+    with transaction.atomic(using=router.db_for_write(DTE)):
+        # Solo sello y estado_mh: no cambian el resumen ni el índice de búsqueda
+        DTE.objects.bulk_update(cambiados, ['sello_recepcion', 'estado_mh'], batch_size=500)
+        procesados = sum(1 for dte in cambiados if dte.estado_mh == 'Procesado')
+        LoteContingencia.objects.filter(id=lote.id).update(
+            procesados=F('procesados') + procesados,
+            rechazados=F('rechazados') + len(cambiados) - procesados,
+            estado='Enviado' if por_codigo else 'Completado',
+            error=None,
+            actualizado=timezone.now(),
+        )
+    # bulk_update no dispara post_save: el PDF en caché no tendría el sello
+    _invalidar_pdfs(cambiados)
+    lote.refresh_from_db()
+
+
+def _cerrar(lote):
+    lote.estado = 'Completado'
+    lote.save(update_fields=['estado', 'actualizado'])
+
+
+def _invalidar_pdfs(dtes):
+    for dte in dtes:
+        pdf_cache.invalidar_dte(dte.id)
+
+
+# ======================================================
+# 🚰 DRENAR LA CONTINGENCIA
+# ======================================================
+def _intentar(lote):
+    try:
+        return transmitir_lote(lote)
+    except mh.ErrorMH as e:
+        # Ministerio caído otra vez: el lote sigue pendiente para la próxima pasada
+        LoteContingencia.objects.filter(id=lote.id).update(error=str(e), actualizado=timezone.now())
+        lote.error = str(e)
+        return lote
+
+
+def _en_hilo(lote):
+    try:
+        return _intentar(lote)
+    finally:
+        # Conexiones propias de este hilo
+        connections.close_all()
+
+
+def drenar(hilos=None):
+    """
+    Arma lotes con los DTE en contingencia y transmite todos los lotes
+    pendientes, `hilos` a la vez. Devuelve los lotes procesados.
+    """
+    if mh.cliente() is None:
+        raise mh.ErrorMH("Sin MH_URL no hay a dónde transmitir la contingencia.", reintentable=False)
+    armar_lotes()
+    lotes = list(LoteContingencia.objects.filter(estado__in=['Pendiente', 'Enviado']).order_by('id'))
+    if not lotes:
+        return []
+
+    procesados = []
+    if mh.cliente().circuito.estado != 'cerrado':
+        # Saliendo de una caída: un lote de prueba antes de abrir todos los hilos
+        procesados.append(_intentar(lotes.pop(0)))
+        if not lotes or mh.cliente().circuito.estado != 'cerrado':
+            return procesados + lotes
+
+    hilos = hilos or settings.MH_LOTE_CONCURRENCIA
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='contingencia') as pool:
+        # Cada hilo con su copia del contexto (empresa y shard activos)
+        futuros = [pool.submit(contextvars.copy_context().run, _en_hilo, lote) for lote in lotes]
+        return procesados + [futuro.result() for futuro in futuros]
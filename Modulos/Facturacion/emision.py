@@ -0,0 +1,343 @@
+# ======================================================
+# 📤 EMISIÓN DE DTE (cola persistente en base de datos)
+# ======================================================
+"""
+Pipeline de emisión de DTE fuera del ciclo de la petición HTTP.
+
+Las vistas solo encolan un `TrabajoEmision`; el comando
+`python manage.py procesar_emisiones` reclama los trabajos y ejecuta:
+paso MH → JSON → PDF → correo al cliente.
+Si el Ministerio no responde el DTE queda en contingencia y el trabajo
+sigue; `transmitir_contingencia` lo envía después en lote (contingencia.py).
+"""
+import os
+import json
+import time
+import base64
+import random
+import re
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import TrabajoEmision
+from . import firma, firma_pdf, mh, pdf_cache, qr, renderizador
+
+
+# ======================================================
+# 🧾 ENCOLAR Y CONSULTAR
+# ======================================================
+def encolar_emision(dte, usuario=None, motivo='Emision'):
+    """Crea el trabajo de emisión y lo deja disponible para el worker."""
+    if motivo == 'Actualizacion':
+        # El documento cambió: se transmite de nuevo con otro código de generación
+        dte.codigo_generacion = dte.sello_recepcion = None
+        dte.estado_mh = 'Pendiente'
+        dte.save(update_fields=['codigo_generacion', 'sello_recepcion', 'estado_mh'])
+    return TrabajoEmision.objects.create(dte=dte, usuario=usuario, motivo=motivo)
+
+
+def estado_trabajo(trabajo):
+    """Resumen serializable del avance de un trabajo."""
+    dte = trabajo.dte
+    return {
+        "id": trabajo.id,
+        "estado": trabajo.estado,
+        "paso": trabajo.paso,
+        "intentos": trabajo.intentos,
+        "error": trabajo.error,
+        "dte_id": dte.id,
+        "numero_control": dte.numero_control,
+        "codigo_generacion": dte.codigo_generacion,
+        "sello_recepcion": dte.sello_recepcion,
+        "estado_mh": dte.estado_mh,
+    }
+
+
+# ======================================================
+# ⚙️ RECLAMAR TRABAJOS (varios workers en paralelo)
+# ======================================================
+def tomar_siguiente_trabajo():
+    """
+    Reclama el siguiente trabajo pendiente.
+    La actualización condicional sobre `estado` garantiza que dos workers
+    nunca procesen el mismo trabajo, también en SQLite (sin SELECT FOR UPDATE).
+    """
+    ahora = timezone.now()
+    candidatos = list(
+        TrabajoEmision.objects
+        .filter(estado='Pendiente', disponible_desde__lte=ahora)
+        .order_by('id')
+        .values_list('id', flat=True)[:10]
+    )
+    for trabajo_id in candidatos:
+        reclamado = TrabajoEmision.objects.filter(id=trabajo_id, estado='Pendiente').update(
+            estado='Procesando',
+            paso='Iniciando',
+            intentos=F('intentos') + 1,
+            actualizado=ahora,
+        )
+        if reclamado:
+            return (
+                TrabajoEmision.objects
+                .select_related('dte__cliente', 'dte__empresa')
+                .get(id=trabajo_id)
+            )
+    return None
+
+
+def liberar_trabajos_colgados(minutos=10):
+    """Devuelve a la cola los trabajos de un worker que murió a mitad de proceso."""
+    limite = timezone.now() - timedelta(minutes=minutos)
+    return TrabajoEmision.objects.filter(estado='Procesando', actualizado__lt=limite).update(
+        estado='Pendiente',
+        paso='Reencolado',
+        actualizado=timezone.now(),
+    )
+
+
+def _avanzar(trabajo, paso):
+    trabajo.paso = paso
+    TrabajoEmision.objects.filter(id=trabajo.id).update(paso=paso, actualizado=timezone.now())
+
+
+# ======================================================
+# 🔁 PROCESAR UN TRABAJO
+# ======================================================
+def procesar_trabajo(trabajo):
+    """Ejecuta todos los pasos de la emisión y registra el resultado."""
+    dte = trabajo.dte
+    try:
+        final = 'Completado'
+        if dte.estado_mh in ('Pendiente', 'Rechazado'):
+            # Un reintento después de la aprobación no vuelve a transmitir
+            _avanzar(trabajo, 'Transmitiendo al Ministerio de Hacienda')
+            try:
+                transmitir_a_hacienda(dte)
+            except mh.ErrorMH as e:
+                if not e.reintentable:
+                    raise
+                # Ministerio caído o lento: el comprobante sigue su curso y se
+                # transmite después en lote (transmitir_contingencia)
+                marcar_contingencia(dte)
+                final = 'Completado en contingencia'
+                print(f"⚠️ DTE {dte.numero_control} en contingencia: {e}")
+
+        _avanzar(trabajo, 'Generando JSON')
+        contenido_json = generar_json_dte(dte)
+        # Deja el QR listo para ver_dte
+        qr.guardar(dte)
+
+        _avanzar(trabajo, 'Generando PDF')
+        contenido_pdf = generar_pdf_dte(dte)
+
+        if dte.cliente and dte.cliente.correo:
+            _avanzar(trabajo, 'Enviando correo')
+            enviar_comprobante(dte, contenido_pdf, contenido_json, trabajo.motivo)
+
+        TrabajoEmision.objects.filter(id=trabajo.id).update(
+            estado='Completado', paso=final, error=None, actualizado=timezone.now()
+        )
+        trabajo.estado = 'Completado'
+
+    except Exception as e:
+        max_intentos = getattr(settings, 'EMISION_MAX_INTENTOS', 3)
+        if trabajo.intentos < max_intentos and getattr(e, 'reintentable', True):
+            # Backoff exponencial con jitter antes del siguiente intento
+            espera = (2 ** trabajo.intentos) * 5 + random.uniform(0, 5)
+            estado = 'Pendiente'
+            disponible = timezone.now() + timedelta(seconds=espera)
+        else:
+            estado = 'Error'
+            disponible = timezone.now()
+
+        TrabajoEmision.objects.filter(id=trabajo.id).update(
+            estado=estado,
+            error=str(e),
+            disponible_desde=disponible,
+            actualizado=timezone.now(),
+        )
+        trabajo.estado = estado
+        print(f"❌ Error en trabajo de emisión {trabajo.id}: {e}")
+
+    return trabajo
+
+
+# ======================================================
+# 🏛️ PASO MH (cliente en mh.py)
+# ======================================================
+_UUID = re.compile(r'^[0-9A-F]{8}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{12}$')
+
+
+def asignar_codigo_generacion(dte):
+    """
+    Código de generación (UUID) fijado antes de enviar: los reintentos y el
+    envío en lote repiten el mismo y el Ministerio no duplica el documento.
+    """
+    if not dte.codigo_generacion or not _UUID.match(dte.codigo_generacion):
+        dte.codigo_generacion = str(uuid.uuid4()).upper()
+        dte.save(update_fields=['codigo_generacion'])
+
+
+def transmitir_a_hacienda(dte):
+    """
+    Transmite el DTE al Ministerio y guarda el código de generación y el
+    sello de recepción que devuelve. Sin MH_URL la aprobación se simula.
+    Con MH_CONTINGENCIA=1 no se intenta (CircuitoAbierto): queda para el lote.
+    """
+    asignar_codigo_generacion(dte)
+
+    if settings.MH_CONTINGENCIA:
+        raise mh.CircuitoAbierto(0)
+    cliente = mh.cliente()
+    if cliente is None:
+        time.sleep(getattr(settings, 'MH_SIMULACION_SEGUNDOS', 2))
+        sello = f"{timezone.now():%Y}{uuid.uuid4().hex.upper()}"
+    else:
+        try:
+            documento = firma.firmar_documento(dte.empresa, documento_dte(dte))
+            respuesta = cliente.transmitir(documento, dte.tipo_dte, dte.codigo_generacion)
+        except mh.DocumentoRechazado:
+            dte.estado_mh = 'Rechazado'
+            dte.save(update_fields=['estado_mh'])
+            raise
+        dte.codigo_generacion = respuesta.get('codigoGeneracion') or dte.codigo_generacion
+        sello = respuesta['selloRecibido']
+
+    dte.sello_recepcion = sello
+    dte.estado_mh = 'Procesado'
+    dte.save(update_fields=['codigo_generacion', 'sello_recepcion', 'estado_mh'])
+
+
+def marcar_contingencia(dte):
+    """El DTE queda pendiente de transmitir en un lote de contingencia."""
+    dte.estado_mh = 'Contingencia'
+    dte.save(update_fields=['estado_mh'])
+
+
+# ======================================================
+# 📄 JSON Y PDF DEL COMPROBANTE
+# ======================================================
+def documento_dte(dte):
+    """Datos del comprobante (lo que se transmite y se adjunta como JSON)."""
+    return {
+        "tipo_dte": dte.tipo_dte,
+        "numero_control": dte.numero_control,
+        "cliente": dte.cliente.nombre if dte.cliente else "Sin cliente",
+        "correo": dte.cliente.correo if dte.cliente else "",
+        "fecha_emision": dte.fecha_emision.strftime("%Y-%m-%d"),
+        "total": float(dte.total),
+        "codigo_generacion": dte.codigo_generacion,
+        "sello_recepcion": dte.sello_recepcion,
+    }
+
+
+def generar_json_dte(dte):
+    """Devuelve el JSON del comprobante en bytes (sin archivos temporales)."""
+    return json.dumps(documento_dte(dte), ensure_ascii=False, indent=4).encode('utf-8')
+
+
+def generar_pdf_dte(dte):
+    """
+    Devuelve los bytes del PDF del comprobante.
+    Si el DTE y sus datos no cambiaron se lee de la caché en disco;
+    si no, se renderiza (y se firma, si corresponde) en el pool de
+    procesos WeasyPrint.
+    """
+    plantilla = renderizador.plantilla_dte(dte.tipo_dte)
+    css_path = renderizador.ruta_css(dte.tipo_dte)
+    parametros_firma = firma_pdf.parametros(dte.empresa)
+    # El certificado forma parte de la clave: firmado y sin firmar no se mezclan
+    extra = {k: v for k, v in parametros_firma.items() if k != 'clave'} if parametros_firma else None
+    return pdf_cache.obtener_pdf(
+        dte, plantilla, css_path,
+        generar=lambda: _renderizar_pdf(dte, plantilla, parametros_firma),
+        extra=extra,
+    )
+
+
+def html_comprobante(dte, plantilla):
+    """HTML de impresión del comprobante: solo datos del DTE, sin request ni formulario."""
+    return render_to_string(plantilla, {
+        "dte": dte,
+        "empresa": dte.empresa,
+        "cliente": dte.cliente,
+        "editable": False,
+        "qr_data": None,
+    })
+
+
+def _renderizar_pdf(dte, plantilla, parametros_firma=None):
+    """Renderiza el HTML del comprobante y lo pasa al pool de WeasyPrint."""
+    html_content = html_comprobante(dte, plantilla)
+    return renderizador.renderizar(
+        html_content, dte.tipo_dte, base_url=getattr(settings, 'SITIO_URL', None), firma=parametros_firma,
+    )
+
+
+# ======================================================
+# 📧 ENVÍO DE CORREO (SendGrid API)
+# ======================================================
+_cliente_sendgrid = None
+
+
+def _sendgrid():
+    """Cliente SendGrid reutilizado por todo el proceso del worker."""
+    global _cliente_sendgrid
+    if _cliente_sendgrid is None:
+        import sendgrid
+        _cliente_sendgrid = sendgrid.SendGridAPIClient(api_key=os.environ.get("SENDGRID_API_KEY"))
+    return _cliente_sendgrid
+
+
+def enviar_comprobante(dte, contenido_pdf, contenido_json, motivo='Emision'):
+    """Envía al cliente el comprobante con los adjuntos PDF y JSON."""
+    from sendgrid.helpers.mail import (
+        Mail, Email, To, Content, Attachment, FileContent, FileName, FileType, Disposition
+    )
+
+    cliente = dte.cliente
+    if motivo == 'Actualizacion':
+        from_email = Email("facturacion@omnigest.com", "OMNIGEST Facturación Electrónica")
+        subject = "📄 DTE Actualizado y Aprobado - OMNIGEST"
+        texto = (
+            f"Estimado {cliente.nombre},\n\n"
+            "Su documento electrónico ha sido actualizado y aprobado "
+            "por el Ministerio de Hacienda.\n\n"
+            "Adjunto encontrará su comprobante actualizado en PDF y JSON.\n\n"
+            "Saludos,\nEquipo OMNIGEST"
+        )
+    else:
+        from_email = Email("manuelito2327@gmail.com", "OMNIGEST Facturación Electrónica")
+        subject = "📄 Comprobante Electrónico Aprobado - OMNIGEST"
+        texto = (
+            f"Estimado {cliente.nombre},\n\n"
+            f"Su documento electrónico tipo {dte.get_tipo_dte_display()} ha sido aprobado "
+            "por el Ministerio de Hacienda.\n\n"
+            "Adjunto encontrará su comprobante en formato PDF y JSON.\n\n"
+            "Saludos cordiales,\nEquipo OMNIGEST"
+        )
+
+    mail = Mail(from_email, To(cliente.correo), subject, Content("text/plain", texto))
+
+    # 📎 Adjuntar PDF y JSON
+    mail.add_attachment(Attachment(
+        FileContent(base64.b64encode(contenido_pdf).decode()),
+        FileName(f"DTE_{dte.numero_control}.pdf"),
+        FileType("application/pdf"),
+        Disposition("attachment"),
+    ))
+    mail.add_attachment(Attachment(
+        FileContent(base64.b64encode(contenido_json).decode()),
+        FileName(f"DTE_{dte.numero_control}.json"),
+        FileType("application/json"),
+        Disposition("attachment"),
+    ))
+
+    response = _sendgrid().client.mail.send.post(request_body=mail.get())
+    if response.status_code not in [200, 202]:
+        raise RuntimeError(f"Error SendGrid: {response.status_code} -> {response.body}")
@@ -0,0 +1,80 @@
+# ======================================================
+# 🏢 EMPRESA ACTUAL (multi-empresa)
+# ======================================================
+"""
+Empresa de la petición en curso (y la base de datos donde viven sus
+datos, si usa un shard), guardadas en ContextVars.
+
+ContextoUsuarioMiddleware la activa con `request.tenant` y la desactiva
+al terminar la respuesta. Los managers `por_empresa` de los modelos
+filtran por ella, así cada empresa solo recorre su rango de los índices
+(empresa, ...).
+
+Sin empresa activa los managers no devuelven nada, salvo que se pidan
+explícitamente todas las empresas (`todas=True`): el middleware lo hace
+solo para el superusuario y el Administrador sin empresa. Los comandos y
+el worker de emisión usan `objects`, que nunca filtra.
+
+Con shards (shards.py) el router envía las consultas de los modelos de
+empresa a `base_datos_actual()`.
+
+Para código fuera de una petición (comandos, tareas):
+
+    with usar_empresa(empresa.id, empresa.base_datos):
+        Cliente.por_empresa.all()
+
+    with usar_empresa(None, todas=True):
+        Cliente.por_empresa.all()   # todas las empresas
+
+Las respuestas en streaming se consumen después del middleware: deben
+resolver sus querysets (o recibir `empresa_id`) dentro de la vista.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_empresa_id = ContextVar('empresa_id', default=None)
+_base_datos = ContextVar('base_datos', default=None)
+_todas = ContextVar('todas_las_empresas', default=False)
+
+
+def empresa_actual():
+    """Id de la empresa activa o None."""
+    return _empresa_id.get()
+
+
+def todas_las_empresas():
+    """True si, sin empresa activa, se pidió ver todas las empresas."""
+    return _empresa_id.get() is None and _todas.get()
+
+
+def ambito():
+    """Alcance activo como texto para claves de caché: id de la empresa, 'todas' o 'ninguna'."""
+    empresa_id = _empresa_id.get()
+    if empresa_id is not None:
+        return str(empresa_id)
+    return 'todas' if _todas.get() else 'ninguna'
+
+
+def base_datos_actual():
+    """Alias de DATABASES de la empresa activa, o None (base principal)."""
+    return _base_datos.get()
+
+
+def activar(empresa_id, base_datos=None, todas=False):
+    """Activa la empresa (o todas, sin empresa) y devuelve los tokens para `desactivar`."""
+    return _empresa_id.set(empresa_id), _base_datos.set(base_datos or None), _todas.set(todas)
+
+
+def desactivar(tokens):
+    _empresa_id.reset(tokens[0])
+    _base_datos.reset(tokens[1])
+    _todas.reset(tokens[2])
+
+
+@contextmanager
+def usar_empresa(empresa_id, base_datos=None, todas=False):
+    tokens = activar(empresa_id, base_datos, todas)
+    try:
+        yield
+    finally:
+        desactivar(tokens)
@@ -0,0 +1,258 @@
+# ======================================================
+# 📦 EXISTENCIAS (movimientos de inventario en lote)
+# ======================================================
+"""
+Aplicación masiva de movimientos de inventario.
+
+Las entradas y salidas se agrupan por producto y se aplican con un
+UPDATE ... CASE por cada bloque de productos, validando las existencias
+en la misma sentencia; las filas de `Inventario` se insertan con
+`bulk_create`. Todo ocurre en una transacción: si un producto no tiene
+stock suficiente no se aplica ningún movimiento. Los productos deben ser
+de la empresa activa (`Producto.por_empresa`); si alguno no lo es, no
+se aplica nada y se lanza ProductosDesconocidos.
+
+Además mantiene puntos de control diarios (`CierreInventario`) para que
+las consultas de existencia a una fecha lean un cierre más los pocos
+movimientos posteriores, en lugar de recorrer todo el kardex.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import router, transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils.timezone import localdate
+
+from .models import CierreInventario, Inventario, Producto, StockInsuficiente
+
+
+BLOQUE_PRODUCTOS = 500
+
+
+class ProductosDesconocidos(Exception):
+    """Movimientos de productos inexistentes o de otra empresa."""
+
+    def __init__(self, productos):
+        super().__init__(f"Productos inexistentes o de otra empresa: {productos}")
+        self.productos = productos
+
+
+def _normalizar(movimiento):
+    """Acepta instancias de Inventario o dicts {producto_id, tipo, cantidad, descripcion}."""
+    if isinstance(movimiento, Inventario):
+        fila = movimiento
+    else:
+        fila = Inventario(
+            producto_id=movimiento.get('producto_id'),
+            tipo=movimiento.get('tipo'),
+            cantidad=movimiento.get('cantidad'),
+            descripcion=movimiento.get('descripcion'),
+        )
+
+    if fila.tipo not in ('Entrada', 'Salida'):
+        raise ValueError(f"Tipo de movimiento no válido: {fila.tipo}")
+    try:
+        fila.producto_id = int(fila.producto_id)
+    except (TypeError, ValueError):
+        raise ValueError(f"Producto no válido: {fila.producto_id}")
+    fila.cantidad = int(fila.cantidad)
+    if fila.cantidad <= 0:
+        raise ValueError("La cantidad del movimiento debe ser mayor que cero.")
+    return fila
+
+
+def registrar_movimientos(movimientos, validar_stock=True):
+    """
+    Registra una lista de movimientos Entrada/Salida sobre muchos productos.
+    Devuelve {producto_id: cambio_neto}. Lanza ProductosDesconocidos si algún
+    producto no es de la empresa activa y StockInsuficiente con la lista de
+    productos sin existencias si alguna salida neta no se puede cubrir.
+    """
+    filas = [_normalizar(m) for m in movimientos]
+    netos = defaultdict(int)
+    for fila in filas:
+        netos[fila.producto_id] += fila.delta()
+
+    ids = list(netos)
+    conocidos = set()
+    for i in range(0, len(ids), BLOQUE_PRODUCTOS):
+        conocidos.update(Producto.por_empresa.filter(pk__in=ids[i:i + BLOQUE_PRODUCTOS]).values_list('id', flat=True))
+    if len(conocidos) != len(ids):
+        raise ProductosDesconocidos(sorted(set(ids) - conocidos))
+
+    try:
+        with transaction.atomic(using=router.db_for_write(Inventario)):
+            for i in range(0, len(ids), BLOQUE_PRODUCTOS):
+                _aplicar_bloque({pid: netos[pid] for pid in ids[i:i + BLOQUE_PRODUCTOS]}, validar_stock)
+            Inventario.objects.bulk_create(filas, batch_size=1000)
+    except StockInsuficiente:
+        sin_stock = [
+            pid for pid, existencia in
+            Producto.objects.filter(pk__in=[p for p, n in netos.items() if n < 0])
+            .values_list('id', 'inventario')
+            if existencia + netos[pid] < 0
+        ]
+        raise StockInsuficiente("Stock insuficiente para uno o más productos.", productos=sin_stock)
+
+    return dict(netos)
+
+
+def _aplicar_bloque(netos, validar_stock):
+    cambios = [When(pk=pid, then=Value(neto)) for pid, neto in netos.items()]
+    delta = Case(*cambios, default=Value(0), output_field=IntegerField())
+
+    productos = Producto.objects.filter(pk__in=list(netos))
+    if validar_stock:
+        salidas = {pid: neto for pid, neto in netos.items() if neto < 0}
+        if salidas:
+            minimo = Case(
+                *[When(pk=pid, then=Value(-neto)) for pid, neto in salidas.items()],
+                default=Value(0), output_field=IntegerField(),
+            )
+            productos = productos.filter(~Q(pk__in=list(salidas)) | Q(inventario__gte=minimo))
+
+    actualizados = productos.update(inventario=F('inventario') + delta)
+    if validar_stock and actualizados != len(netos):
+        raise StockInsuficiente("Stock insuficiente para uno o más productos.")
+
+
+# ======================================================
+# 📅 CIERRES DIARIOS (puntos de control del kardex)
+# ======================================================
+DIAS_POR_BLOQUE = 31
+
+ENTRADAS = Sum(Case(When(tipo='Entrada', then=F('cantidad')), default=Value(0), output_field=IntegerField()))
+SALIDAS = Sum(Case(When(tipo='Salida', then=F('cantidad')), default=Value(0), output_field=IntegerField()))
+NETO = Sum(Case(
+    When(tipo='Entrada', then=F('cantidad')),
+    When(tipo='Salida', then=-F('cantidad')),
+    default=Value(0), output_field=IntegerField(),
+))
+
+
+def cerrar_inventario(hasta=None):
+    """
+    Genera los cierres diarios pendientes hasta `hasta` (por defecto ayer).
+    Es incremental: continúa desde el último día cerrado y solo escribe
+    filas para los productos con movimientos en cada día.
+    Devuelve la cantidad de cierres creados.
+    """
+    hasta = hasta or localdate() - timedelta(days=1)
+    ultimo = CierreInventario.objects.order_by('-fecha').values_list('fecha', flat=True).first()
+    if ultimo:
+        desde = ultimo + timedelta(days=1)
+    else:
+        desde = Inventario.objects.order_by('fecha').values_list('fecha', flat=True).first()
+    if not desde or desde > hasta:
+        return 0
+
+    creados = 0
+    while desde <= hasta:
+        fin = min(desde + timedelta(days=DIAS_POR_BLOQUE - 1), hasta)
+        creados += _cerrar_rango(desde, fin)
+        desde = fin + timedelta(days=1)
+    return creados
+
+
+def _cerrar_rango(desde, hasta):
+    movimientos = list(
+        Inventario.objects
+        .filter(fecha__gte=desde, fecha__lte=hasta)
+        .values('producto_id', 'fecha')
+        .annotate(entradas=ENTRADAS, salidas=SALIDAS)
+        .order_by('fecha', 'producto_id')
+    )
+    if not movimientos:
+        return 0
+
+    # Saldo de partida: último cierre anterior al rango de cada producto
+    ids = {m['producto_id'] for m in movimientos}
+    saldos = dict(
+        Producto.objects.filter(pk__in=ids).annotate(
+            saldo_previo=Coalesce(Subquery(
+                CierreInventario.objects
+                .filter(producto=OuterRef('pk'), fecha__lt=desde)
+                .order_by('-fecha').values('saldo')[:1]
+            ), Value(0))
+        ).values_list('id', 'saldo_previo')
+    )
+
+    cierres = []
+    for m in movimientos:
+        saldo = saldos[m['producto_id']] + m['entradas'] - m['salidas']
+        saldos[m['producto_id']] = saldo
+        cierres.append(CierreInventario(
+            producto_id=m['producto_id'],
+            fecha=m['fecha'],
+            entradas=m['entradas'],
+            salidas=m['salidas'],
+            saldo=saldo,
+        ))
+
+    with transaction.atomic(using=router.db_for_write(CierreInventario)):
+        CierreInventario.objects.bulk_create(cierres, batch_size=1000, ignore_conflicts=True)
+    return len(cierres)
+
+
+# ======================================================
+# 🔎 CONSULTAS A UNA FECHA
+# ======================================================
+def existencia_a_fecha(producto_id, fecha):
+    """Existencia de un producto al cierre de `fecha` (un cierre + movimientos posteriores)."""
+    cierre = (
+        CierreInventario.objects
+        .filter(producto_id=producto_id, fecha__lte=fecha)
+        .order_by('-fecha').values_list('fecha', 'saldo').first()
+    )
+    movimientos = Inventario.objects.filter(producto_id=producto_id, fecha__lte=fecha)
+    saldo = 0
+    if cierre:
+        movimientos = movimientos.filter(fecha__gt=cierre[0])
+        saldo = cierre[1]
+    return saldo + (movimientos.aggregate(neto=NETO)['neto'] or 0)
+
+
+def existencias_a_fecha(fecha, productos=None):
+    """
+    Existencia de muchos productos a una fecha en una sola consulta.
+    Devuelve el queryset de productos anotado con `existencia`.
+    """
+    cierre = (
+        CierreInventario.objects
+        .filter(producto=OuterRef('pk'), fecha__lte=fecha)
+        .order_by('-fecha')
+    )
+    posteriores = (
+        Inventario.objects
+        .filter(producto=OuterRef('pk'), fecha__lte=fecha, fecha__gt=OuterRef('fecha_cierre'))
+        .values('producto')
+        .annotate(neto=NETO)
+        .values('neto')
+    )
+    productos = productos if productos is not None else Producto.objects.all()
+    return productos.annotate(
+        fecha_cierre=Coalesce(Subquery(cierre.values('fecha')[:1]), Value(date(1900, 1, 1))),
+        saldo_cierre=Coalesce(Subquery(cierre.values('saldo')[:1]), Value(0)),
+    ).annotate(
+        existencia=F('saldo_cierre') + Coalesce(Subquery(posteriores), Value(0)),
+    )
+
+
+def movimientos_rango(producto_id, desde, hasta):
+    """
+    Kardex de un producto entre dos fechas:
+    saldo inicial, movimientos del rango y saldo final.
+    """
+    saldo_inicial = existencia_a_fecha(producto_id, desde - timedelta(days=1))
+    movimientos = (
+        Inventario.objects
+        .filter(producto_id=producto_id, fecha__gte=desde, fecha__lte=hasta)
+        .order_by('fecha', 'id')
+    )
+    neto = movimientos.aggregate(neto=NETO)['neto'] or 0
+    return {
+        "saldo_inicial": saldo_inicial,
+        "movimientos": movimientos,
+        "saldo_final": saldo_inicial + neto,
+    }
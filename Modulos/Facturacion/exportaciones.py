@@ -0,0 +1,254 @@
+# ======================================================
+# 📤 EXPORTACIONES (Excel y anexos CSV en modo streaming)
+# ======================================================
+"""
+Exportación de libros a Excel y a los anexos CSV del F07 con memoria constante.
+
+Las filas se leen del queryset por bloques (`iterator(chunk_size=...)`,
+cursor del lado del servidor en PostgreSQL) y se escriben con el modo
+write-only de openpyxl. Los estilos y anchos de columna se definen una
+sola vez, sin recorrer después las celdas. El archivo se arma en un
+temporal y se envía al cliente por bloques con `FileResponse`
+(una `StreamingHttpResponse`).
+
+Los anexos CSV se generan fila por fila directamente en una
+`StreamingHttpResponse`, sin archivo intermedio. Como esas filas se leen
+después de que el middleware desactiva la empresa de la petición, la
+empresa se pasa explícitamente (`empresa_id`).
+"""
+import csv
+import tempfile
+from datetime import datetime, time, timedelta
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.timezone import localtime, make_aware
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+from .models import Compra, DTE
+
+TIPO_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+BLOQUE_FILAS = 2000
+
+# 🎨 Estilos precalculados (se comparten entre todas las celdas)
+_borde = Border(
+    left=Side(style="thin"),
+    right=Side(style="thin"),
+    top=Side(style="thin"),
+    bottom=Side(style="thin"),
+)
+_centrado = Alignment(horizontal="center", vertical="center", wrap_text=True)
+_fuente_encabezado = Font(bold=True, color="000000")
+_relleno_encabezado = PatternFill(start_color="B7DEE8", end_color="B7DEE8", fill_type="solid")
+
+
+def _celda(hoja, valor, encabezado=False, formato=None):
+    celda = WriteOnlyCell(hoja, value=valor)
+    celda.border = _borde
+    celda.alignment = _centrado
+    if encabezado:
+        celda.font = _fuente_encabezado
+        celda.fill = _relleno_encabezado
+    elif formato:
+        celda.number_format = formato
+    return celda
+
+
+def escribir_excel(titulo, columnas, filas):
+    """
+    Escribe un libro de una hoja y devuelve el archivo temporal (abierto, al inicio).
+    `columnas`: lista de (encabezado, ancho, formato_numérico | None).
+    `filas`: iterable de listas de valores; puede ser un generador.
+    """
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet(title=titulo)
+
+    for indice, (_, ancho, _) in enumerate(columnas, start=1):
+        hoja.column_dimensions[get_column_letter(indice)].width = ancho
+
+    hoja.append([_celda(hoja, encabezado, encabezado=True) for encabezado, _, _ in columnas])
+    formatos = [formato for _, _, formato in columnas]
+    for fila in filas:
+        hoja.append([_celda(hoja, valor, formato=formato) for valor, formato in zip(fila, formatos)])
+
+    archivo = tempfile.TemporaryFile()
+    libro.save(archivo)
+    archivo.seek(0)
+    return archivo
+
+
+def respuesta_excel(archivo, nombre):
+    """Envía el archivo por bloques; se cierra (y se borra) al terminar la respuesta."""
+    return FileResponse(archivo, as_attachment=True, filename=nombre, content_type=TIPO_XLSX)
+
+
+# ======================================================
+# 📘 LIBRO DE COMPRAS
+# ======================================================
+COLUMNAS_COMPRAS = [
+    ("N°", 8, None),
+    ("Fecha", 12, None),
+    ("Comprobante N°", 22, None),
+    ("Registro N°", 16, None),
+    ("Proveedor", 40, None),
+    ("Precio Unitario", 16, "#,##0.00"),
+    ("Compras Gravadas", 18, "#,##0.00"),
+    ("IVA 13%", 14, "#,##0.00"),
+    ("Total", 16, "#,##0.00"),
+]
+
+
+def filas_libro_compras(compras):
+    """Genera las filas del libro leyendo el queryset por bloques."""
+    datos = compras.order_by('-fecha', '-id').values_list(
+        'fecha', 'comprobante_numero', 'registro_nrc', 'proveedor', 'precio_unitario', 'compras_gravadas',
+    )
+    for numero, (fecha, comprobante, registro, proveedor, precio, gravadas) in enumerate(
+        datos.iterator(chunk_size=BLOQUE_FILAS), start=1
+    ):
+        fila_excel = numero + 1  # la fila 1 es el encabezado
+        yield [
+            numero,
+            _fecha(fecha),
+            comprobante,
+            registro,
+            proveedor,
+            precio,
+            gravadas,
+            f"=G{fila_excel}*0.13",          # IVA 13% (columna G)
+            f"=G{fila_excel}+H{fila_excel}",  # Total = Gravadas + IVA
+        ]
+
+
+def exportar_libro_compras(compras):
+    """Devuelve la respuesta con el Excel del libro de compras."""
+    archivo = escribir_excel("Libro de Compras", COLUMNAS_COMPRAS, filas_libro_compras(compras))
+    return respuesta_excel(archivo, "Libro_Compras.xlsx")
+
+
+# ======================================================
+# 🧾 ANEXOS CSV DEL F07 (libros de IVA para Hacienda)
+# ======================================================
+CLASE_DTE = "4"          # Clase de documento: 4 = Documento Tributario Electrónico
+CLASE_IMPRESO = "1"      # Compras registradas con comprobante físico
+CERO = "0.00"
+
+ANEXO_VENTAS_CONTRIBUYENTES = "1"
+ANEXO_VENTAS_CONSUMIDOR = "2"
+ANEXO_COMPRAS = "3"
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve cada línea en lugar de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def _monto(valor):
+    return f"{valor or 0:.2f}"
+
+
+def _fecha(valor):
+    return localtime(valor).strftime("%d/%m/%Y")
+
+
+def _digitos(valor):
+    return "".join(c for c in (valor or "") if c.isdigit())
+
+
+def rango_fechas(desde, hasta):
+    """Límites [inicio, fin) en hora local para filtrar DateTimeField por días completos."""
+    inicio = make_aware(datetime.combine(desde, time.min))
+    fin = make_aware(datetime.combine(hasta + timedelta(days=1), time.min))
+    return inicio, fin
+
+
+def _de_empresa(queryset, empresa_id):
+    return queryset if empresa_id is None else queryset.filter(empresa_id=empresa_id)
+
+
+def filas_ventas_contribuyentes(desde, hasta, empresa_id=None):
+    """Anexo de ventas a contribuyentes (CCF, tipo 03), una fila por documento."""
+    inicio, fin = rango_fechas(desde, hasta)
+    dtes = (
+        _de_empresa(DTE.objects, empresa_id)
+        .filter(tipo_dte='03', estado='Activo', fecha_emision__gte=inicio, fecha_emision__lt=fin)
+        .order_by('fecha_emision', 'id')
+        .values_list(
+            'fecha_emision', 'numero_control', 'sello_recepcion', 'codigo_generacion',
+            'cliente__nit', 'cliente__nrc', 'cliente__nombre', 'cliente__dui',
+            'subtotal', 'iva', 'total',
+        )
+    )
+    for fecha, control, sello, codigo, nit, nrc, nombre, dui, subtotal, iva, total in dtes.iterator(
+        chunk_size=BLOQUE_FILAS
+    ):
+        yield [
+            _fecha(fecha), CLASE_DTE, '03',
+            control, sello or "", codigo or "", control,
+            _digitos(nrc) or _digitos(nit), nombre,
+            CERO, CERO, _monto(subtotal), _monto(iva), CERO, CERO, _monto(total),
+            _digitos(dui), ANEXO_VENTAS_CONTRIBUYENTES,
+        ]
+
+
+def filas_ventas_consumidor(desde, hasta, empresa_id=None):
+    """Anexo de ventas a consumidor final (facturas, tipo 01), una fila por documento."""
+    inicio, fin = rango_fechas(desde, hasta)
+    dtes = (
+        _de_empresa(DTE.objects, empresa_id)
+        .filter(tipo_dte='01', estado='Activo', fecha_emision__gte=inicio, fecha_emision__lt=fin)
+        .order_by('fecha_emision', 'id')
+        .values_list('fecha_emision', 'numero_control', 'sello_recepcion', 'codigo_generacion', 'total')
+    )
+    for fecha, control, sello, codigo, total in dtes.iterator(chunk_size=BLOQUE_FILAS):
+        yield [
+            _fecha(fecha), CLASE_DTE, '01',
+            control, sello or "",
+            control, control, codigo or "", codigo or "", "",
+            CERO, CERO, CERO, _monto(total), CERO, CERO, CERO, CERO, CERO, _monto(total),
+            ANEXO_VENTAS_CONSUMIDOR,
+        ]
+
+
+def filas_compras(desde, hasta, empresa_id=None):
+    """Anexo de compras (crédito fiscal), una fila por comprobante."""
+    inicio, fin = rango_fechas(desde, hasta)
+    compras = (
+        _de_empresa(Compra.objects, empresa_id)
+        .filter(fecha__gte=inicio, fecha__lt=fin)
+        .order_by('fecha', 'id')
+        .values_list('fecha', 'comprobante_numero', 'registro_nrc', 'proveedor',
+                     'compras_gravadas', 'iva_13', 'total')
+    )
+    for fecha, comprobante, nrc, proveedor, gravadas, iva, total in compras.iterator(chunk_size=BLOQUE_FILAS):
+        yield [
+            _fecha(fecha), CLASE_IMPRESO, '03', comprobante,
+            _digitos(nrc), proveedor,
+            CERO, CERO, CERO, _monto(gravadas), CERO, CERO, CERO, _monto(iva), _monto(total),
+            "", ANEXO_COMPRAS,
+        ]
+
+
+ANEXOS = {
+    'compras': ("Anexo_Compras", filas_compras),
+    'ventas-consumidor': ("Anexo_Ventas_Consumidor_Final", filas_ventas_consumidor),
+    'ventas-contribuyentes': ("Anexo_Ventas_Contribuyentes", filas_ventas_contribuyentes),
+}
+
+
+def exportar_anexo(anexo, desde, hasta, empresa_id=None):
+    """StreamingHttpResponse con el CSV (separado por ';') del anexo indicado."""
+    nombre, generar_filas = ANEXOS[anexo]
+    escritor = csv.writer(_Eco(), delimiter=';', lineterminator='\r\n')
+    respuesta = StreamingHttpResponse(
+        (escritor.writerow(fila) for fila in generar_filas(desde, hasta, empresa_id)),
+        content_type="text/csv; charset=utf-8",
+    )
+    respuesta["Content-Disposition"] = (
+        f'attachment; filename="{nombre}_{desde:%Y%m%d}_{hasta:%Y%m%d}.csv"'
+    )
+    return respuesta
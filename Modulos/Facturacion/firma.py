@@ -0,0 +1,197 @@
+# ======================================================
+# 🔏 FIRMA ELECTRÓNICA DE DTE (JWS compacto)
+# ======================================================
+"""
+Firma el JSON de los DTE como JWS compacto (RS512 con llave RSA, como el
+firmador del Ministerio; ES256/ES384/ES512 con llave EC).
+
+La llave privada de cada empresa es un PEM en FIRMA_DIR con el NIT sin
+guiones como nombre (`06141234567890.pem`), cifrada con FIRMA_CLAVE si
+tiene contraseña. Parsear el PEM (y descifrarlo) cuesta mucho más que
+firmar, así que cada proceso la carga una sola vez y la guarda en
+memoria; si el archivo cambia (otra fecha de modificación) se vuelve a
+leer.
+
+- `firmar_documento`: un documento, en el propio proceso (worker en línea).
+- `firmar_lote`: miles de documentos repartidos en un pool de
+  FIRMA_PROCESOS procesos; cada proceso conserva sus llaves entre lotes
+  (contingencia).
+
+Sin llave para la empresa el documento se transmite sin firmar (desarrollo).
+`python manage.py medir_firma` muestra las firmas por segundo.
+"""
+import base64
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature, encode_dss_signature
+from django.conf import settings
+
+
+class ErrorFirma(Exception):
+    """Llave inexistente, ilegible o de un tipo no admitido."""
+
+
+# ======================================================
+# 🔑 LLAVES (una carga por proceso)
+# ======================================================
+# ruta -> (fecha de modificación, llave)
+_llaves = {}
+_candado_llaves = threading.Lock()
+
+_CURVAS = {'secp256r1': ('ES256', hashes.SHA256()), 'secp384r1': ('ES384', hashes.SHA384()),
+           'secp521r1': ('ES512', hashes.SHA512())}
+
+
+def ruta_llave(empresa):
+    return os.path.join(settings.FIRMA_DIR, f"{empresa.nit_normalizado or empresa.nit}.pem")
+
+
+def tiene_llave(empresa):
+    return os.path.exists(ruta_llave(empresa))
+
+
+def cargar_llave(ruta, clave=None):
+    """Llave privada del PEM, leída y parseada solo la primera vez (o si cambió)."""
+    try:
+        modificado = os.stat(ruta).st_mtime_ns
+    except OSError as e:
+        raise ErrorFirma(f"No se encontró la llave {ruta}: {e}")
+    guardada = _llaves.get(ruta)
+    if guardada and guardada[0] == modificado:
+        return guardada[1]
+    with _candado_llaves:
+        guardada = _llaves.get(ruta)
+        if guardada and guardada[0] == modificado:
+            return guardada[1]
+        try:
+            with open(ruta, 'rb') as archivo:
+                llave = serialization.load_pem_private_key(archivo.read(), password=clave or None)
+        except (ValueError, TypeError) as e:
+            raise ErrorFirma(f"No se pudo leer la llave {ruta}: {e}")
+        if not isinstance(llave, (rsa.RSAPrivateKey, ec.EllipticCurvePrivateKey)):
+            raise ErrorFirma(f"Tipo de llave no admitido: {type(llave).__name__}")
+        _llaves[ruta] = (modificado, llave)
+        return llave
+
+
+def clave_firma():
+    return settings.FIRMA_CLAVE.encode('utf-8') if settings.FIRMA_CLAVE else None
+
+
+# ======================================================
+# ✍️ JWS COMPACTO
+# ======================================================
+def _b64(datos):
+    return base64.urlsafe_b64encode(datos).rstrip(b'=')
+
+
+def _algoritmo(llave):
+    if isinstance(llave, rsa.RSAPrivateKey):
+        return 'RS512', hashes.SHA512()
+    if llave.curve.name not in _CURVAS:
+        raise ErrorFirma(f"Curva no admitida: {llave.curve.name}")
+    return _CURVAS[llave.curve.name]
+
+
+def firmar(documento, llave):
+    """JWS compacto `cabecera.contenido.firma` del documento (dict)."""
+    alg, hash_ = _algoritmo(llave)
+    cabecera = _b64(json.dumps({'alg': alg, 'typ': 'JWS'}, separators=(',', ':')).encode())
+    contenido = _b64(json.dumps(documento, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8'))
+    entrada = cabecera + b'.' + contenido
+    if alg == 'RS512':
+        firma = llave.sign(entrada, padding.PKCS1v15(), hash_)
+    else:
+        # JWS usa r||s de tamaño fijo, no DER
+        r, s = decode_dss_signature(llave.sign(entrada, ec.ECDSA(hash_)))
+        ancho = (llave.curve.key_size + 7) // 8
+        firma = r.to_bytes(ancho, 'big') + s.to_bytes(ancho, 'big')
+    return (entrada + b'.' + _b64(firma)).decode('ascii')
+
+
+def verificar(jws, llave_publica):
+    """Devuelve el documento si la firma es válida (lanza InvalidSignature si no)."""
+    cabecera, contenido, firma = jws.encode('ascii').split(b'.')
+    relleno = lambda b: base64.urlsafe_b64decode(b + b'=' * (-len(b) % 4))
+    alg = json.loads(relleno(cabecera))['alg']
+    entrada, firma = cabecera + b'.' + contenido, relleno(firma)
+    if alg == 'RS512':
+        llave_publica.verify(firma, entrada, padding.PKCS1v15(), hashes.SHA512())
+    else:
+        hash_ = dict(_CURVAS.values())[alg]
+        ancho = len(firma) // 2
+        der = encode_dss_signature(int.from_bytes(firma[:ancho], 'big'), int.from_bytes(firma[ancho:], 'big'))
+        llave_publica.verify(der, entrada, ec.ECDSA(hash_))
+    return json.loads(relleno(contenido))
+
+
+def firmar_documento(empresa, documento):
+    """JWS del documento con la llave de la empresa, o el documento tal cual si no tiene llave."""
+    if not tiene_llave(empresa):
+        return documento
+    return firmar(documento, cargar_llave(ruta_llave(empresa), clave_firma()))
+
+
+# ======================================================
+# 🏊 FIRMA EN LOTE (pool de procesos)
+# ======================================================
+_pool = None
+_candado_pool = threading.Lock()
+
+
+def procesos_firma():
+    return int(getattr(settings, 'FIRMA_PROCESOS', os.cpu_count() or 1))
+
+
+def _firmar_en_worker(ruta, clave, documentos):
+    llave = cargar_llave(ruta, clave)
+    return [firmar(documento, llave) for documento in documentos]
+
+
+def _obtener_pool():
+    global _pool
+    with _candado_pool:
+        if _pool is None:
+            # Los procesos no cargan Django: solo reciben la ruta, la clave y los documentos
+            _pool = ProcessPoolExecutor(max_workers=procesos_firma(), mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def firmar_lote_con(ruta, documentos, clave=None):
+    """Firma `documentos` con la llave de `ruta`; en el pool si son suficientes."""
+    if not documentos:
+        return []
+    procesos = procesos_firma()
+    if procesos <= 0 or len(documentos) < settings.FIRMA_LOTE_MINIMO:
+        return _firmar_en_worker(ruta, clave, documentos)
+
+    # Un bloque por proceso (varios si el lote es grande) para repartir la carga
+    tamano = max(1, min(settings.FIRMA_LOTE_MINIMO * 4, -(-len(documentos) // procesos)))
+    pool = _obtener_pool()
+    futuros = [
+        pool.submit(_firmar_en_worker, ruta, clave, documentos[inicio:inicio + tamano])
+        for inicio in range(0, len(documentos), tamano)
+    ]
+    return [jws for futuro in futuros for jws in futuro.result()]
+
+
+def firmar_lote(empresa, documentos):
+    """JWS de cada documento, o los documentos tal cual si la empresa no tiene llave."""
+    if not tiene_llave(empresa):
+        return list(documentos)
+    return firmar_lote_con(ruta_llave(empresa), list(documentos), clave_firma())
+
+
+def cerrar():
+    """Detiene el pool (p. ej. al terminar un comando de gestión)."""
+    global _pool
+    with _candado_pool:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
@@ -0,0 +1,123 @@
+# ======================================================
+# 🖋️ FIRMA DIGITAL DE PDF (pyHanko)
+# ======================================================
+"""
+Firma opcional (FIRMA_PDF_ACTIVA=1) de los PDF de comprobantes.
+
+- El certificado de cada empresa es un PKCS#12 en FIRMA_DIR con el NIT
+  sin guiones como nombre (`06141234567890.p12`), con FIRMA_CLAVE.
+- La firma se aplica en el mismo proceso del pool WeasyPrint que renderizó
+  el PDF (renderizador.py), sin devolver los bytes al proceso principal
+  entre los dos pasos. Cada proceso arma una sola vez el firmante
+  (PKCS#12 ya descifrado), el `PdfSigner` y el contexto de validación de
+  certificados, y los reutiliza mientras el archivo no cambie.
+- Firma incremental sobre buffers en memoria (BytesIO), sin temporales.
+- El PDF firmado es el que se guarda en la caché de pdf_cache: la clave
+  incluye el certificado, así que cambiarlo o activar la firma genera
+  PDFs nuevos.
+
+`python manage.py firmar_pdfs --mes AAAA-MM` firma los PDF de un mes en
+paralelo.
+"""
+import os
+import threading
+from io import BytesIO
+
+from django.conf import settings
+
+
+class ErrorFirmaPDF(Exception):
+    """Certificado inexistente o ilegible."""
+
+
+def ruta_certificado(empresa):
+    return os.path.join(settings.FIRMA_DIR, f"{empresa.nit_normalizado or empresa.nit}.p12")
+
+
+def parametros(empresa):
+    """
+    Argumentos (serializables) de `firmar_con` para los PDF de la empresa,
+    o None si no se firman. Viajan al proceso del pool junto con el HTML.
+    """
+    if not settings.FIRMA_PDF_ACTIVA:
+        return None
+    ruta = ruta_certificado(empresa)
+    try:
+        modificado = os.stat(ruta).st_mtime_ns
+    except OSError:
+        return None
+    return {
+        'ruta': ruta,
+        'modificado': modificado,
+        'clave': settings.FIRMA_CLAVE,
+        'razon': settings.FIRMA_PDF_RAZON,
+        'lugar': settings.FIRMA_PDF_LUGAR,
+        'raices': str(settings.FIRMA_PDF_RAICES) if settings.FIRMA_PDF_RAICES else '',
+        'ltv': settings.FIRMA_PDF_LTV,
+    }
+
+
+# ======================================================
+# 🧠 ESTADO DE CADA PROCESO (firmantes y contexto de validación)
+# ======================================================
+# (ruta, modificado, razón, lugar, raíces, ltv) -> PdfSigner
+_firmantes = {}
+# carpeta de raíces -> ValidationContext
+_contextos = {}
+_candado = threading.Lock()
+
+
+def _contexto_validacion(raices):
+    """Contexto de validación de certificados (sin consultas de red), uno por proceso."""
+    from asn1crypto import pem, x509
+    from pyhanko_certvalidator import ValidationContext
+
+    if raices not in _contextos:
+        certificados = []
+        if raices:
+            for nombre in sorted(os.listdir(raices)):
+                with open(os.path.join(raices, nombre), 'rb') as archivo:
+                    datos = archivo.read()
+                if pem.detect(datos):
+                    _, _, datos = pem.unarmor(datos)
+                certificados.append(x509.Certificate.load(datos))
+        _contextos[raices] = ValidationContext(
+            trust_roots=certificados or None, allow_fetching=False,
+        )
+    return _contextos[raices]
+
+
+def _firmante(ruta, modificado, clave, razon, lugar, raices, ltv):
+    from pyhanko.sign import signers
+
+    llave = (ruta, modificado, razon, lugar, raices, ltv)
+    with _candado:
+        if llave not in _firmantes:
+            firmante = signers.SimpleSigner.load_pkcs12(
+                pfx_file=ruta, passphrase=clave.encode('utf-8') if clave else None,
+            )
+            if firmante is None:
+                raise ErrorFirmaPDF(f"No se pudo leer el certificado {ruta}.")
+            metadatos = signers.PdfSignatureMetadata(
+                field_name='FirmaOMNIGEST',
+                md_algorithm='sha256',
+                reason=razon or None,
+                location=lugar or None,
+                validation_context=_contexto_validacion(raices) if ltv else None,
+                embed_validation_info=ltv,
+            )
+            # Un archivo reemplazado deja de usarse
+            for vieja in [k for k in _firmantes if k[0] == ruta]:
+                del _firmantes[vieja]
+            _firmantes[llave] = signers.PdfSigner(metadatos, signer=firmante)
+        return _firmantes[llave]
+
+
+def firmar_con(contenido, ruta, modificado, clave, razon, lugar, raices, ltv):
+    """Firma incremental del PDF `contenido` (bytes) y devuelve el PDF firmado."""
+    from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+
+    firmante = _firmante(ruta, modificado, clave, razon, lugar, raices, ltv)
+    salida = BytesIO()
+    firmante.sign_pdf(IncrementalPdfFileWriter(BytesIO(contenido)), output=salida)
+    return salida.getvalue()
@@ -0,0 +1,214 @@
+# ======================================================
+# 📦 EMISIÓN DE DTE EN LOTE
+# ======================================================
+"""
+Creación masiva de DTE con sus detalles en una sola transacción.
+
+Cada documento se valida en memoria (clientes y productos se cargan con
+una consulta por tabla), los válidos se insertan con `bulk_create` y los
+totales se calculan una sola vez por DTE, sin pasar por
+`DetalleDTE.save()` ni `DTE.actualizar_totales()`; el resumen diario de
+ventas se actualiza una vez por día afectado.
+
+Igual que `crear_dte` y `modal_dte`, el lote no mueve inventario: las
+salidas de stock se registran aparte (`registrar_venta` o
+`existencias.registrar_movimientos`), así un lote del ERP no se rechaza
+por existencias que el catálogo no lleva.
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import router, transaction
+
+from . import busqueda, secuencias, shards
+from .models import (
+    DTE, DetalleDTE, Cliente, Producto, TrabajoEmision, ResumenVentasDiario, CENTAVO, calcular_iva
+)
+
+TIPOS_VALIDOS = {codigo for codigo, _ in DTE.TIPO_DTE_CHOICES}
+
+
+class DocumentoInvalido(Exception):
+    pass
+
+
+class ReferenciasAjenas(Exception):
+    """Ids de cliente o producto que no existen en la empresa del lote (se rechaza entero)."""
+
+    def __init__(self, clientes, productos):
+        self.clientes = sorted(clientes)
+        self.productos = sorted(productos)
+        partes = []
+        if self.clientes:
+            partes.append(f"clientes {self.clientes}")
+        if self.productos:
+            partes.append(f"productos {self.productos}")
+        super().__init__(f"No existen en la empresa: {', '.join(partes)}.")
+
+
+def _id(valor):
+    """Acepta ids enteros o numéricos en texto ("15")."""
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, int):
+        return valor
+    if isinstance(valor, str) and valor.strip().isdigit():
+        return int(valor)
+    return None
+
+
+def _decimal(valor, campo):
+    try:
+        numero = Decimal(str(valor))
+    except (InvalidOperation, TypeError, ValueError):
+        raise DocumentoInvalido(f"'{campo}' no es un número válido.")
+    if not numero.is_finite() or numero <= 0:
+        raise DocumentoInvalido(f"'{campo}' debe ser mayor que cero.")
+    return numero
+
+
+def _preparar(doc, clientes, productos, numeros_usados):
+    """Valida un documento y devuelve (DTE, [DetalleDTE]) sin guardar."""
+    if not isinstance(doc, dict):
+        raise DocumentoInvalido("El documento debe ser un objeto JSON.")
+
+    tipo = str(doc.get('tipo_dte', '01'))
+    if tipo not in TIPOS_VALIDOS:
+        raise DocumentoInvalido(f"Tipo de DTE '{tipo}' no válido.")
+
+    cliente = clientes.get(_id(doc.get('cliente_id')))
+    if cliente is None:
+        raise DocumentoInvalido("Cliente no encontrado.")
+
+    lineas = doc.get('detalles') or []
+    if not isinstance(lineas, list):
+        raise DocumentoInvalido("'detalles' debe ser una lista.")
+    if not lineas:
+        raise DocumentoInvalido("El documento no tiene detalles.")
+
+    # Sin número propio se asigna de la secuencia al guardar el lote
+    numero_control = str(doc.get('numero_control') or '')
+    if len(numero_control) > DTE._meta.get_field('numero_control').max_length:
+        raise DocumentoInvalido("Número de control demasiado largo.")
+    if numero_control and numero_control in numeros_usados:
+        raise DocumentoInvalido(f"Número de control '{numero_control}' duplicado.")
+
+    detalles = []
+    subtotal = Decimal('0.00')
+    for i, linea in enumerate(lineas, start=1):
+        producto = productos.get(_id(linea.get('producto_id'))) if isinstance(linea, dict) else None
+        if producto is None:
+            raise DocumentoInvalido(f"Detalle {i}: producto no encontrado.")
+
+        cantidad = _decimal(linea.get('cantidad'), f"detalle {i}: cantidad")
+        precio = linea.get('precio_unitario')
+        precio = producto.precio_unitario if precio is None else _decimal(precio, f"detalle {i}: precio_unitario")
+        total_item = (cantidad * precio).quantize(CENTAVO)
+
+        detalles.append(DetalleDTE(
+            producto=producto,
+            cantidad=cantidad,
+            precio_unitario=precio,
+            total_item=total_item,
+        ))
+        subtotal += total_item
+
+    iva = calcular_iva(subtotal)
+    dte = DTE(
+        cliente=cliente,
+        tipo_dte=tipo,
+        numero_control=numero_control,
+        condicion_pago=doc.get('condicion_pago') or 'Contado',
+        subtotal=subtotal,
+        iva=iva,
+        total=subtotal + iva,
+        estado='Activo',
+    )
+    if numero_control:
+        numeros_usados.add(numero_control)
+    return dte, detalles
+
+
+def crear_dtes_en_lote(documentos, empresa, usuario=None, emitir=False):
+    """
+    Crea todos los documentos válidos y devuelve un resultado por documento:
+    {"indice", "success", "id", "numero_control"} o {"indice", "success", "error"}.
+    Con `emitir=True` también se encola su emisión (MH, PDF y correo).
+    No descuenta existencias (ver la nota del módulo).
+    Lanza ReferenciasAjenas si algún cliente o producto no es de `empresa`.
+    """
+    # 🔎 Cargar referencias con una consulta por tabla
+    cliente_ids = {_id(d.get('cliente_id')) for d in documentos if isinstance(d, dict)}
+    producto_ids = {
+        _id(linea.get('producto_id'))
+        for d in documentos if isinstance(d, dict)
+        if isinstance(d.get('detalles'), list)
+        for linea in d['detalles'] if isinstance(linea, dict)
+    }
+    cliente_ids -= {None}
+    producto_ids -= {None}
+    # Siempre de la empresa del lote: nunca clientes, productos ni stock de otra
+    clientes = Cliente.objects.filter(empresa=empresa).in_bulk(cliente_ids)
+    productos = Producto.objects.filter(empresa=empresa).in_bulk(producto_ids)
+    if len(clientes) != len(cliente_ids) or len(productos) != len(producto_ids):
+        raise ReferenciasAjenas(cliente_ids - clientes.keys(), producto_ids - productos.keys())
+
+    propuestos = [d.get('numero_control') for d in documentos if isinstance(d, dict) and d.get('numero_control')]
+    numeros_usados = set(
+        DTE.objects.filter(empresa=empresa, numero_control__in=propuestos).values_list('numero_control', flat=True)
+    )
+
+    resultados = [None] * len(documentos)
+    preparados = []
+    for indice, doc in enumerate(documentos):
+        try:
+            dte, detalles = _preparar(doc, clientes, productos, numeros_usados)
+        except DocumentoInvalido as e:
+            resultados[indice] = {"indice": indice, "success": False, "error": str(e)}
+            continue
+        dte.empresa = empresa
+        dte.usuario = usuario
+        preparados.append((indice, dte, detalles))
+
+    if preparados:
+        using = router.db_for_write(DTE)
+        # bulk_create no dispara pre_save: el usuario se copia al shard aquí
+        shards.asegurar_usuario(using, usuario.pk if usuario else None)
+        with transaction.atomic(using=using):
+            # Una reserva por tipo en la misma transacción: sin huecos si el lote falla
+            sin_numero = defaultdict(list)
+            for _, dte, _ in preparados:
+                if not dte.numero_control:
+                    sin_numero[dte.tipo_dte].append(dte)
+            for tipo, dtes in sin_numero.items():
+                for dte, numero in zip(dtes, secuencias.numeros_control(empresa, tipo, len(dtes))):
+                    dte.numero_control = numero
+
+            DTE.objects.bulk_create([dte for _, dte, _ in preparados], batch_size=500)
+            ResumenVentasDiario.acumular_lote([dte for _, dte, _ in preparados])
+
+            lineas = []
+            for _, dte, detalles in preparados:
+                for detalle in detalles:
+                    detalle.dte = dte
+                    lineas.append(detalle)
+            DetalleDTE.objects.bulk_create(lineas, batch_size=1000)
+
+            busqueda.indexar_lote('dte', [dte for _, dte, _ in preparados])
+
+            if emitir:
+                TrabajoEmision.objects.bulk_create(
+                    [TrabajoEmision(dte=dte, usuario=usuario) for _, dte, _ in preparados],
+                    batch_size=500,
+                )
+
+        for indice, dte, _ in preparados:
+            resultados[indice] = {
+                "indice": indice,
+                "success": True,
+                "id": dte.id,
+                "numero_control": dte.numero_control,
+                "total": f"{dte.total:.2f}",
+            }
+
+    return resultados
@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Modulos.Facturacion.empresa_actual import usar_empresa
+from Modulos.Facturacion.existencias import cerrar_inventario
+
+
+class Command(BaseCommand):
+    help = "Genera los cierres diarios de inventario pendientes (puntos de control del kardex)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hasta', help='Último día a cerrar (AAAA-MM-DD). Por defecto, ayer.')
+        parser.add_argument('--base-datos', help='Alias del shard a cerrar (por defecto la base principal).')
+
+    def handle(self, *args, **options):
+        hasta = None
+        if options['hasta']:
+            try:
+                hasta = datetime.strptime(options['hasta'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Formato de fecha inválido, use AAAA-MM-DD.")
+
+        with usar_empresa(None, options['base_datos']):
+            creados = cerrar_inventario(hasta)
+        self.stdout.write(f"✅ {creados} cierre(s) de inventario generados.")
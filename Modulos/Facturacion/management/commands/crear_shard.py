@@ -0,0 +1,42 @@
+import re
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from Modulos.Facturacion.shards import es_shard
+
+
+def validar_alias(alias):
+    if not es_shard(alias) or alias not in settings.DATABASES:
+        raise CommandError(f"'{alias}' no es un shard configurado en DATABASE_SHARDS.")
+    return alias
+
+
+def esquema_de(alias):
+    """Esquema de PostgreSQL del shard (search_path en OPTIONS), o None."""
+    opciones = settings.DATABASES[alias].get('OPTIONS', {}).get('options', '')
+    encontrado = re.search(r'search_path=([\w-]+)', opciones)
+    return encontrado.group(1) if encontrado else None
+
+
+class Command(BaseCommand):
+    help = "Crea la base (o el esquema de PostgreSQL) de un shard de empresa y aplica las migraciones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('alias', help='Alias del shard en DATABASE_SHARDS.')
+
+    def handle(self, *args, **options):
+        alias = validar_alias(options['alias'])
+        conexion = connections[alias]
+
+        esquema = esquema_de(alias) if conexion.vendor == 'postgresql' else None
+        if esquema:
+            with conexion.cursor() as cursor:
+                cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {conexion.ops.quote_name(esquema)}")
+            self.stdout.write(f"🗂️ Esquema {esquema} listo.")
+
+        # SQLite crea el archivo al conectarse
+        call_command('migrate', database=alias, verbosity=options['verbosity'], interactive=False)
+        self.stdout.write(f"✅ Shard {alias} creado.")
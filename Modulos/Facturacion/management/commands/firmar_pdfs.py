@@ -0,0 +1,87 @@
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from Modulos.Facturacion import renderizador
+from Modulos.Facturacion.emision import generar_pdf_dte
+from Modulos.Facturacion.empresa_actual import usar_empresa
+from Modulos.Facturacion.models import DTE
+
+
+def _pdf_en_hilo(dte, destino):
+    try:
+        contenido = generar_pdf_dte(dte)
+        if destino:
+            with open(os.path.join(destino, f"DTE_{dte.numero_control}.pdf"), 'wb') as archivo:
+                archivo.write(contenido)
+        return len(contenido)
+    finally:
+        # Conexiones propias de este hilo
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera y firma en paralelo los PDF de los DTE de un mes (quedan en la caché "
+        "de PDF y, con --destino, también en una carpeta)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mes', required=True, help='Mes en formato AAAA-MM.')
+        parser.add_argument('--empresa', type=int, help='Solo los DTE de esta empresa.')
+        parser.add_argument('--destino', help='Carpeta donde escribir los PDF firmados.')
+        parser.add_argument('--hilos', type=int,
+                            help='PDF en curso a la vez (por defecto 2 por proceso del pool).')
+        parser.add_argument('--base-datos', help='Alias del shard de los DTE.')
+
+    def handle(self, *args, **options):
+        if not settings.FIRMA_PDF_ACTIVA:
+            raise CommandError("La firma de PDF está desactivada: active FIRMA_PDF_ACTIVA=1.")
+        try:
+            mes = datetime.strptime(options['mes'], '%Y-%m')
+        except ValueError:
+            raise CommandError("--mes debe tener el formato AAAA-MM.")
+        if options['destino']:
+            os.makedirs(options['destino'], exist_ok=True)
+
+        with usar_empresa(options['empresa'], options['base_datos']):
+            self.firmar(mes, options)
+
+    def firmar(self, mes, options):
+        dtes = DTE.objects.filter(fecha_emision__year=mes.year, fecha_emision__month=mes.month)
+        if options['empresa']:
+            dtes = dtes.filter(empresa_id=options['empresa'])
+        dtes = list(dtes.select_related('empresa', 'cliente').order_by('id'))
+        if not dtes:
+            self.stdout.write("No hay DTE en ese mes.")
+            return
+
+        # Cada hilo espera su PDF del pool: con 2 por proceso el pool no queda ocioso
+        hilos = options['hilos'] or max(1, int(getattr(settings, 'PDF_RENDER_PROCESOS', 1))) * 2
+        self.stdout.write(f"🖋️ Firmando {len(dtes)} PDF con {hilos} hilo(s)...")
+        inicio = time.monotonic()
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='firma-pdf') as pool:
+            futuros = [
+                pool.submit(contextvars.copy_context().run, _pdf_en_hilo, dte, options['destino'])
+                for dte in dtes
+            ]
+            errores = 0
+            for dte, futuro in zip(dtes, futuros):
+                try:
+                    futuro.result()
+                except Exception as e:
+                    errores += 1
+                    self.stderr.write(f"❌ {dte.numero_control}: {e}")
+        renderizador.cerrar()
+
+        segundos = time.monotonic() - inicio
+        self.stdout.write(
+            f"✅ {len(dtes) - errores} PDF firmados en {segundos:.1f} s "
+            f"({(len(dtes) - errores) / segundos:.1f} PDF/s), {errores} con error."
+        )
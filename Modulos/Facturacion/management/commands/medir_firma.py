@@ -0,0 +1,94 @@
+import os
+import tempfile
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Modulos.Facturacion import firma
+from Modulos.Facturacion.emision import documento_dte
+from Modulos.Facturacion.models import DTE, Empresa
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide las firmas JWS por segundo: cargando la llave en cada documento, "
+        "con la llave en memoria y en lote con el pool de procesos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documentos', type=int, default=2000)
+        parser.add_argument('--empresa', type=int,
+                            help='Usa la llave de esta empresa y sus DTE (si no, una llave RSA temporal).')
+        parser.add_argument('--bits', type=int, default=2048,
+                            help='Tamaño de la llave RSA temporal.')
+
+    def handle(self, *args, **options):
+        total = options['documentos']
+        if options['empresa']:
+            empresa = Empresa.objects.filter(pk=options['empresa']).first()
+            if empresa is None or not firma.tiene_llave(empresa):
+                raise CommandError("La empresa no existe o no tiene llave en FIRMA_DIR.")
+            self.medir(firma.ruta_llave(empresa), firma.clave_firma(), self.documentos(empresa, total))
+            return
+
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'temporal.pem')
+            llave = rsa.generate_private_key(public_exponent=65537, key_size=options['bits'])
+            with open(ruta, 'wb') as archivo:
+                archivo.write(llave.private_bytes(
+                    serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+                ))
+            self.medir(ruta, None, self.documentos(None, total))
+
+    def documentos(self, empresa, total):
+        """Documentos reales de la empresa (repetidos hasta `total`) o sintéticos."""
+        base = []
+        if empresa is not None:
+            dtes = DTE.objects.filter(empresa=empresa).select_related('cliente').order_by('-id')[:200]
+            base = [documento_dte(dte) for dte in dtes]
+        if not base:
+            base = [{
+                'tipo_dte': '01', 'numero_control': f"DTE-01-M001P001-{i:015d}", 'cliente': 'Cliente de prueba',
+                'fecha_emision': '2026-01-01', 'total': 113.0, 'codigo_generacion': None,
+            } for i in range(200)]
+        return [base[i % len(base)] for i in range(total)]
+
+    def medir(self, ruta, clave, documentos):
+        total = len(documentos)
+        muestra = documentos[:max(1, min(total, 200))]
+
+        inicio = time.perf_counter()
+        for documento in muestra:
+            # Ingenuo: leer y parsear el PEM para cada documento
+            with open(ruta, 'rb') as archivo:
+                llave = serialization.load_pem_private_key(archivo.read(), password=clave)
+            firma.firmar(documento, llave)
+        self.informe("Cargando la llave cada vez", len(muestra), time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        for documento in documentos:
+            firma.firmar(documento, firma.cargar_llave(ruta, clave))
+        self.informe("Llave en memoria (1 proceso)", total, time.perf_counter() - inicio)
+
+        # El arranque del pool se mide aparte: en el worker ocurre una sola vez
+        inicio = time.perf_counter()
+        firma.firmar_lote_con(ruta, documentos[:max(settings.FIRMA_LOTE_MINIMO, firma.procesos_firma())], clave)
+        arranque = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        firmados = firma.firmar_lote_con(ruta, documentos, clave)
+        self.informe(f"Lote en {firma.procesos_firma()} proceso(s)", total, time.perf_counter() - inicio)
+        self.stdout.write(f"   (arranque del pool: {arranque:.2f} s)")
+        firma.cerrar()
+
+        firma.verificar(firmados[-1], firma.cargar_llave(ruta, clave).public_key())
+        self.stdout.write("✅ Firma verificada.")
+
+    def informe(self, nombre, cantidad, segundos):
+        self.stdout.write(
+            f"🔏 {nombre}: {cantidad} firmas en {segundos:.2f} s → "
+            f"{cantidad / segundos:,.0f} firmas/s ({cantidad / segundos * 60:,.0f}/min)"
+        )
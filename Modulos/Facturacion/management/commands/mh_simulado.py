@@ -0,0 +1,185 @@
+import json
+import random
+import secrets
+import signal
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from django.core.management.base import BaseCommand
+
+from Modulos.Facturacion.mh import RUTA_AUTH, RUTA_CONSULTA_LOTE, RUTA_LOTE, RUTA_RECEPCION
+
+
+class ServidorMH(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, direccion, opciones):
+        super().__init__(direccion, ManejadorMH)
+        self.opciones = opciones
+        self.tokens = set()
+        self.recibidos = {}  # codigoGeneracion -> sello (reenvíos idempotentes)
+        self.lotes = {}  # codigoLote -> resultados
+        self.conteo = Counter()
+        self.candado = threading.Lock()
+
+
+class ManejadorMH(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # conexiones persistentes, como el servicio real
+
+    def log_message(self, formato, *args):
+        if self.server.opciones['verbosity'] > 1:
+            super().log_message(formato, *args)
+
+    def _responder(self, estado, datos):
+        cuerpo = json.dumps(datos).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+        with self.server.candado:
+            self.server.conteo[estado] += 1
+
+    def _esperar(self):
+        """Latencia simulada; devuelve True si la petición debe fallar con 503."""
+        opciones = self.server.opciones
+        time.sleep(max(0.0, random.gauss(opciones['latencia'], opciones['variacion'])) / 1000)
+        if random.random() < opciones['errores']:
+            self._responder(503, {'estado': 'ERROR', 'descripcionMsg': 'Servicio no disponible'})
+            return True
+        return False
+
+    def _autorizado(self):
+        if self.headers.get('Authorization') in self.server.tokens:
+            return True
+        self._responder(401, {'estado': 'ERROR', 'descripcionMsg': 'Token inválido'})
+        return False
+
+    def _sellar(self, codigo):
+        with self.server.candado:
+            return self.server.recibidos.setdefault(
+                codigo, f"{datetime.now():%Y}{secrets.token_hex(18).upper()}"
+            )
+
+    def do_GET(self):
+        if self._esperar() or not self._autorizado():
+            return
+        if not self.path.startswith(RUTA_CONSULTA_LOTE):
+            return self._responder(404, {'estado': 'ERROR', 'descripcionMsg': 'Ruta desconocida'})
+        resultado = self.server.lotes.get(self.path[len(RUTA_CONSULTA_LOTE):])
+        if resultado is None:
+            return self._responder(404, {'estado': 'ERROR', 'descripcionMsg': 'Lote desconocido'})
+        self._responder(200, resultado)
+
+    def do_POST(self):
+        opciones = self.server.opciones
+        cuerpo = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self._esperar():
+            return
+
+        if self.path == RUTA_AUTH:
+            datos = parse_qs(cuerpo.decode('utf-8'))
+            if not datos.get('user'):
+                return self._responder(401, {'status': 'ERROR', 'message': 'Usuario requerido'})
+            token = f"Bearer {secrets.token_urlsafe(24)}"
+            with self.server.candado:
+                self.server.tokens.add(token)
+            return self._responder(200, {'status': 'OK', 'body': {'user': datos['user'][0], 'token': token}})
+
+        if self.path not in (RUTA_RECEPCION, RUTA_LOTE):
+            return self._responder(404, {'estado': 'ERROR', 'descripcionMsg': 'Ruta desconocida'})
+        if not self._autorizado():
+            return
+
+        envio = json.loads(cuerpo or b'{}')
+        if self.path == RUTA_LOTE:
+            return self._recibir_lote(envio)
+        codigo = envio.get('codigoGeneracion')
+        if not codigo or random.random() < opciones['rechazos']:
+            return self._responder(400, {
+                'estado': 'RECHAZADO', 'codigoGeneracion': codigo,
+                'descripcionMsg': 'Documento rechazado (simulado)',
+                'observaciones': ['Rechazo aleatorio del servidor simulado'],
+            })
+        sello = self._sellar(codigo)
+        self._responder(200, {
+            'version': envio.get('version', 1),
+            'ambiente': envio.get('ambiente'),
+            'estado': 'PROCESADO',
+            'codigoGeneracion': codigo,
+            'selloRecibido': sello,
+            'fhProcesamiento': f"{datetime.now():%d/%m/%Y %H:%M:%S}",
+            'descripcionMsg': 'RECIBIDO',
+            'observaciones': [],
+        })
+
+    def _recibir_lote(self, envio):
+        """Procesa el lote al recibirlo; el resultado se consulta con GET."""
+        procesados, rechazados = [], []
+        for documento in envio.get('documentos') or []:
+            codigo = documento.get('codigoGeneracion')
+            if not codigo or random.random() < self.server.opciones['rechazos']:
+                rechazados.append({
+                    'codigoGeneracion': codigo, 'estado': 'RECHAZADO',
+                    'descripcionMsg': 'Documento rechazado (simulado)',
+                })
+            else:
+                procesados.append({
+                    'codigoGeneracion': codigo, 'estado': 'PROCESADO', 'selloRecibido': self._sellar(codigo),
+                })
+        codigo_lote = secrets.token_hex(16).upper()
+        with self.server.candado:
+            self.server.lotes[codigo_lote] = {
+                'codigoLote': codigo_lote, 'procesados': procesados, 'rechazados': rechazados,
+            }
+        self._responder(200, {
+            'version': envio.get('version', 1),
+            'ambiente': envio.get('ambiente'),
+            'idEnvio': envio.get('idEnvio'),
+            'estado': 'RECIBIDO',
+            'codigoLote': codigo_lote,
+            'fhProcesamiento': f"{datetime.now():%d/%m/%Y %H:%M:%S}",
+            'descripcionMsg': 'Lote recibido',
+        })
+
+
+class Command(BaseCommand):
+    help = (
+        "Servidor local que imita la recepción de DTE del Ministerio de Hacienda "
+        "(autenticación, recepción en línea y en lote) con latencia y tasas de error configurables. "
+        "Úselo con MH_URL=http://127.0.0.1:<puerto> para pruebas de carga."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puerto', type=int, default=8765)
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--latencia', type=float, default=200,
+                            help='Latencia media por petición, en milisegundos.')
+        parser.add_argument('--variacion', type=float, default=50,
+                            help='Desviación estándar de la latencia, en milisegundos.')
+        parser.add_argument('--errores', type=float, default=0.0,
+                            help='Fracción de peticiones que responden 503 (0 a 1).')
+        parser.add_argument('--rechazos', type=float, default=0.0,
+                            help='Fracción de documentos rechazados con 400 (0 a 1).')
+
+    def handle(self, *args, **options):
+        servidor = ServidorMH((options['host'], options['puerto']), options)
+        self.stdout.write(
+            f"🏛️ MH simulado en http://{options['host']}:{options['puerto']} "
+            f"(latencia {options['latencia']:.0f}±{options['variacion']:.0f} ms, "
+            f"errores {options['errores']:.0%}, rechazos {options['rechazos']:.0%})"
+        )
+        # kill (SIGTERM) también detiene el servidor y muestra el resumen
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            resumen = ', '.join(f"{estado}: {n}" for estado, n in sorted(servidor.conteo.items()))
+            self.stdout.write(f"✅ Servidor detenido. Respuestas: {resumen or 'ninguna'}")
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from Modulos.Facturacion.shards import es_shard
+
+
+class Command(BaseCommand):
+    help = "Aplica las migraciones pendientes en la base principal y en todos los shards de empresa."
+
+    def handle(self, *args, **options):
+        shards = [alias for alias in settings.DATABASES if es_shard(alias)]
+        for alias in ['default'] + shards:
+            self.stdout.write(f"🗄️ {alias}")
+            call_command('migrate', database=alias, verbosity=options['verbosity'], interactive=False)
+        self.stdout.write(f"✅ Base principal y {len(shards)} shard(s) migrados.")
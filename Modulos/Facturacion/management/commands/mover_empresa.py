@@ -0,0 +1,121 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+
+from Modulos.Facturacion import busqueda, shards
+from Modulos.Facturacion.empresa_actual import usar_empresa
+from Modulos.Facturacion.management.commands.crear_shard import validar_alias
+from Modulos.Facturacion.models import (
+    Empresa, Cliente, Proveedor, Producto, Compra, DTE, DetalleDTE,
+    Inventario, CierreInventario, ResumenVentasDiario, TrabajoEmision, Secuencia, LoteContingencia,
+    totales_diferidos,
+)
+
+TAMANO_LOTE = 2000
+
+
+def filas_de_empresa(empresa_id, origen):
+    """(modelo, filtro) en orden de dependencias con las filas de la empresa en `origen`."""
+    dtes = DTE.objects.using(origen).filter(empresa_id=empresa_id)
+    detalles = DetalleDTE.objects.using(origen).filter(dte__empresa_id=empresa_id)
+    de_empresa = Q(empresa_id=empresa_id)
+    return [
+        # Clientes y productos sin empresa usados por sus DTE también se copian
+        (Cliente, Q(de_empresa) | Q(id__in=dtes.values('cliente_id'))),
+        (Proveedor, de_empresa),
+        (Producto, Q(de_empresa) | Q(id__in=detalles.values('producto_id'))),
+        (Compra, de_empresa),
+        (LoteContingencia, de_empresa),
+        (DTE, de_empresa),
+        (DetalleDTE, Q(dte__empresa_id=empresa_id)),
+        (Inventario, Q(producto__empresa_id=empresa_id)),
+        (CierreInventario, Q(producto__empresa_id=empresa_id)),
+        (ResumenVentasDiario, de_empresa),
+        (TrabajoEmision, Q(dte__empresa_id=empresa_id)),
+        (Secuencia, de_empresa),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Copia los datos de una empresa a otro shard (mismos ids) y la apunta a él. "
+        "Si algún id ya existe en el destino la copia se revierte completa."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('empresa_id', type=int)
+        parser.add_argument('destino', help="Alias del shard destino ('default' para volver a la base principal).")
+        parser.add_argument('--conservar-origen', action='store_true',
+                            help='No borra las filas de la base de origen.')
+
+    def handle(self, *args, **options):
+        empresa = Empresa.objects.filter(pk=options['empresa_id']).first()
+        if empresa is None:
+            raise CommandError(f"No existe la empresa {options['empresa_id']}.")
+        destino = options['destino']
+        if destino != DEFAULT_DB_ALIAS:
+            validar_alias(destino)
+        origen = empresa.base_datos or DEFAULT_DB_ALIAS
+        if origen == destino:
+            raise CommandError(f"La empresa ya está en {destino}.")
+
+        self.stdout.write(f"🚚 Moviendo {empresa.nombre} de {origen} a {destino} (sin escrituras mientras tanto).")
+        tablas = filas_de_empresa(empresa.id, origen)
+
+        with transaction.atomic(using=destino):
+            shards.copiar_empresa(empresa, destino)
+            usuarios = set(DTE.objects.using(origen).filter(empresa=empresa).values_list('usuario_id', flat=True))
+            for user_id in usuarios:
+                shards.asegurar_usuario(destino, user_id)
+
+            for modelo, filtro in tablas:
+                copiadas = self.copiar(modelo.objects.using(origen).filter(filtro), modelo, destino)
+                self.stdout.write(f"   {modelo.__name__}: {copiadas}")
+
+            # Los ids se copiaron tal cual: las secuencias de PostgreSQL deben seguir después
+            conexion = connections[destino]
+            sentencias = conexion.ops.sequence_reset_sql(no_style(), [modelo for modelo, _ in tablas])
+            if sentencias:
+                with conexion.cursor() as cursor:
+                    for sql in sentencias:
+                        cursor.execute(sql)
+
+        busqueda.reconstruir(using=destino)
+
+        empresa.base_datos = '' if destino == DEFAULT_DB_ALIAS else destino
+        empresa.save(update_fields=['base_datos'])
+
+        if not options['conservar_origen']:
+            self.borrar_origen(empresa.id, origen)
+        self.stdout.write(f"✅ {empresa.nombre} ahora usa {destino}.")
+
+    def copiar(self, queryset, modelo, destino):
+        total = 0
+        lote = []
+        for fila in queryset.order_by('pk').iterator(chunk_size=TAMANO_LOTE):
+            lote.append(fila)
+            if len(lote) >= TAMANO_LOTE:
+                modelo.objects.using(destino).bulk_create(lote)
+                total += len(lote)
+                lote = []
+        modelo.objects.using(destino).bulk_create(lote)
+        return total + len(lote)
+
+    def borrar_origen(self, empresa_id, origen):
+        """Borra con el ORM (señales de búsqueda, resumen y PDF) dentro del contexto del origen."""
+        with transaction.atomic(using=origen), usar_empresa(empresa_id, origen), totales_diferidos():
+            DTE.objects.using(origen).filter(empresa_id=empresa_id).delete()
+            LoteContingencia.objects.using(origen).filter(empresa_id=empresa_id).delete()
+            ResumenVentasDiario.objects.using(origen).filter(empresa_id=empresa_id).delete()
+            Secuencia.objects.using(origen).filter(empresa_id=empresa_id).delete()
+            Compra.objects.using(origen).filter(empresa_id=empresa_id).delete()
+            # Clientes y productos que aún usan DTE de otras empresas se quedan
+            Producto.objects.using(origen).filter(empresa_id=empresa_id).exclude(
+                id__in=DetalleDTE.objects.using(origen).values('producto_id')
+            ).delete()
+            Proveedor.objects.using(origen).filter(empresa_id=empresa_id).delete()
+            Cliente.objects.using(origen).filter(empresa_id=empresa_id).exclude(
+                id__in=DTE.objects.using(origen).values('cliente_id')
+            ).delete()
+        self.stdout.write(f"🧹 Filas de la empresa borradas de {origen}.")
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Modulos.Facturacion import firma, renderizador
+from Modulos.Facturacion.empresa_actual import usar_empresa
+from Modulos.Facturacion.emision import (
+    tomar_siguiente_trabajo, procesar_trabajo, liberar_trabajos_colgados
+)
+
+
+class Command(BaseCommand):
+    help = "Worker de emisión: procesa la cola de DTE (paso MH, PDF, JSON y correo)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Procesa los trabajos pendientes y termina.')
+        parser.add_argument('--intervalo', type=float, default=1.0,
+                            help='Segundos de espera cuando la cola está vacía.')
+        parser.add_argument('--minutos-colgado', type=int, default=10,
+                            help='Reencola trabajos "Procesando" sin avance tras estos minutos.')
+        parser.add_argument('--base-datos',
+                            help='Alias del shard cuya cola se procesa (un worker por shard).')
+
+    def handle(self, *args, **options):
+        with usar_empresa(None, options['base_datos']):
+            self.procesar(options)
+
+    def procesar(self, options):
+        self.stdout.write("🚀 Worker de emisión iniciado.")
+        ultimo_barrido = 0
+
+        while True:
+            # 🧹 Recupera trabajos de workers caídos una vez por minuto
+            if time.monotonic() - ultimo_barrido > 60:
+                liberados = liberar_trabajos_colgados(options['minutos_colgado'])
+                if liberados:
+                    self.stdout.write(f"♻️ {liberados} trabajo(s) reencolados.")
+                ultimo_barrido = time.monotonic()
+
+            trabajo = tomar_siguiente_trabajo()
+            if trabajo is None:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            procesar_trabajo(trabajo)
+            self.stdout.write(f"📄 Trabajo {trabajo.id} ({trabajo.dte.numero_control}): {trabajo.estado}")
+
+        renderizador.cerrar()
+        firma.cerrar()
+        self.stdout.write("✅ Cola de emisión vacía.")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from Modulos.Facturacion import busqueda
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda de clientes, proveedores, productos y DTE."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-datos', default='default',
+                            help='Alias de la base de datos (p. ej. un shard de empresa).')
+
+    def handle(self, *args, **options):
+        if not busqueda.activo(options['base_datos']):
+            self.stdout.write("⚠️ El motor de base de datos no tiene índice de búsqueda; se usa icontains.")
+            return
+        busqueda.reconstruir(using=options['base_datos'])
+        self.stdout.write("✅ Índice de búsqueda reconstruido.")
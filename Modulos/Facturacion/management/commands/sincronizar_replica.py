@@ -0,0 +1,29 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Modulos.Facturacion.replicas import ALIAS
+
+
+class Command(BaseCommand):
+    help = (
+        "Desarrollo local: copia la base principal SQLite sobre la réplica SQLite. "
+        "En PostgreSQL la réplica se mantiene con la replicación del servidor."
+    )
+
+    def handle(self, *args, **options):
+        if ALIAS not in settings.DATABASES:
+            raise CommandError("No hay réplica configurada (DATABASE_REPLICA_URL).")
+        origen, destino = settings.DATABASES['default'], settings.DATABASES[ALIAS]
+        if 'sqlite' not in origen['ENGINE'] or 'sqlite' not in destino['ENGINE']:
+            raise CommandError("Solo para dos archivos SQLite.")
+
+        # API de respaldo de SQLite: copia consistente aunque la principal esté en uso
+        principal, replica = sqlite3.connect(origen['NAME']), sqlite3.connect(destino['NAME'])
+        try:
+            principal.backup(replica)
+        finally:
+            principal.close()
+            replica.close()
+        self.stdout.write(f"✅ Réplica {destino['NAME']} actualizada.")
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Modulos.Facturacion import contingencia, firma, mh
+from Modulos.Facturacion.empresa_actual import usar_empresa
+
+
+class Command(BaseCommand):
+    help = "Transmite en lotes los DTE emitidos en contingencia y concilia sus sellos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Hace una sola pasada y termina.')
+        parser.add_argument('--intervalo', type=float, default=30.0,
+                            help='Segundos entre pasadas.')
+        parser.add_argument('--hilos', type=int,
+                            help='Lotes enviados a la vez (por defecto MH_LOTE_CONCURRENCIA).')
+        parser.add_argument('--base-datos',
+                            help='Alias del shard cuya contingencia se transmite.')
+
+    def handle(self, *args, **options):
+        with usar_empresa(None, options['base_datos']):
+            self.procesar(options)
+
+    def procesar(self, options):
+        self.stdout.write("🚨 Transmisor de contingencia iniciado.")
+        while True:
+            inicio = time.monotonic()
+            try:
+                lotes = contingencia.drenar(options['hilos'])
+            except (mh.ErrorMH, firma.ErrorFirma) as e:
+                firma.cerrar()
+                raise CommandError(str(e))
+
+            if lotes:
+                procesados = sum(lote.procesados for lote in lotes)
+                rechazados = sum(lote.rechazados for lote in lotes)
+                pendientes = sum(1 for lote in lotes if lote.estado in ('Pendiente', 'Enviado'))
+                self.stdout.write(
+                    f"📦 {len(lotes)} lote(s) en {time.monotonic() - inicio:.1f} s: "
+                    f"{procesados} procesados, {rechazados} rechazados, {pendientes} lote(s) pendientes."
+                )
+                errores = {lote.error for lote in lotes if lote.error}
+                for error in errores:
+                    self.stdout.write(f"❌ {error}")
+
+            if options['una_vez']:
+                break
+            time.sleep(options['intervalo'])
+
+        firma.cerrar()
+        self.stdout.write("✅ Transmisor de contingencia detenido.")
@@ -0,0 +1,274 @@
+# ======================================================
+# 🏛️ TRANSMISIÓN AL MINISTERIO DE HACIENDA
+# ======================================================
+"""
+Cliente HTTP de recepción de DTE del Ministerio de Hacienda.
+
+- Un `requests.Session` por proceso con pool de conexiones persistentes
+  (MH_POOL): el worker no repite el handshake TLS en cada documento.
+- El token de /seguridad/auth se guarda en la caché de Django
+  (MH_TOKEN_SEGUNDOS); con REDIS_URL lo comparten todos los workers.
+  Un 401 lo descarta y se pide otro una sola vez.
+- Timeouts de conexión y lectura separados.
+- Errores de red, 5xx y 429 se reintentan MH_REINTENTOS veces con backoff
+  exponencial y jitter completo. Un rechazo (4xx) no se reintenta.
+- Circuit breaker: tras MH_CIRCUITO_FALLOS fallos seguidos el circuito se
+  abre y durante MH_CIRCUITO_SEGUNDOS no se envía nada (`CircuitoAbierto`);
+  luego pasa una sola petición de prueba y, si responde, se cierra.
+
+Si el Ministerio no responde, los DTE quedan en contingencia y se
+transmiten después en lotes (contingencia.py).
+
+Sin MH_URL se simula la aprobación en el mismo proceso. Para pruebas de
+carga sin el servicio real: `python manage.py mh_simulado` y
+MH_URL=http://127.0.0.1:8765.
+"""
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+RUTA_AUTH = '/seguridad/auth'
+RUTA_RECEPCION = '/fesv/recepciondte'
+RUTA_LOTE = '/fesv/recepcionlote'
+RUTA_CONSULTA_LOTE = '/fesv/recepcion/consultadtelote/'
+
+
+class ErrorMH(Exception):
+    """Error de transmisión; `reintentable` indica si vale la pena repetir."""
+
+    def __init__(self, mensaje, reintentable=True):
+        super().__init__(mensaje)
+        self.reintentable = reintentable
+
+
+class DocumentoRechazado(ErrorMH):
+    """El Ministerio rechazó el documento (no se reintenta)."""
+
+    def __init__(self, mensaje, observaciones=None):
+        super().__init__(mensaje, reintentable=False)
+        self.observaciones = observaciones or []
+
+
+class CircuitoAbierto(ErrorMH):
+    """El circuito está abierto: no se intentó la transmisión."""
+
+    def __init__(self, segundos):
+        super().__init__(f"Ministerio de Hacienda no disponible; reintento en {segundos:.0f} s.")
+        self.segundos = segundos
+
+
+# ======================================================
+# ⚡ CIRCUIT BREAKER
+# ======================================================
+class Circuito:
+    """Cerrado → abierto tras `umbral` fallos seguidos → semiabierto tras `espera` s."""
+
+    def __init__(self, umbral, espera):
+        self.umbral = umbral
+        self.espera = espera
+        self.fallos = 0
+        self.abierto_hasta = 0.0
+        self.probando = False
+        self._candado = threading.Lock()
+
+    @property
+    def estado(self):
+        if self.fallos < self.umbral:
+            return 'cerrado'
+        return 'abierto' if time.monotonic() < self.abierto_hasta else 'semiabierto'
+
+    def permitir(self):
+        """Lanza CircuitoAbierto si no se debe enviar ahora."""
+        with self._candado:
+            if self.fallos < self.umbral:
+                return
+            restante = self.abierto_hasta - time.monotonic()
+            if restante > 0:
+                raise CircuitoAbierto(restante)
+            if self.probando:
+                # Ya hay una petición de prueba en curso
+                raise CircuitoAbierto(self.espera)
+            self.probando = True
+
+    def exito(self):
+        with self._candado:
+            self.fallos = 0
+            self.probando = False
+
+    def fallo(self):
+        with self._candado:
+            self.fallos += 1
+            self.probando = False
+            if self.fallos >= self.umbral:
+                self.abierto_hasta = time.monotonic() + self.espera
+
+
+# ======================================================
+# 🌐 CLIENTE
+# ======================================================
+class ClienteMH:
+
+    def __init__(self, url, usuario, clave, ambiente='00'):
+        self.url = url.rstrip('/')
+        self.usuario = usuario
+        self.clave = clave
+        self.ambiente = ambiente
+        self.timeout = (settings.MH_TIMEOUT_CONEXION, settings.MH_TIMEOUT_LECTURA)
+        self.reintentos = settings.MH_REINTENTOS
+        self.circuito = Circuito(settings.MH_CIRCUITO_FALLOS, settings.MH_CIRCUITO_SEGUNDOS)
+
+        self.sesion = requests.Session()
+        # Los reintentos los controla el cliente (backoff + circuito), no urllib3
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=settings.MH_POOL, max_retries=0)
+        self.sesion.mount('http://', adaptador)
+        self.sesion.mount('https://', adaptador)
+        self.sesion.headers.update({'User-Agent': 'OMNIGEST/1.0', 'Accept': 'application/json'})
+
+    # ---------- Token ----------
+    @property
+    def _clave_cache(self):
+        return f"mh:token:{self.url}:{self.usuario}"
+
+    def token(self, renovar=False):
+        """Token de autenticación (cacheado hasta MH_TOKEN_SEGUNDOS)."""
+        if not renovar:
+            token = cache.get(self._clave_cache)
+            if token:
+                return token
+        respuesta = self.sesion.post(
+            self.url + RUTA_AUTH,
+            data={'user': self.usuario, 'pwd': self.clave},
+            timeout=self.timeout,
+        )
+        if respuesta.status_code >= 500:
+            raise ErrorMH(f"Autenticación MH: HTTP {respuesta.status_code}")
+        datos = respuesta.json() if respuesta.content else {}
+        if respuesta.status_code != 200 or datos.get('status') != 'OK':
+            raise ErrorMH(f"Autenticación MH rechazada: {datos.get('message', respuesta.status_code)}",
+                          reintentable=False)
+        token = datos['body']['token']
+        cache.set(self._clave_cache, token, settings.MH_TOKEN_SEGUNDOS)
+        return token
+
+    # ---------- Recepción ----------
+    def transmitir(self, documento, tipo_dte, codigo_generacion, version=1):
+        """
+        Envía el documento y devuelve la respuesta del Ministerio
+        (con `codigoGeneracion` y `selloRecibido`).
+        """
+        envio = {
+            'ambiente': self.ambiente,
+            'idEnvio': 1,
+            'version': version,
+            'tipoDte': tipo_dte,
+            'documento': documento,
+            'codigoGeneracion': codigo_generacion,
+        }
+        return self._solicitar('post', RUTA_RECEPCION, self._resultado, json=envio)
+
+    def enviar_lote(self, documentos, nit_emisor, id_envio, version=1):
+        """
+        Envía un lote de documentos (contingencia); devuelve el código de lote
+        con el que se consultan los resultados.
+        """
+        envio = {
+            'ambiente': self.ambiente,
+            'idEnvio': id_envio,
+            'version': version,
+            'nitEmisor': nit_emisor,
+            'documentos': documentos,
+        }
+        return self._solicitar('post', RUTA_LOTE, self._lote_recibido, json=envio)
+
+    def consultar_lote(self, codigo_lote):
+        """Resultados del lote: {'procesados': [...], 'rechazados': [...]}."""
+        return self._solicitar('get', RUTA_CONSULTA_LOTE + codigo_lote, self._datos)
+
+    def _solicitar(self, metodo, ruta, leer, **kwargs):
+        """Petición autenticada con reintentos, renovación del token y circuito."""
+        self.circuito.permitir()
+        intento = 0
+        renovado = False
+        while True:
+            try:
+                respuesta = self._enviar(metodo, ruta, renovar=False, **kwargs)
+                if respuesta.status_code == 401 and not renovado:
+                    # Token vencido o revocado: se pide uno nuevo una sola vez
+                    renovado = True
+                    respuesta = self._enviar(metodo, ruta, renovar=True, **kwargs)
+                resultado = leer(respuesta)
+            except DocumentoRechazado:
+                # El servicio respondió: el circuito no cuenta el rechazo como fallo
+                self.circuito.exito()
+                raise
+            except (requests.RequestException, ValueError, ErrorMH) as e:
+                error = e if isinstance(e, ErrorMH) else ErrorMH(f"Transmisión MH: {e}")
+                if not error.reintentable:
+                    self.circuito.exito()
+                    raise error
+                if intento >= self.reintentos:
+                    self.circuito.fallo()
+                    raise error
+                time.sleep(self._espera(intento))
+                intento += 1
+                continue
+            self.circuito.exito()
+            return resultado
+
+    def _enviar(self, metodo, ruta, renovar, **kwargs):
+        return self.sesion.request(
+            metodo, self.url + ruta,
+            headers={'Authorization': self.token(renovar=renovar)},
+            timeout=self.timeout,
+            **kwargs,
+        )
+
+    def _datos(self, respuesta):
+        if respuesta.status_code == 429 or respuesta.status_code >= 500:
+            raise ErrorMH(f"MH respondió HTTP {respuesta.status_code}")
+        if respuesta.status_code == 401:
+            raise ErrorMH("MH rechazó el token de autenticación", reintentable=False)
+        return respuesta.json()
+
+    def _resultado(self, respuesta):
+        datos = self._datos(respuesta)
+        if respuesta.status_code != 200 or datos.get('estado') != 'PROCESADO':
+            raise DocumentoRechazado(
+                f"MH rechazó el DTE: {datos.get('descripcionMsg') or respuesta.status_code}",
+                datos.get('observaciones'),
+            )
+        return datos
+
+    def _lote_recibido(self, respuesta):
+        datos = self._datos(respuesta)
+        if respuesta.status_code != 200 or not datos.get('codigoLote'):
+            raise DocumentoRechazado(
+                f"MH rechazó el lote: {datos.get('descripcionMsg') or respuesta.status_code}",
+                datos.get('observaciones'),
+            )
+        return datos['codigoLote']
+
+    @staticmethod
+    def _espera(intento):
+        # Jitter completo: entre 0 y base·2^intento (con tope)
+        return random.uniform(0, min(settings.MH_ESPERA_MAXIMA, settings.MH_ESPERA_BASE * 2 ** intento))
+
+
+_cliente = None
+_candado = threading.Lock()
+
+
+def cliente():
+    """Cliente MH reutilizado por todo el proceso (None si no hay MH_URL)."""
+    global _cliente
+    if not settings.MH_URL:
+        return None
+    with _candado:
+        if _cliente is None:
+            _cliente = ClienteMH(settings.MH_URL, settings.MH_USUARIO, settings.MH_CLAVE, settings.MH_AMBIENTE)
+    return _cliente
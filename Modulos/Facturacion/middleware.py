@@ -0,0 +1,130 @@
+# ======================================================
+# 🏢 CONTEXTO DEL USUARIO (perfil, rol y empresa por petición)
+# ======================================================
+"""
+Carga una sola vez por petición el `Perfil` del usuario con su empresa y lo
+deja en:
+
+- `request.perfil`: el Perfil (o None si el usuario no tiene).
+- `request.tenant`: la Empresa del perfil (o None).
+- `request.rol`: el rol del perfil (o None).
+
+También queda en `request.user.perfil`, así el código que ya usaba ese
+atributo no hace otra consulta, y la empresa se activa en
+`empresa_actual` durante la petición para los managers `por_empresa`
+(sin empresa, todas solo para el superusuario y el Administrador).
+
+El perfil se guarda en la caché de Django con una clave versionada:
+`contexto:<versión>:<user_id>`. Al cambiar un Perfil se borra solo la
+clave de ese usuario. Al cambiar una Empresa se sube la versión y todas
+las claves anteriores quedan sin uso (ver signals.py).
+
+Con la caché por proceso (LocMem) cada worker tiene su copia y la
+invalidación solo llega al que guardó el cambio, por eso las entradas
+vencen a los CONTEXTO_CACHE_SEGUNDOS: 5 por defecto con LocMem, 300 con una
+caché compartida (REDIS_URL en settings), que es la indicada con varios
+workers.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import replicas
+from .empresa_actual import activar, desactivar
+from .models import Perfil
+
+CLAVE_VERSION = 'contexto:version'
+_SIN_PERFIL = 'sin-perfil'
+
+
+def _version():
+    return cache.get_or_set(CLAVE_VERSION, 1, None)
+
+
+def _clave(user_id, version=None):
+    return f'contexto:{version or _version()}:{user_id}'
+
+
+def cargar_perfil(user):
+    """Perfil (con empresa) del usuario, desde la caché o con una sola consulta."""
+    clave = _clave(user.pk)
+    perfil = cache.get(clave)
+    if perfil is None:
+        perfil = Perfil.objects.select_related('empresa').filter(user_id=user.pk).first()
+        cache.set(clave, perfil or _SIN_PERFIL, settings.CONTEXTO_CACHE_SEGUNDOS)
+    return None if perfil == _SIN_PERFIL else perfil
+
+
+def invalidar_usuario(user_id):
+    cache.delete(_clave(user_id))
+
+
+def invalidar_empresas():
+    """Una empresa cambió: descarta el contexto cacheado de todos los usuarios."""
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        # La versión ya no estaba en la caché: empezar una nueva
+        cache.set(CLAVE_VERSION, _version() + 1, None)
+
+
+class ContextoUsuarioMiddleware:
+    """Debe ir después de AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        perfil = None
+        if request.user.is_authenticated:
+            perfil = cargar_perfil(request.user)
+            if perfil is not None:
+                # Enlaza el perfil cacheado al usuario de esta petición (y viceversa)
+                request.user.perfil = perfil
+
+        request.perfil = perfil
+        request.tenant = perfil.empresa if perfil else None
+        request.rol = perfil.rol if perfil else None
+
+        # Sin empresa, solo el superusuario y el Administrador ven todas;
+        # cualquier otro usuario no ve datos de ninguna empresa
+        todas = request.tenant is None and (request.user.is_superuser or request.rol == 'Administrador')
+        tokens = activar(
+            request.tenant.id if request.tenant else None,
+            request.tenant.base_datos if request.tenant else None,
+            todas,
+        )
+        try:
+            return self.get_response(request)
+        finally:
+            desactivar(tokens)
+
+
+# ======================================================
+# 📚 LEER LO QUE UNO MISMO ESCRIBIÓ (réplica de lectura)
+# ======================================================
+class ReplicaMiddleware:
+    """
+    Debe ir después de SessionMiddleware. Solo se usa si hay réplica.
+    Una sesión que escribió en la base principal lee de ella (no de la
+    réplica) durante REPLICA_RETRASO_SEGUNDOS; ver replicas.py.
+    """
+    CLAVE_SESION = 'replica_ultima_escritura'
+
+    def __init__(self, get_response):
+        if replicas.ALIAS not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        ultima = request.session.get(self.CLAVE_SESION, 0)
+        token = replicas.iniciar_peticion(time.time() - ultima < settings.REPLICA_RETRASO_SEGUNDOS)
+        try:
+            respuesta = self.get_response(request)
+        finally:
+            escribio = replicas.terminar_peticion(token)
+        if escribio:
+            request.session[self.CLAVE_SESION] = time.time()
+        return respuesta
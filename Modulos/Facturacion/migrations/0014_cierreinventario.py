@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Facturacion', '0013_trabajoemision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierreInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('entradas', models.IntegerField(default=0)),
+                ('salidas', models.IntegerField(default=0)),
+                ('saldo', models.IntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='inventario',
+            index=models.Index(fields=['producto', 'fecha'], name='inventario_producto_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventario',
+            index=models.Index(fields=['fecha'], name='inventario_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='cierreinventario',
+            name='producto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cierres_inventario', to='Facturacion.producto'),
+        ),
+        migrations.AddIndex(
+            model_name='cierreinventario',
+            index=models.Index(fields=['fecha'], name='cierre_fecha_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cierreinventario',
+            constraint=models.UniqueConstraint(fields=('producto', 'fecha'), name='cierre_producto_fecha_unico'),
+        ),
+    ]
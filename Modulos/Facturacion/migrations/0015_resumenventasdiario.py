@@ -0,0 +1,81 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.timezone import localdate
+
+
+def poblar_resumen(apps, schema_editor):
+    """Genera el resumen diario a partir de los DTE activos existentes."""
+    DTE = apps.get_model('Facturacion', 'DTE')
+    ResumenVentasDiario = apps.get_model('Facturacion', 'ResumenVentasDiario')
+    alias = schema_editor.connection.alias
+
+    dias = {}
+    dtes = (
+        DTE.objects.using(alias).filter(estado='Activo')
+        .order_by('fecha_emision', 'id')
+        .values_list('empresa_id', 'tipo_dte', 'fecha_emision', 'numero_control', 'subtotal', 'iva', 'total')
+    )
+    for empresa_id, tipo, fecha, numero, subtotal, iva, total in dtes.iterator(chunk_size=2000):
+        clave = (empresa_id, tipo, localdate(fecha))
+        dia = dias.get(clave)
+        if dia is None:
+            dia = dias[clave] = ResumenVentasDiario(
+                empresa_id=empresa_id, tipo_dte=tipo, fecha=clave[2], emitido_del=numero,
+            )
+        dia.cantidad += 1
+        dia.subtotal += subtotal
+        dia.iva += iva
+        dia.total += total
+        dia.emitido_al = numero
+
+    ResumenVentasDiario.objects.using(alias).bulk_create(dias.values(), batch_size=1000)
+
+
+def vaciar_resumen(apps, schema_editor):
+    apps.get_model('Facturacion', 'ResumenVentasDiario').objects.using(schema_editor.connection.alias).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Facturacion', '0014_cierreinventario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenVentasDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_dte', models.CharField(choices=[('01', 'Factura'), ('03', 'Comprobante de Crédito Fiscal'), ('05', 'Nota de Crédito'), ('06', 'Nota de Débito'), ('07', 'Retención'), ('11', 'Liquidación')], max_length=2)),
+                ('fecha', models.DateField()),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('iva', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('emitido_del', models.CharField(blank=True, max_length=50, null=True)),
+                ('emitido_al', models.CharField(blank=True, max_length=50, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dte',
+            index=models.Index(fields=['empresa', 'tipo_dte', 'fecha_emision'], name='dte_empresa_tipo_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='resumenventasdiario',
+            name='empresa',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_ventas', to='Facturacion.empresa'),
+        ),
+        migrations.AddIndex(
+            model_name='resumenventasdiario',
+            index=models.Index(fields=['tipo_dte', '-fecha'], name='resumen_tipo_fecha_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumenventasdiario',
+            constraint=models.UniqueConstraint(fields=('empresa', 'tipo_dte', 'fecha'), name='resumen_empresa_tipo_fecha_unico'),
+        ),
+        migrations.RunPython(poblar_resumen, vaciar_resumen),
+    ]
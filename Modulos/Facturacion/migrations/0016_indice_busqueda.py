@@ -0,0 +1,31 @@
+from django.db import migrations
+
+from Modulos.Facturacion import busqueda
+
+
+def crear_indice(apps, schema_editor):
+    """Crea el índice de texto completo (FTS5 / tsvector) y lo llena con los datos existentes."""
+    if schema_editor.connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    busqueda.crear_tabla(schema_editor.connection)
+    busqueda.reconstruir(busqueda.tablas_de({
+        'cliente': apps.get_model('Facturacion', 'Cliente'),
+        'proveedor': apps.get_model('Facturacion', 'Proveedor'),
+        'producto': apps.get_model('Facturacion', 'Producto'),
+        'dte': apps.get_model('Facturacion', 'DTE'),
+    }), using=schema_editor.connection.alias)
+
+
+def eliminar_indice(apps, schema_editor):
+    busqueda.eliminar_tabla(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Facturacion', '0015_resumenventasdiario'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
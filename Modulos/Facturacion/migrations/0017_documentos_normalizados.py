@@ -0,0 +1,76 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:16
+
+from django.db import migrations, models
+
+DOCUMENTOS = {
+    'Empresa': ('nit', 'nrc'),
+    'Cliente': ('nit', 'dui', 'nrc'),
+    'Proveedor': ('nit', 'nrc'),
+}
+
+
+def _digitos(valor):
+    return ''.join(c for c in (valor or '') if c.isdigit())
+
+
+def normalizar_documentos(apps, schema_editor):
+    """Llena las columnas `*_normalizado` de los registros existentes."""
+    alias = schema_editor.connection.alias
+    for nombre, campos in DOCUMENTOS.items():
+        Modelo = apps.get_model('Facturacion', nombre)
+        normalizados = [f'{campo}_normalizado' for campo in campos]
+        pendientes = []
+        for fila in Modelo.objects.using(alias).only('id', *campos).iterator(chunk_size=2000):
+            for campo in campos:
+                setattr(fila, f'{campo}_normalizado', _digitos(getattr(fila, campo)))
+            pendientes.append(fila)
+            if len(pendientes) >= 1000:
+                Modelo.objects.using(alias).bulk_update(pendientes, normalizados)
+                pendientes = []
+        Modelo.objects.using(alias).bulk_update(pendientes, normalizados)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Facturacion', '0016_indice_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='dui_normalizado',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='nit_normalizado',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='nrc_normalizado',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='nit_normalizado',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='nrc_normalizado',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='proveedor',
+            name='nit_normalizado',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='proveedor',
+            name='nrc_normalizado',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(normalizar_documentos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:18
+
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _normalizar(valor):
+    descompuesto = unicodedata.normalize('NFKD', valor or '')
+    return ' '.join(''.join(c for c in descompuesto if not unicodedata.combining(c)).lower().split())
+
+
+def normalizar_nombres(apps, schema_editor):
+    """Llena `nombre_normalizado` de los clientes existentes."""
+    Cliente = apps.get_model('Facturacion', 'Cliente')
+    alias = schema_editor.connection.alias
+    pendientes = []
+    for cliente in Cliente.objects.using(alias).only('id', 'nombre').iterator(chunk_size=2000):
+        cliente.nombre_normalizado = _normalizar(cliente.nombre)
+        pendientes.append(cliente)
+        if len(pendientes) >= 1000:
+            Cliente.objects.using(alias).bulk_update(pendientes, ['nombre_normalizado'])
+            pendientes = []
+    Cliente.objects.using(alias).bulk_update(pendientes, ['nombre_normalizado'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Facturacion', '0017_documentos_normalizados'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='nombre_normalizado',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=120),
+        ),
+        migrations.AddIndex(
+            model_name='dte',
+            index=models.Index(fields=['cliente', '-fecha_emision'], name='dte_cliente_fecha_idx'),
+        ),
+        migrations.RunPython(normalizar_nombres, migrations.RunPython.noop),
+    ]
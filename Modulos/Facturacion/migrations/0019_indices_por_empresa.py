@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def asignar_empresa_unica(apps, schema_editor):
+    """
+    Registros antiguos sin empresa: si la base tiene una sola empresa se le
+    asignan, para que sigan apareciendo en los listados filtrados por empresa.
+    Con varias empresas no se puede deducir y se dejan como están.
+    """
+    alias = schema_editor.connection.alias
+    Empresa = apps.get_model('Facturacion', 'Empresa')
+    empresas = list(Empresa.objects.using(alias).values_list('id', flat=True)[:2])
+    if len(empresas) != 1:
+        return
+    for nombre in ('Cliente', 'Producto', 'Proveedor', 'Compra'):
+        apps.get_model('Facturacion', nombre).objects.using(alias).filter(empresa__isnull=True).update(empresa_id=empresas[0])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Facturacion', '0018_autocompletar_dte'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='dte',
+            name='dte_empresa_tipo_fecha_idx',
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['empresa', 'nombre_normalizado'], name='cliente_empresa_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compra',
+            index=models.Index(fields=['empresa', 'fecha', 'id'], name='compra_empresa_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dte',
+            index=models.Index(fields=['empresa', 'fecha_emision', 'id'], name='dte_empresa_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dte',
+            index=models.Index(fields=['empresa', 'tipo_dte', 'estado', 'fecha_emision'], name='dte_emp_tipo_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['empresa', 'codigo', 'id'], name='producto_empresa_codigo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='proveedor',
+            index=models.Index(fields=['empresa', 'nombre'], name='proveedor_empresa_nombre_idx'),
+        ),
+        migrations.RunPython(asignar_empresa_unica, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Facturacion', '0019_indices_por_empresa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresa',
+            name='base_datos',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Facturacion', '0020_empresa_base_datos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Secuencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('serie', models.CharField(max_length=40)),
+                ('siguiente', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='codigo_establecimiento',
+            field=models.CharField(default='M001', max_length=4),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='codigo_punto_venta',
+            field=models.CharField(default='P001', max_length=4),
+        ),
+        migrations.AlterField(
+            model_name='dte',
+            name='numero_control',
+            field=models.CharField(blank=True, db_index=True, max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='dte',
+            constraint=models.UniqueConstraint(fields=('empresa', 'numero_control'), name='dte_empresa_numero_control_uniq'),
+        ),
+        migrations.AddField(
+            model_name='secuencia',
+            name='empresa',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='Facturacion.empresa'),
+        ),
+        migrations.AddConstraint(
+            model_name='secuencia',
+            constraint=models.UniqueConstraint(fields=('empresa', 'serie'), name='secuencia_empresa_serie_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='secuencia',
+            constraint=models.UniqueConstraint(condition=models.Q(('empresa__isnull', True)), fields=('serie',), name='secuencia_serie_sin_empresa_uniq'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def marcar_procesados(apps, schema_editor):
+    """Los DTE que ya tienen sello quedaron aprobados por el Ministerio."""
+    DTE = apps.get_model('Facturacion', 'DTE')
+    DTE.objects.using(schema_editor.connection.alias).filter(
+        sello_recepcion__isnull=False,
+    ).exclude(sello_recepcion='').update(estado_mh='Procesado')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Facturacion', '0021_secuencias'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dte',
+            name='estado_mh',
+            field=models.CharField(choices=[('Pendiente', 'Pendiente'), ('Procesado', 'Procesado'), ('Contingencia', 'Contingencia'), ('Rechazado', 'Rechazado')], default='Pendiente', max_length=12),
+        ),
+        migrations.CreateModel(
+            name='LoteContingencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('Pendiente', 'Pendiente'), ('Enviado', 'Enviado'), ('Completado', 'Completado'), ('Error', 'Error')], default='Pendiente', max_length=12)),
+                ('codigo_lote', models.CharField(blank=True, max_length=100, null=True)),
+                ('documentos', models.PositiveIntegerField(default=0)),
+                ('procesados', models.PositiveIntegerField(default=0)),
+                ('rechazados', models.PositiveIntegerField(default=0)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Facturacion.empresa')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='dte',
+            name='lote_contingencia',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='dtes', to='Facturacion.lotecontingencia'),
+        ),
+        migrations.AddIndex(
+            model_name='dte',
+            index=models.Index(fields=['estado_mh', 'lote_contingencia'], name='dte_estado_mh_lote_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lotecontingencia',
+            index=models.Index(fields=['estado', 'id'], name='lote_estado_idx'),
+        ),
+        migrations.RunPython(marcar_procesados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Facturacion', '0022_contingencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dte',
+            name='qr_svg',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='dte',
+            name='qr_texto',
+            field=models.CharField(blank=True, default='', editable=False, max_length=120),
+        ),
+    ]
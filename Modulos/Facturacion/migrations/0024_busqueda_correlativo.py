@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from Modulos.Facturacion import busqueda
+
+
+def reindexar(apps, schema_editor):
+    """El texto de los DTE ahora incluye el correlativo sin ceros."""
+    if schema_editor.connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    busqueda.reconstruir(busqueda.tablas_de({
+        'cliente': apps.get_model('Facturacion', 'Cliente'),
+        'proveedor': apps.get_model('Facturacion', 'Proveedor'),
+        'producto': apps.get_model('Facturacion', 'Producto'),
+        'dte': apps.get_model('Facturacion', 'DTE'),
+    }), using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Facturacion', '0023_qr_dte'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindexar, migrations.RunPython.noop),
+    ]
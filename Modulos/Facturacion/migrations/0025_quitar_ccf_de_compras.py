@@ -0,0 +1,63 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import migrations
+from django.utils.timezone import localdate, make_aware
+
+from Modulos.Facturacion import busqueda
+
+# registrar_compra creaba un CCF espejo por cada compra, con este prefijo
+PREFIJO_COMPRA = 'Compra a proveedor: '
+
+
+def quitar_ccf_de_compras(apps, schema_editor):
+    """
+    Borra los CCF espejo de las compras (ya están en Compra) y recalcula los
+    días del resumen de ventas en que aparecían.
+    """
+    DTE = apps.get_model('Facturacion', 'DTE')
+    ResumenVentasDiario = apps.get_model('Facturacion', 'ResumenVentasDiario')
+    alias = schema_editor.connection.alias
+
+    espejos = DTE.objects.using(alias).filter(tipo_dte='03', codigo_generacion__startswith=PREFIJO_COMPRA)
+    filas = list(espejos.values_list('id', 'empresa_id', 'fecha_emision'))
+    if not filas:
+        return
+    espejos.delete()
+    for dte_id, _, _ in filas:
+        busqueda.quitar('dte', dte_id, using=alias)
+
+    for empresa_id, fecha in {(empresa_id, localdate(fecha)) for _, empresa_id, fecha in filas}:
+        inicio = make_aware(datetime.combine(fecha, time.min))
+        dia = list(
+            DTE.objects.using(alias)
+            .filter(
+                empresa_id=empresa_id, tipo_dte='03', estado='Activo',
+                fecha_emision__gte=inicio, fecha_emision__lt=inicio + timedelta(days=1),
+            )
+            .order_by('fecha_emision', 'id')
+            .values_list('numero_control', 'subtotal', 'iva', 'total')
+        )
+        resumen = ResumenVentasDiario.objects.using(alias).filter(empresa_id=empresa_id, tipo_dte='03', fecha=fecha)
+        if not dia:
+            resumen.delete()
+            continue
+        resumen.update(
+            cantidad=len(dia),
+            subtotal=sum((d[1] for d in dia), Decimal('0.00')),
+            iva=sum((d[2] for d in dia), Decimal('0.00')),
+            total=sum((d[3] for d in dia), Decimal('0.00')),
+            emitido_del=dia[0][0],
+            emitido_al=dia[-1][0],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Facturacion', '0024_busqueda_correlativo'),
+    ]
+
+    operations = [
+        migrations.RunPython(quitar_ccf_de_compras, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,126 @@
-from django.db import models
+import threading
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import F, Q, Sum, Count, Value
+from django.db.models.functions import Coalesce, Round
 from django.contrib.auth.models import User
-from django.utils.timezone import now
-from decimal import Decimal
-from django.db.models.signals import post_save
+from django.utils.timezone import now, localdate, make_aware
+from decimal import Decimal, ROUND_HALF_UP
+from .empresa_actual import empresa_actual, todas_las_empresas
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+TASA_IVA = Decimal('0.13')
+CENTAVO = Decimal('0.01')
+
+
+def redondear(valor):
+    """Importe a centavos, medio centavo hacia arriba."""
+    return Decimal(str(valor or 0)).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+
+def calcular_iva(subtotal):
+    """IVA de un subtotal. Todo cálculo de IVA pasa por aquí (DTE, resumen, vistas, lotes)."""
+    return redondear(redondear(subtotal) * TASA_IVA)
+
+
+# ======================================================
+# 🏢 MANAGER POR EMPRESA (multi-empresa)
+# ======================================================
+class PorEmpresaManager(models.Manager):
+    """
+    `Modelo.por_empresa`: filas de la empresa activa (ver empresa_actual.py).
+    Sin empresa activa no devuelve nada, salvo que se hayan pedido todas.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        empresa_id = empresa_actual()
+        if empresa_id is not None:
+            return queryset.filter(empresa_id=empresa_id)
+        return queryset if todas_las_empresas() else queryset.none()
+
+
+# ======================================================
+# 🔢 DOCUMENTOS NORMALIZADOS (NIT / DUI / NRC)
+# ======================================================
+MINIMO_DIGITOS_DOCUMENTO = 5
+
+
+def solo_digitos(valor):
+    """'0614-123456-101-2' → '06141234561012'"""
+    return ''.join(c for c in (valor or '') if c.isdigit())
+
+
+def parece_documento(texto):
+    """True si el texto es un número de documento (solo dígitos, guiones y espacios)."""
+    texto = (texto or '').strip()
+    return (
+        len(solo_digitos(texto)) >= MINIMO_DIGITOS_DOCUMENTO
+        and all(c.isdigit() or c in '- ' for c in texto)
+    )
+
+
+def normalizar_texto(valor):
+    """'  José   MARTÍNEZ ' → 'jose martinez' (minúsculas, sin acentos, espacios simples)."""
+    descompuesto = unicodedata.normalize('NFKD', valor or '')
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_acentos.lower().split())
+
+
+def _campo_normalizado():
+    return models.CharField(max_length=20, blank=True, default='', editable=False, db_index=True)
+
+
+class ConDocumentos(models.Model):
+    """
+    Base para modelos con NIT/DUI/NRC: mantiene una columna `<campo>_normalizado`
+    (solo dígitos, indexada) por cada campo de `CAMPOS_DOCUMENTO`, para buscar
+    por igualdad sin importar guiones ni espacios.
+    """
+    CAMPOS_DOCUMENTO = ()
+
+    class Meta:
+        abstract = True
+
+    def normalizar_documentos(self):
+        for campo in self.CAMPOS_DOCUMENTO:
+            setattr(self, f'{campo}_normalizado', solo_digitos(getattr(self, campo)))
+
+    def save(self, *args, **kwargs):
+        self.normalizar_documentos()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {
+                f'{campo}_normalizado' for campo in self.CAMPOS_DOCUMENTO if campo in update_fields
+            }
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def por_documento(cls, valor, queryset=None):
+        """
+        Coincidencia exacta (por dígitos) en cualquiera de los documentos,
+        dentro de la empresa activa si el modelo tiene `por_empresa`.
+        """
+        digitos = solo_digitos(valor)
+        if queryset is None:
+            queryset = getattr(cls, 'por_empresa', cls.objects).all()
+        if not digitos:
+            return queryset.none()
+        filtro = Q()
+        for campo in cls.CAMPOS_DOCUMENTO:
+            filtro |= Q(**{f'{campo}_normalizado': digitos})
+        return queryset.filter(filtro)
+
+
 # ======================================================
 # MODELO EMPRESA
 # ======================================================
-class Empresa(models.Model):
+class Empresa(ConDocumentos):
+    CAMPOS_DOCUMENTO = ('nit', 'nrc')
+
     nombre = models.CharField(max_length=120)
     nit = models.CharField(max_length=20, unique=True)
     nrc = models.CharField(max_length=20, unique=True)
@@ -17,6 +129,13 @@ class Empresa(models.Model):
     correo = models.EmailField(blank=True, null=True)
     actividad_economica = models.CharField(max_length=150, blank=True, null=True)
     representante_legal = models.CharField(max_length=100, blank=True, null=True)
+    # Alias de DATABASES donde viven sus clientes, productos, DTE... ('' = base principal)
+    base_datos = models.CharField(max_length=50, blank=True, default='')
+    # Códigos MH del establecimiento y punto de venta (parte central del número de control)
+    codigo_establecimiento = models.CharField(max_length=4, default='M001')
+    codigo_punto_venta = models.CharField(max_length=4, default='P001')
+    nit_normalizado = _campo_normalizado()
+    nrc_normalizado = _campo_normalizado()
 
     def __str__(self):
         return self.nombre
@@ -58,7 +177,9 @@ def crear_perfil_automatico(sender, instance, created, **kwargs):
 # ======================================================
 # MODELO CLIENTE
 # ======================================================
-class Cliente(models.Model):
+class Cliente(ConDocumentos):
+    CAMPOS_DOCUMENTO = ('nit', 'dui', 'nrc')
+
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, null=True, blank=True)
     nombre = models.CharField(max_length=120)
     dui = models.CharField(max_length=10, blank=True, null=True) 
@@ -67,10 +188,30 @@ class Cliente(models.Model):
     direccion = models.TextField()
     correo = models.EmailField(blank=True, null=True)
     telefono = models.CharField(max_length=20, blank=True, null=True)
+    nit_normalizado = _campo_normalizado()
+    dui_normalizado = _campo_normalizado()
+    nrc_normalizado = _campo_normalizado()
+    # Nombre en minúsculas y sin acentos: búsquedas por prefijo con índice (autocompletar)
+    nombre_normalizado = models.CharField(max_length=120, blank=True, default='', editable=False, db_index=True)
+
+    objects = models.Manager()
+    por_empresa = PorEmpresaManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['empresa', 'nombre_normalizado'], name='cliente_empresa_nombre_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
 
+    def save(self, *args, **kwargs):
+        self.nombre_normalizado = normalizar_texto(self.nombre)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'nombre' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'nombre_normalizado'}
+        super().save(*args, **kwargs)
+
     @property
     def nombre_cliente(self):
         return self.nombre or "Cliente sin nombre"
@@ -87,6 +228,14 @@ class Producto(models.Model):
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
     inventario = models.IntegerField(default=0, editable=False)
 
+    objects = models.Manager()
+    por_empresa = PorEmpresaManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['empresa', 'codigo', 'id'], name='producto_empresa_codigo_idx'),
+        ]
+
     def __str__(self):
         return f"{self.descripcion} (${self.precio_unitario})"
 
@@ -94,7 +243,9 @@ class Producto(models.Model):
 # ======================================================
 # MODELO PROVEEDOR
 # ======================================================
-class Proveedor(models.Model):
+class Proveedor(ConDocumentos):
+    CAMPOS_DOCUMENTO = ('nit', 'nrc')
+
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, null=True, blank=True)
     nombre = models.CharField(max_length=120)
     nit = models.CharField(max_length=20, unique=True)
@@ -103,6 +254,16 @@ class Proveedor(models.Model):
     telefono = models.CharField(max_length=20, blank=True, null=True)
     correo = models.EmailField(blank=True, null=True)
     representante = models.CharField(max_length=100, blank=True, null=True)
+    nit_normalizado = _campo_normalizado()
+    nrc_normalizado = _campo_normalizado()
+
+    objects = models.Manager()
+    por_empresa = PorEmpresaManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['empresa', 'nombre'], name='proveedor_empresa_nombre_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -124,12 +285,20 @@ class DTE(models.Model):
         ('Activo', 'Activo'),
         ('Anulado', 'Anulado'),
     ]
+    # Transmisión al Ministerio (independiente de `estado`, que alimenta los libros)
+    ESTADOS_MH = [
+        ('Pendiente', 'Pendiente'),
+        ('Procesado', 'Procesado'),
+        ('Contingencia', 'Contingencia'),
+        ('Rechazado', 'Rechazado'),
+    ]
 
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE)
     cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE)
     usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     tipo_dte = models.CharField(max_length=2, choices=TIPO_DTE_CHOICES, default='01')
-    numero_control = models.CharField(max_length=50, unique=True)
+    # Vacío al crear: DTE.save asigna el siguiente de la serie (secuencias.py)
+    numero_control = models.CharField(max_length=50, db_index=True, blank=True)
     fecha_emision = models.DateTimeField(auto_now_add=True)
     condicion_pago = models.CharField(max_length=20, default='Contado')
 
@@ -140,26 +309,280 @@ class DTE(models.Model):
     codigo_generacion = models.CharField(max_length=100, blank=True, null=True)
     sello_recepcion = models.CharField(max_length=150, blank=True, null=True)
     estado = models.CharField(max_length=10, choices=ESTADOS, default='Activo')
+    estado_mh = models.CharField(max_length=12, choices=ESTADOS_MH, default='Pendiente')
+    # Lote en el que se transmitió en contingencia (contingencia.py)
+    lote_contingencia = models.ForeignKey(
+        'LoteContingencia', on_delete=models.SET_NULL, null=True, blank=True, related_name='dtes'
+    )
+    # QR ya generado (qr.py) y el texto del que salió; fuera de los formularios y de la clave del PDF
+    qr_texto = models.CharField(max_length=120, blank=True, default='', editable=False)
+    qr_svg = models.TextField(blank=True, default='', editable=False)
+
+    # Campos que determinan el aporte del DTE al resumen diario de ventas
+    CAMPOS_RESUMEN = ('empresa_id', 'tipo_dte', 'fecha_emision', 'estado',
+                      'numero_control', 'subtotal', 'iva', 'total')
+
+    objects = models.Manager()
+    por_empresa = PorEmpresaManager()
+
+    class Meta:
+        indexes = [
+            # Listados por cursor (ORDEN_DTE = -fecha_emision, -id) dentro de una empresa
+            models.Index(fields=['empresa', 'fecha_emision', 'id'], name='dte_empresa_fecha_idx'),
+            # Libros, anexos y resumen diario: tipo y estado fijos, rango de fechas
+            models.Index(fields=['empresa', 'tipo_dte', 'estado', 'fecha_emision'], name='dte_emp_tipo_estado_fecha_idx'),
+            models.Index(fields=['cliente', '-fecha_emision'], name='dte_cliente_fecha_idx'),
+            # Documentos en contingencia aún sin lote
+            models.Index(fields=['estado_mh', 'lote_contingencia'], name='dte_estado_mh_lote_idx'),
+        ]
+        constraints = [
+            # Cada emisor numera sus propias series (formato MH)
+            models.UniqueConstraint(fields=['empresa', 'numero_control'], name='dte_empresa_numero_control_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.get_tipo_dte_display()} - {self.numero_control}"
 
+    def save(self, *args, **kwargs):
+        """Guarda el DTE y aplica al resumen diario de ventas la diferencia de su aporte."""
+        campos = kwargs.get('update_fields')
+        if campos is not None and not set(campos) & (set(self.CAMPOS_RESUMEN) | {'empresa'}):
+            super().save(*args, **kwargs)
+            return
+
+        # Los importes en memoria quedan iguales a los guardados (y a lo que suma el resumen)
+        self.subtotal, self.iva, self.total = redondear(self.subtotal), redondear(self.iva), redondear(self.total)
+        nuevo = self._state.adding
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(DTE, instance=self)):
+            if nuevo and not self.numero_control:
+                # En esta transacción: si el DTE no se guarda, el número no se pierde
+                from .secuencias import numero_control
+                self.numero_control = numero_control(self.empresa, self.tipo_dte)
+            # El aporte anterior se lee de la BD: la instancia puede estar desactualizada
+            antes = None if nuevo else aporte_resumen(
+                DTE.objects.select_for_update().filter(pk=self.pk).values(*self.CAMPOS_RESUMEN).first()
+            )
+            super().save(*args, **kwargs)
+            despues = aporte_resumen({campo: getattr(self, campo) for campo in self.CAMPOS_RESUMEN})
+            ResumenVentasDiario.ajustar(antes, despues, nuevo=nuevo)
+
     def actualizar_totales(self):
-        """Recalcula subtotal, IVA y total según los detalles."""
-        detalles = self.detalles.all()
-        subtotal = sum(d.total_item for d in detalles)
-        iva = subtotal * Decimal('0.13')
-        total = subtotal + iva
-        self.subtotal = subtotal
-        self.iva = iva
-        self.total = total
-        self.save()
+        """Recalcula subtotal, IVA y total según los detalles (suma en la base de datos)."""
+        DTE.recalcular_totales(self.pk)
+        self.refresh_from_db(fields=['subtotal', 'iva', 'total'])
+
+    @classmethod
+    def recalcular_totales(cls, dte_id):
+        """Recalcula los totales de un DTE con una sola consulta agregada."""
+        subtotal = redondear(DetalleDTE.objects.filter(dte_id=dte_id).aggregate(s=Sum('total_item'))['s'])
+        iva = calcular_iva(subtotal)
+        with transaction.atomic(using=router.db_for_write(cls)):
+            fila = cls.objects.select_for_update().filter(pk=dte_id)
+            antes = aporte_resumen(fila.values(*cls.CAMPOS_RESUMEN).first())
+            fila.update(subtotal=subtotal, iva=iva, total=subtotal + iva)
+            if antes is not None:
+                # Aporte nuevo con los importes tal como quedaron en la fila
+                ResumenVentasDiario.ajustar(antes, aporte_resumen(fila.values(*cls.CAMPOS_RESUMEN).first()))
+
+    @classmethod
+    def aplicar_delta(cls, dte_id, delta):
+        """
+        Suma `delta` al subtotal y recalcula IVA y total. Devuelve los
+        importes guardados (subtotal, iva, total), o None si no hubo cambio.
+        """
+        if not delta:
+            return None
+        with transaction.atomic(using=router.db_for_write(cls)):
+            fila = cls.objects.filter(pk=dte_id)
+            # La suma en la BD toma el bloqueo de escritura de la fila antes de leerla
+            if not fila.update(subtotal=F('subtotal') + delta):
+                return None
+            datos = fila.values(*cls.CAMPOS_RESUMEN).first()
+            # IVA con calcular_iva, no con ROUND en la BD (en SQLite sería aritmética flotante)
+            subtotal = redondear(datos['subtotal'])
+            iva = calcular_iva(subtotal)
+            fila.update(subtotal=subtotal, iva=iva, total=subtotal + iva)
+            # Aporte al resumen con los importes de la fila, antes y después
+            antes = aporte_resumen(dict(datos, subtotal=subtotal - delta))
+            if antes is not None:
+                ResumenVentasDiario.ajustar(antes, aporte_resumen(
+                    dict(datos, subtotal=subtotal, iva=iva, total=subtotal + iva)
+                ))
+        return subtotal, iva, subtotal + iva
 
     @property
     def nombre_cliente(self):
         return self.cliente.nombre_cliente
 
 
+# ======================================================
+# MODELO RESUMEN DIARIO DE VENTAS (libro de ventas)
+# ======================================================
+def aporte_resumen(datos):
+    """
+    Aporte de un DTE (dict con CAMPOS_RESUMEN) al resumen diario:
+    None si no existe o está anulado.
+    """
+    if not datos or datos['estado'] != 'Activo':
+        return None
+    return {
+        'empresa_id': datos['empresa_id'],
+        'tipo_dte': datos['tipo_dte'],
+        'fecha': localdate(datos['fecha_emision']),
+        'numero_control': datos['numero_control'],
+        'subtotal': Decimal(datos['subtotal'] or 0),
+        'iva': Decimal(datos['iva'] or 0),
+        'total': Decimal(datos['total'] or 0),
+    }
+
+
+class ResumenVentasDiario(models.Model):
+    """
+    Ventas acumuladas por empresa, tipo de DTE y día (zona horaria local).
+    Se mantiene al crear, editar o anular DTE; el libro de ventas y el
+    reporte de ventas lo leen en lugar de recorrer todos los documentos.
+    """
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='resumenes_ventas')
+    tipo_dte = models.CharField(max_length=2, choices=DTE.TIPO_DTE_CHOICES)
+    fecha = models.DateField()
+    cantidad = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    iva = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    emitido_del = models.CharField(max_length=50, blank=True, null=True)
+    emitido_al = models.CharField(max_length=50, blank=True, null=True)
+
+    objects = models.Manager()
+    por_empresa = PorEmpresaManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['empresa', 'tipo_dte', 'fecha'], name='resumen_empresa_tipo_fecha_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['tipo_dte', '-fecha'], name='resumen_tipo_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.empresa} {self.tipo_dte} {self.fecha:%d/%m/%Y}: ${self.total}"
+
+    @classmethod
+    def ajustar(cls, antes, despues, nuevo=False):
+        """Aplica al resumen el cambio de aporte de un DTE (ver `aporte_resumen`)."""
+        if antes == despues:
+            return
+        clave = lambda a: (a['empresa_id'], a['tipo_dte'], a['fecha'])
+
+        if antes and despues and clave(antes) == clave(despues):
+            cls.acumular(
+                *clave(despues), cantidad=0,
+                subtotal=despues['subtotal'] - antes['subtotal'],
+                iva=despues['iva'] - antes['iva'],
+                total=despues['total'] - antes['total'],
+            )
+            if antes['numero_control'] != despues['numero_control']:
+                cls.refrescar_dia(*clave(despues))
+            return
+
+        # El DTE entra o sale del día: al salir se recalcula ese día completo
+        if antes:
+            cls.refrescar_dia(*clave(antes))
+        if despues:
+            if nuevo:
+                cls.acumular(
+                    *clave(despues), cantidad=1, subtotal=despues['subtotal'],
+                    iva=despues['iva'], total=despues['total'], numero=despues['numero_control'],
+                )
+            else:
+                cls.refrescar_dia(*clave(despues))
+
+    @classmethod
+    def acumular(cls, empresa_id, tipo_dte, fecha, cantidad, subtotal, iva, total, numero=None):
+        """Suma al día con un UPDATE atómico; crea la fila si es la primera venta del día."""
+        # Importes ya en centavos: ROUND solo quita el residuo de la suma en coma
+        # flotante de SQLite (en PostgreSQL numeric es exacto)
+        cambios = {
+            'cantidad': F('cantidad') + cantidad,
+            'subtotal': Round(F('subtotal') + subtotal, 2),
+            'iva': Round(F('iva') + iva, 2),
+            'total': Round(F('total') + total, 2),
+        }
+        if numero:
+            cambios['emitido_del'] = Coalesce('emitido_del', Value(numero))
+            cambios['emitido_al'] = Value(numero)
+
+        filas = cls.objects.filter(empresa_id=empresa_id, tipo_dte=tipo_dte, fecha=fecha)
+        if filas.update(**cambios):
+            return
+        try:
+            with transaction.atomic(using=router.db_for_write(cls)):
+                cls.objects.create(
+                    empresa_id=empresa_id, tipo_dte=tipo_dte, fecha=fecha,
+                    cantidad=cantidad, subtotal=subtotal, iva=iva, total=total,
+                    emitido_del=numero, emitido_al=numero,
+                )
+        except IntegrityError:
+            # Otra transacción creó la fila del día al mismo tiempo
+            filas.update(**cambios)
+
+    @classmethod
+    def refrescar_dia(cls, empresa_id, tipo_dte, fecha):
+        """Recalcula un día desde sus DTE (solo se consultan los documentos de ese día)."""
+        inicio = make_aware(datetime.combine(fecha, time.min))
+        dtes = DTE.objects.filter(
+            empresa_id=empresa_id, tipo_dte=tipo_dte, estado='Activo',
+            fecha_emision__gte=inicio, fecha_emision__lt=inicio + timedelta(days=1),
+        )
+        datos = dtes.aggregate(
+            cantidad=Count('id'),
+            subtotal=Coalesce(Sum('subtotal'), Decimal('0.00')),
+            iva=Coalesce(Sum('iva'), Decimal('0.00')),
+            total=Coalesce(Sum('total'), Decimal('0.00')),
+        )
+        filas = cls.objects.filter(empresa_id=empresa_id, tipo_dte=tipo_dte, fecha=fecha)
+        if not datos['cantidad']:
+            filas.delete()
+            return
+
+        ordenados = dtes.order_by('fecha_emision', 'id').values_list('numero_control', flat=True)
+        datos['emitido_del'] = ordenados.first()
+        datos['emitido_al'] = ordenados.last()
+        cls.objects.update_or_create(empresa_id=empresa_id, tipo_dte=tipo_dte, fecha=fecha, defaults=datos)
+
+    @classmethod
+    def acumular_lote(cls, dtes):
+        """Suma al resumen DTE recién creados con bulk_create (una actualización por día)."""
+        dias = {}
+        for dte in dtes:
+            aporte = aporte_resumen({campo: getattr(dte, campo) for campo in DTE.CAMPOS_RESUMEN})
+            if aporte is None:
+                continue
+            clave = (aporte['empresa_id'], aporte['tipo_dte'], aporte['fecha'])
+            dia = dias.setdefault(clave, {'cantidad': 0, 'subtotal': 0, 'iva': 0, 'total': 0, 'del': None})
+            dia['cantidad'] += 1
+            dia['subtotal'] += aporte['subtotal']
+            dia['iva'] += aporte['iva']
+            dia['total'] += aporte['total']
+            dia['del'] = dia['del'] or aporte['numero_control']
+            dia['al'] = aporte['numero_control']
+
+        for clave, dia in dias.items():
+            cls.acumular(*clave, dia['cantidad'], dia['subtotal'], dia['iva'], dia['total'], numero=dia['al'])
+            if dia['del'] != dia['al']:
+                # Primer documento del lote si el día no tenía ventas
+                cls.objects.filter(
+                    empresa_id=clave[0], tipo_dte=clave[1], fecha=clave[2], emitido_del=dia['al'],
+                ).update(emitido_del=dia['del'])
+
+
+@receiver(post_delete, sender=DTE)
+def descontar_dte_eliminado(sender, instance, **kwargs):
+    """Quita del resumen diario un DTE activo eliminado."""
+    aporte = aporte_resumen({campo: getattr(instance, campo) for campo in DTE.CAMPOS_RESUMEN})
+    if aporte is not None:
+        ResumenVentasDiario.refrescar_dia(aporte['empresa_id'], aporte['tipo_dte'], aporte['fecha'])
+
+
 # ======================================================
 # MODELO DETALLE DEL DTE
 # ======================================================
@@ -170,16 +593,93 @@ class DetalleDTE(models.Model):
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
     total_item = models.DecimalField(max_digits=10, decimal_places=2, editable=False)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Valores leídos de la BD: permiten calcular el delta sin otra consulta
+        instancia._original = (instancia.__dict__.get('dte_id'), instancia.__dict__.get('total_item'))
+        return instancia
+
     def save(self, *args, **kwargs):
-        """Calcula el total del ítem antes de guardar."""
-        self.total_item = self.cantidad * self.precio_unitario
+        """Calcula el total del ítem y aplica la diferencia a los totales del DTE."""
+        self.total_item = (Decimal(str(self.cantidad)) * Decimal(str(self.precio_unitario))).quantize(CENTAVO)
+
+        dte_anterior, total_anterior = None, Decimal('0.00')
+        if not self._state.adding and self.pk:
+            dte_anterior, total_anterior = getattr(self, '_original', (None, None))
+            if dte_anterior is None or total_anterior is None:
+                dte_anterior, total_anterior = (
+                    DetalleDTE.objects.filter(pk=self.pk)
+                    .values_list('dte_id', 'total_item').first() or (None, Decimal('0.00'))
+                )
+
         super().save(*args, **kwargs)
-        self.dte.actualizar_totales()
+
+        if dte_anterior is not None and dte_anterior != self.dte_id:
+            registrar_cambio_totales(dte_anterior, -total_anterior)
+            total_anterior = Decimal('0.00')
+        registrar_cambio_totales(self.dte_id, self.total_item - total_anterior, detalle=self)
+        self._original = (self.dte_id, self.total_item)
 
     def __str__(self):
         return f"{self.producto.descripcion} ({self.cantidad})"
 
 
+@receiver(post_delete, sender=DetalleDTE)
+def descontar_detalle_eliminado(sender, instance, **kwargs):
+    """Resta del DTE el total de la línea eliminada."""
+    registrar_cambio_totales(instance.dte_id, -instance.total_item)
+
+
+# ======================================================
+# TOTALES INCREMENTALES Y EDICIÓN DIFERIDA
+# ======================================================
+_diferidos = threading.local()
+
+
+def registrar_cambio_totales(dte_id, delta, detalle=None):
+    """
+    Aplica un cambio de subtotal al DTE.
+    Dentro de `totales_diferidos()` solo se anota el DTE y se recalcula al final.
+    """
+    pendientes = getattr(_diferidos, 'pendientes', None)
+    if pendientes is not None:
+        pendientes.add(dte_id)
+        return
+
+    guardados = DTE.aplicar_delta(dte_id, delta)
+
+    # Mantiene la instancia del DTE ya cargada en memoria igual a la fila
+    dte = detalle._state.fields_cache.get('dte') if detalle is not None else None
+    if dte is not None and guardados is not None:
+        dte.subtotal, dte.iva, dte.total = guardados
+
+
+@contextmanager
+def totales_diferidos():
+    """
+    Agrupa la edición de muchas líneas: los totales de cada DTE tocado
+    se recalculan una sola vez al salir del bloque.
+
+        with transaction.atomic(), totales_diferidos():
+            for linea in lineas:
+                linea.save()
+    """
+    if getattr(_diferidos, 'pendientes', None) is not None:
+        yield _diferidos.pendientes  # bloque anidado: recalcula el exterior
+        return
+
+    _diferidos.pendientes = set()
+    try:
+        yield _diferidos.pendientes
+        pendientes = _diferidos.pendientes
+    finally:
+        _diferidos.pendientes = None
+
+    for dte_id in pendientes:
+        DTE.recalcular_totales(dte_id)
+
+
 # ======================================================
 # MODELO INVENTARIO
 # ======================================================
@@ -197,17 +697,82 @@ class Inventario(models.Model):
     fecha = models.DateField(auto_now_add=True)
     descripcion = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['producto', 'fecha'], name='inventario_producto_fecha_idx'),
+            models.Index(fields=['fecha'], name='inventario_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"{self.tipo} - {self.producto.descripcion} ({self.cantidad})"
 
-    def save(self, *args, **kwargs):
-        """Actualiza inventario del producto automáticamente."""
-        super().save(*args, **kwargs)
+    def save(self, *args, validar_stock=False, **kwargs):
+        """
+        Registra el movimiento y ajusta el inventario del producto con una
+        expresión atómica en la base de datos (sin leer-sumar-guardar).
+        Con validar_stock=True una salida solo se aplica si hay existencias,
+        en la misma sentencia; si no, lanza StockInsuficiente.
+        """
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+
+        delta = self.delta()
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Inventario, instance=self)):
+            productos = Producto.objects.filter(pk=self.producto_id)
+            if validar_stock and delta < 0:
+                productos = productos.filter(inventario__gte=-delta)
+            if not productos.update(inventario=F('inventario') + delta) and validar_stock:
+                raise StockInsuficiente(f"Stock insuficiente para el producto {self.producto_id}.")
+            super().save(*args, **kwargs)
+
+        producto = self._state.fields_cache.get('producto')
+        if producto is not None:
+            producto.inventario += delta
+
+    def delta(self):
+        """Efecto del movimiento sobre las existencias."""
         if self.tipo == 'Entrada':
-            self.producto.inventario += self.cantidad
-        elif self.tipo == 'Salida':
-            self.producto.inventario -= self.cantidad
-        self.producto.save()
+            return self.cantidad
+        if self.tipo == 'Salida':
+            return -self.cantidad
+        return 0
+
+
+# ======================================================
+# MODELO CIERRE DE INVENTARIO (saldo diario por producto)
+# ======================================================
+class CierreInventario(models.Model):
+    """
+    Punto de control del kardex: saldo de cierre de un producto en un día
+    con movimientos. Lo genera el comando `cerrar_inventario`.
+    """
+    producto = models.ForeignKey(
+        Producto, on_delete=models.CASCADE, related_name='cierres_inventario'
+    )
+    fecha = models.DateField()
+    entradas = models.IntegerField(default=0)
+    salidas = models.IntegerField(default=0)
+    saldo = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['producto', 'fecha'], name='cierre_producto_fecha_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['fecha'], name='cierre_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto.codigo} {self.fecha:%d/%m/%Y}: {self.saldo}"
+
+
+class StockInsuficiente(Exception):
+    """No hay existencias suficientes para una salida de inventario."""
+
+    def __init__(self, mensaje, productos=None):
+        super().__init__(mensaje)
+        self.productos = productos or []
 
 
 # ======================================================
@@ -225,5 +790,115 @@ class Compra(models.Model):
     iva_13 = models.DecimalField(max_digits=10, decimal_places=2)
     total = models.DecimalField(max_digits=10, decimal_places=2)
 
+    objects = models.Manager()
+    por_empresa = PorEmpresaManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['empresa', 'fecha', 'id'], name='compra_empresa_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.proveedor} - {self.fecha.strftime('%d/%m/%Y')}"
+
+# ======================================================
+# MODELO SECUENCIA (numeración de documentos)
+# ======================================================
+class Secuencia(models.Model):
+    """
+    Contador de una serie de numeración por empresa (números de control,
+    códigos de producto, comprobantes de compra). Se avanza con un UPDATE
+    atómico; ver secuencias.py.
+    """
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, null=True, blank=True)
+    serie = models.CharField(max_length=40)
+    siguiente = models.PositiveBigIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['empresa', 'serie'], name='secuencia_empresa_serie_uniq'),
+            # En SQL los NULL no chocan entre sí: una sola fila por serie sin empresa
+            models.UniqueConstraint(
+                fields=['serie'], condition=Q(empresa__isnull=True), name='secuencia_serie_sin_empresa_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.serie} ({self.empresa_id}): {self.siguiente}"
+
+
+# ======================================================
+# MODELO TRABAJO DE EMISIÓN (cola de envío de DTE)
+# ======================================================
+class TrabajoEmision(models.Model):
+    """
+    Trabajo persistente de emisión de un DTE.
+    Lo consume el comando `procesar_emisiones`, que realiza el paso MH,
+    genera el PDF y el JSON y envía el correo al cliente.
+    """
+    ESTADOS = [
+        ('Pendiente', 'Pendiente'),
+        ('Procesando', 'Procesando'),
+        ('Completado', 'Completado'),
+        ('Error', 'Error'),
+    ]
+    MOTIVOS = [
+        ('Emision', 'Emisión'),
+        ('Actualizacion', 'Actualización'),
+    ]
+
+    dte = models.ForeignKey(DTE, on_delete=models.CASCADE, related_name='trabajos_emision')
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    motivo = models.CharField(max_length=15, choices=MOTIVOS, default='Emision')
+    estado = models.CharField(max_length=12, choices=ESTADOS, default='Pendiente')
+    paso = models.CharField(max_length=60, default='En cola')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    disponible_desde = models.DateTimeField(default=now)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['estado', 'disponible_desde'], name='trabajo_estado_disp_idx'),
+        ]
+
+    def __str__(self):
+        return f"Trabajo {self.id} - {self.dte.numero_control} ({self.estado})"
+
+
+# ======================================================
+# MODELO LOTE DE CONTINGENCIA (DTE transmitidos en lote)
+# ======================================================
+class LoteContingencia(models.Model):
+    """
+    Grupo de DTE emitidos mientras el Ministerio no respondía. Lo arma y
+    transmite el comando `transmitir_contingencia` (ver contingencia.py).
+    """
+    ESTADOS = [
+        ('Pendiente', 'Pendiente'),
+        ('Enviado', 'Enviado'),
+        ('Completado', 'Completado'),
+        ('Error', 'Error'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE)
+    estado = models.CharField(max_length=12, choices=ESTADOS, default='Pendiente')
+    codigo_lote = models.CharField(max_length=100, blank=True, null=True)
+    documentos = models.PositiveIntegerField(default=0)
+    procesados = models.PositiveIntegerField(default=0)
+    rechazados = models.PositiveIntegerField(default=0)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['estado', 'id'], name='lote_estado_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.proveedor} - {self.fecha.strftime('%d/%m/%Y')}"
\ No newline at end of file
+        return f"Lote {self.id} - {self.documentos} DTE ({self.estado})"
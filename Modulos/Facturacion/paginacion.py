@@ -0,0 +1,161 @@
+# ======================================================
+# 📑 PAGINACIÓN POR CURSOR (keyset)
+# ======================================================
+"""
+Paginación por cursor sobre órdenes estables (p. ej. `-fecha_emision, -id`).
+
+En lugar de OFFSET, cada página filtra "después de la última fila vista"
+usando los valores de las columnas del orden, así la página N cuesta lo
+mismo que la primera y nunca se carga la tabla completa. El cursor es un
+token opaco (base64 de los valores del orden) que viaja en `?despues=` o
+`?antes=`. El último campo del orden debe ser único (normalmente `id`) y
+ninguno puede ser nulo.
+"""
+import json
+import base64
+from urllib.parse import urlencode
+
+from django.db.models import Q
+
+TAMANO_PAGINA = 25
+TAMANO_MAXIMO = 100
+
+ORDEN_DTE = ('-fecha_emision', '-id')
+ORDEN_PRODUCTO = ('codigo', 'id')
+ORDEN_RECIENTES = ('-id',)
+
+
+class CursorInvalido(Exception):
+    pass
+
+
+class Pagina:
+    """Una página de resultados con los cursores para avanzar y retroceder."""
+
+    def __init__(self, items, siguiente=None, anterior=None, parametros=None):
+        self.items = items
+        self.siguiente = siguiente
+        self.anterior = anterior
+        self._parametros = parametros or {}
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _url(self, **cursor):
+        return "?" + urlencode({**self._parametros, **cursor})
+
+    @property
+    def url_siguiente(self):
+        return self._url(despues=self.siguiente) if self.siguiente else None
+
+    @property
+    def url_anterior(self):
+        return self._url(antes=self.anterior) if self.anterior else None
+
+    def como_dict(self, serializar):
+        """Formato común de las respuestas JSON paginadas."""
+        return {
+            "resultados": [serializar(item) for item in self.items],
+            "siguiente": self.siguiente,
+            "anterior": self.anterior,
+        }
+
+
+# ======================================================
+# 🔐 CODIFICACIÓN DEL CURSOR
+# ======================================================
+def _campo(orden):
+    return orden.lstrip('-')
+
+
+def _codificar(instancia, orden):
+    valores = [getattr(instancia, _campo(o)) for o in orden]
+    crudo = json.dumps(valores, default=str, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(crudo).decode('ascii').rstrip('=')
+
+
+def _decodificar(token, modelo, orden):
+    try:
+        crudo = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        valores = json.loads(crudo)
+        if not isinstance(valores, list) or len(valores) != len(orden):
+            raise ValueError
+        return [modelo._meta.get_field(_campo(o)).to_python(v) for o, v in zip(orden, valores)]
+    except Exception:
+        raise CursorInvalido("Cursor de paginación no válido.")
+
+
+def _filtro_despues(orden, valores, invertir=False):
+    """
+    Condición "fila posterior al cursor" según el orden:
+    (a > x) OR (a = x AND b > y) OR ...
+    """
+    condicion = Q()
+    iguales = {}
+    for o, valor in zip(orden, valores):
+        descendente = o.startswith('-') != invertir
+        operador = 'lt' if descendente else 'gt'
+        condicion |= Q(**iguales, **{f"{_campo(o)}__{operador}": valor})
+        iguales[_campo(o)] = valor
+    return condicion
+
+
+def _invertir(orden):
+    return [o[1:] if o.startswith('-') else f'-{o}' for o in orden]
+
+
+# ======================================================
+# 📄 PAGINAR
+# ======================================================
+def paginar(queryset, orden, despues=None, antes=None, tamano=TAMANO_PAGINA, parametros=None):
+    """
+    Devuelve la `Pagina` que sigue a `despues` (o precede a `antes`).
+    `parametros`: otros parámetros GET a conservar en los enlaces (p. ej. la búsqueda).
+    """
+    orden = list(orden)
+    modelo = queryset.model
+
+    if antes:
+        valores = _decodificar(antes, modelo, orden)
+        filas = list(
+            queryset.filter(_filtro_despues(orden, valores, invertir=True))
+            .order_by(*_invertir(orden))[:tamano + 1]
+        )
+        hay_mas = len(filas) > tamano
+        items = list(reversed(filas[:tamano]))
+        siguiente = _codificar(items[-1], orden) if items else None
+        anterior = _codificar(items[0], orden) if items and hay_mas else None
+    else:
+        consulta = queryset.order_by(*orden)
+        if despues:
+            consulta = consulta.filter(_filtro_despues(orden, _decodificar(despues, modelo, orden)))
+        filas = list(consulta[:tamano + 1])
+        items = filas[:tamano]
+        siguiente = _codificar(items[-1], orden) if len(filas) > tamano else None
+        anterior = _codificar(items[0], orden) if despues and items else None
+
+    return Pagina(items, siguiente, anterior, parametros)
+
+
+def paginar_peticion(request, queryset, orden, tamano=TAMANO_PAGINA):
+    """Lee `despues`, `antes` y `tamano` del GET y conserva el resto de parámetros."""
+    try:
+        tamano = max(1, min(int(request.GET.get('tamano', tamano)), TAMANO_MAXIMO))
+    except ValueError:
+        tamano = TAMANO_PAGINA
+
+    parametros = {k: v for k, v in request.GET.items() if k not in ('despues', 'antes') and v}
+    try:
+        return paginar(
+            queryset, orden,
+            despues=request.GET.get('despues'),
+            antes=request.GET.get('antes'),
+            tamano=tamano,
+            parametros=parametros,
+        )
+    except CursorInvalido:
+        # Enlace viejo o manipulado: se muestra la primera página
+        return paginar(queryset, orden, tamano=tamano, parametros=parametros)
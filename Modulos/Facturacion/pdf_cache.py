@@ -0,0 +1,165 @@
+# ======================================================
+# 🗂️ CACHÉ DE PDF DE DTE (direccionada por contenido)
+# ======================================================
+"""
+Caché en disco de los PDF renderizados con WeasyPrint.
+
+La clave es un hash de todo lo que interviene en el render: campos del DTE,
+detalles y productos, empresa, cliente, plantilla y versión del CSS.
+Estructura: <PDF_CACHE_DIR>/<dte_id>/<hash>.pdf
+El orden LRU se lleva con el mtime de cada archivo (se actualiza al leer)
+y se expulsan los menos recientes cuando se supera PDF_CACHE_MAX_MB.
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.forms.models import model_to_dict
+from django.template.loader import get_template
+
+
+_lock = threading.Lock()
+_bytes_escritos = 0
+
+
+def _directorio():
+    return str(getattr(settings, 'PDF_CACHE_DIR', os.path.join(settings.BASE_DIR, 'media', 'pdf_cache')))
+
+
+def _limite_bytes():
+    return int(getattr(settings, 'PDF_CACHE_MAX_MB', 256)) * 1024 * 1024
+
+
+def activo():
+    return getattr(settings, 'PDF_CACHE_ACTIVO', True)
+
+
+# ======================================================
+# 🔑 CLAVE DEL DOCUMENTO
+# ======================================================
+@lru_cache(maxsize=32)
+def version_plantilla(plantilla):
+    """Hash del código fuente de la plantilla (una vez por proceso)."""
+    fuente = get_template(plantilla).template.source
+    return hashlib.sha256(fuente.encode('utf-8')).hexdigest()[:16]
+
+
+@lru_cache(maxsize=32)
+def version_css(css_path):
+    """Hash del contenido del CSS (una vez por proceso)."""
+    with open(css_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def clave_pdf(dte, plantilla, css_path, extra=None):
+    """Calcula el hash de las entradas del render de un DTE."""
+    detalles = list(
+        dte.detalles.order_by('id').values_list(
+            'id', 'producto__codigo', 'producto__descripcion',
+            'cantidad', 'precio_unitario', 'total_item',
+        )
+    )
+    entradas = {
+        "dte": model_to_dict(dte),
+        "fecha_emision": dte.fecha_emision.isoformat() if dte.fecha_emision else None,
+        "detalles": detalles,
+        "empresa": model_to_dict(dte.empresa) if dte.empresa_id else None,
+        "cliente": model_to_dict(dte.cliente) if dte.cliente_id else None,
+        "plantilla": [plantilla, version_plantilla(plantilla)],
+        "css": version_css(css_path),
+        "extra": extra,
+    }
+    serializado = json.dumps(entradas, sort_keys=True, default=str)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+
+# ======================================================
+# 📥 LECTURA / ESCRITURA
+# ======================================================
+def obtener_pdf(dte, plantilla, css_path, generar, extra=None):
+    """
+    Devuelve el PDF del DTE desde la caché o lo genera con `generar()`
+    y lo guarda para las siguientes descargas o reenvíos.
+    """
+    if not activo():
+        return generar()
+
+    clave = clave_pdf(dte, plantilla, css_path, extra)
+    ruta = os.path.join(_directorio(), str(dte.id), f"{clave}.pdf")
+
+    try:
+        with open(ruta, 'rb') as f:
+            contenido = f.read()
+        os.utime(ruta)  # marca de uso reciente para el LRU
+        return contenido
+    except FileNotFoundError:
+        pass
+
+    contenido = generar()
+    _guardar(ruta, contenido)
+    return contenido
+
+
+def _guardar(ruta, contenido):
+    global _bytes_escritos
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+
+    # Escritura atómica: otro proceso nunca lee un PDF a medias
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, 'wb') as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+
+    # Solo se recorre el directorio cuando lo escrito puede haber superado el límite
+    with _lock:
+        _bytes_escritos += len(contenido)
+        barrer = _bytes_escritos >= _limite_bytes() // 10
+        if barrer:
+            _bytes_escritos = 0
+    if barrer:
+        expulsar()
+
+
+def expulsar():
+    """Elimina los PDF menos usados hasta quedar por debajo del límite."""
+    archivos = []
+    total = 0
+    for raiz, _, nombres in os.walk(_directorio()):
+        for nombre in nombres:
+            if not nombre.endswith('.pdf'):
+                continue
+            ruta = os.path.join(raiz, nombre)
+            try:
+                info = os.stat(ruta)
+            except FileNotFoundError:
+                continue
+            archivos.append((info.st_mtime, info.st_size, ruta))
+            total += info.st_size
+
+    limite = _limite_bytes()
+    if total <= limite:
+        return 0
+
+    eliminados = 0
+    for _, tamano, ruta in sorted(archivos):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            continue
+        total -= tamano
+        eliminados += 1
+        if total <= limite:
+            break
+    return eliminados
+
+
+# ======================================================
+# 🧹 INVALIDACIÓN (llamada desde signals.py)
+# ======================================================
+def invalidar_dte(dte_id):
+    """Borra todas las versiones en caché de un DTE."""
+    shutil.rmtree(os.path.join(_directorio(), str(dte_id)), ignore_errors=True)
@@ -1,7 +1,6 @@
 from django.shortcuts import redirect
 from functools import wraps
 from django.contrib import messages
-from .models import Perfil
 
 def rol_requerido(roles_permitidos):
     """
@@ -22,25 +21,28 @@ def rol_requerido(roles_permitidos):
                 messages.warning(request, "Debe iniciar sesión para continuar.")
                 return redirect('login')
 
-            # 2️⃣ Obtener perfil del usuario
-            perfil = getattr(request.user, 'perfil', None)
-            if not perfil:
+            # 2️⃣ Perfil del usuario (cargado y cacheado por ContextoUsuarioMiddleware)
+            if not hasattr(request, 'rol'):
+                perfil = getattr(request.user, 'perfil', None)
+                request.rol = perfil.rol if perfil else None
+                request.tenant = perfil.empresa if perfil else None
+            if request.rol is None:
                 messages.error(request, "No se ha asignado un perfil al usuario.")
                 return redirect('login')
 
             # 3️⃣ Validar empresa (solo se bloquea si no es Admin)
-            if perfil.rol != 'Administrador' and not perfil.empresa:
+            if request.rol != 'Administrador' and not request.tenant:
                 messages.error(request, "Su usuario no está asociado a ninguna empresa.")
                 return redirect('menu_principal')
 
             # 4️⃣ Jerarquía de roles
-            if perfil.rol == 'Administrador' or perfil.rol in roles_permitidos:
+            if request.rol == 'Administrador' or request.rol in roles_permitidos:
                 return view_func(request, *args, **kwargs)
 
             # 5️⃣ Si no tiene permisos suficientes
             messages.warning(
                 request,
-                f"Acceso denegado. Su rol '{perfil.rol}' no tiene permisos para esta sección."
+                f"Acceso denegado. Su rol '{request.rol}' no tiene permisos para esta sección."
             )
             return redirect('menu_principal')
 
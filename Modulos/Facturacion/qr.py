@@ -0,0 +1,101 @@
+# ======================================================
+# 🔳 CÓDIGOS QR DE LOS DTE (SVG memorizado)
+# ======================================================
+"""
+QR de `ver_dte` como SVG en línea, sin Pillow ni PNG.
+
+- Versión fija (QR_VERSION, 6 por defecto: 41x41 módulos, hasta 106
+  bytes con corrección M, suficiente para el texto más largo posible
+  `numero_control|nit|nit|total`) y máscara fija (QR_MASCARA): qrcode no
+  prueba versiones ni evalúa las 8 máscaras, que es casi todo su costo.
+  Todos los QR quedan del mismo tamaño (QR_TAMANO px).
+- El SVG es un único `<path>` con una línea por tramo horizontal de
+  módulos oscuros (~3 KB).
+- Memorizado por texto en un LRU acotado por proceso (QR_CACHE_TAMANO) y
+  guardado en el propio DTE (`qr_texto` / `qr_svg`): el worker de emisión
+  lo deja listo y ver_dte solo lo lee. Si el texto cambió (total editado)
+  se vuelve a generar.
+"""
+import base64
+from functools import lru_cache
+
+import qrcode
+from django.conf import settings
+from django.db import DatabaseError
+
+
+def texto_qr(dte):
+    return f"{dte.numero_control}|{dte.empresa.nit}|{dte.cliente.nit}|{dte.total:.2f}"
+
+
+def _matriz(texto):
+    """Módulos del QR (con el margen de 4 módulos del estándar)."""
+    try:
+        codigo = qrcode.QRCode(
+            version=settings.QR_VERSION, error_correction=qrcode.constants.ERROR_CORRECT_M,
+            mask_pattern=settings.QR_MASCARA,
+        )
+        codigo.add_data(texto)
+        codigo.make(fit=False)
+    except qrcode.exceptions.DataOverflowError:
+        # Texto fuera de lo previsto: la versión mínima que lo contenga
+        codigo = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M)
+        codigo.add_data(texto)
+        codigo.make(fit=True)
+    return codigo.get_matrix()
+
+
+def _generar_svg(texto):
+    matriz = _matriz(texto)
+    lado = len(matriz)
+    trazos = []
+    for y, fila in enumerate(matriz):
+        # Cada tramo es una línea de 1 módulo de grosor; dentro de la fila,
+        # movimientos relativos desde el final del tramo anterior
+        fin = None
+        x = 0
+        while x < lado:
+            if not fila[x]:
+                x += 1
+                continue
+            inicio = x
+            while x < lado and fila[x]:
+                x += 1
+            movimiento = f"M{inicio} {y}.5" if fin is None else f"m{inicio - fin} 0"
+            trazos.append(f"{movimiento}h{x - inicio}")
+            fin = x
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{settings.QR_TAMANO}" '
+        f'height="{settings.QR_TAMANO}" viewBox="0 0 {lado} {lado}" shape-rendering="crispEdges">'
+        f'<rect width="{lado}" height="{lado}" fill="#fff"/>'
+        f'<path d="{"".join(trazos)}" stroke="#000"/></svg>'
+    )
+
+
+svg_qr = lru_cache(maxsize=settings.QR_CACHE_TAMANO)(_generar_svg)
+svg_qr.__doc__ = "SVG del QR de `texto` (memorizado por proceso)."
+
+
+def datauri(svg):
+    return f"data:image/svg+xml;base64,{base64.b64encode(svg.encode('utf-8')).decode('ascii')}"
+
+
+def guardar(dte):
+    """Genera el QR del DTE y lo guarda si no lo tenía o cambió. Devuelve el SVG."""
+    texto = texto_qr(dte)
+    if dte.qr_texto == texto and dte.qr_svg:
+        return dte.qr_svg
+    svg = svg_qr(texto)
+    dte.qr_texto, dte.qr_svg = texto, svg
+    try:
+        # update(): sin señales, no invalida el PDF ni toca el resumen diario
+        type(dte).objects.filter(pk=dte.pk).update(qr_texto=texto, qr_svg=svg)
+    except DatabaseError as e:
+        # Base ocupada: el LRU lo sigue sirviendo y se guardará en otra visita
+        print(f"⚠️ No se guardó el QR del DTE {dte.pk}: {e}")
+    return svg
+
+
+def qr_dte(dte):
+    """Data URI del QR del DTE para `<img src>`."""
+    return datauri(guardar(dte))
@@ -0,0 +1,193 @@
+# ======================================================
+# 🖨️ RENDERIZADOR DE PDF (pool de procesos WeasyPrint)
+# ======================================================
+"""
+Pool acotado de procesos WeasyPrint ya inicializados.
+
+Cada proceso carga una sola vez la configuración de fuentes y las hojas
+de estilo de cada tipo de DTE (factura01.css, ccf.css, ...), y memoriza
+los recursos externos (Bootstrap del CDN, imágenes). Los trabajos se
+envían con contrapresión: si hay demasiados PDFs en espera, `renderizar`
+bloquea hasta PDF_RENDER_ESPERA segundos y luego lanza RenderizadorOcupado.
+
+El pool vive en cada proceso web: con N workers de gunicorn hay
+N x PDF_RENDER_PROCESOS procesos de render en el host. Por eso el valor
+por defecto es 1; súbalo solo si hay núcleos libres para todos.
+
+Con PDF_RENDER_PROCESOS = 0 el render se hace en el propio proceso,
+reutilizando igualmente las hojas de estilo ya parseadas.
+
+Si la firma de PDF está activa (firma_pdf.py) el mismo proceso firma el
+PDF recién renderizado.
+"""
+import os
+import threading
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+
+PLANTILLAS_DTE = {
+    '01': 'Facturacion/factura01.html',
+    '03': 'Facturacion/ccf03.html',
+    '05': 'Facturacion/notaCredito05.html',
+    '06': 'Facturacion/notaDebito06.html',
+    '07': 'Facturacion/retencion07.html',
+    '11': 'Facturacion/liquidacion11.html',
+}
+
+HOJAS_DTE = {
+    '01': 'factura01.css',
+    '03': 'ccf.css',
+    '05': 'notaCredito05.css',
+    '06': 'notaDebito06.css',
+    '07': 'retencion07.css',
+    '11': 'liquidacion11.css',
+}
+
+
+class RenderizadorOcupado(Exception):
+    """El pool tiene demasiados PDFs en espera."""
+
+
+# ======================================================
+# 📁 RUTAS DE CSS (resueltas una vez por proceso)
+# ======================================================
+@lru_cache(maxsize=None)
+def ruta_css(tipo_dte):
+    """CSS de producción si existe (collectstatic), si no el de desarrollo."""
+    nombre = HOJAS_DTE.get(tipo_dte, HOJAS_DTE['01'])
+    prod_css = os.path.join(settings.BASE_DIR, 'staticfiles_dev', 'css', nombre)
+    if os.path.exists(prod_css):
+        return prod_css
+    return os.path.join(settings.BASE_DIR, 'Modulos', 'Facturacion', 'static', 'css', nombre)
+
+
+def plantilla_dte(tipo_dte):
+    return PLANTILLAS_DTE.get(tipo_dte, PLANTILLAS_DTE['01'])
+
+
+# ======================================================
+# 🧠 ESTADO DE CADA PROCESO WORKER
+# ======================================================
+_fuentes = None
+_hojas = {}
+_recursos = {}
+_imagenes = {}
+
+
+def _fetcher_memoizado(url, timeout=10, ssl_context=None, http_headers=None):
+    """Descarga cada recurso externo una sola vez por proceso."""
+    from weasyprint import default_url_fetcher
+
+    if url not in _recursos:
+        recurso = default_url_fetcher(url, timeout=timeout, ssl_context=ssl_context,
+                                      http_headers=http_headers)
+        if 'file_obj' in recurso:
+            archivo = recurso.pop('file_obj')
+            try:
+                recurso['string'] = archivo.read()
+            finally:
+                archivo.close()
+        _recursos[url] = recurso
+    return dict(_recursos[url])
+
+
+def _iniciar_worker(rutas_css):
+    """Carga fuentes y parsea las hojas de estilo de cada tipo de DTE."""
+    global _fuentes
+    from weasyprint import HTML, CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+    _fuentes = FontConfiguration()
+    for tipo, ruta in rutas_css.items():
+        _hojas[tipo] = CSS(filename=ruta, font_config=_fuentes, url_fetcher=_fetcher_memoizado)
+
+    # Render mínimo para dejar cargadas las fuentes del sistema
+    HTML(string="<p>OMNIGEST</p>").write_pdf(font_config=_fuentes)
+
+
+def _render_en_worker(html, tipo_dte, base_url, firma=None):
+    from weasyprint import HTML
+
+    hoja = _hojas.get(tipo_dte) or _hojas['01']
+    pdf = HTML(string=html, base_url=base_url, url_fetcher=_fetcher_memoizado).write_pdf(
+        stylesheets=[hoja], font_config=_fuentes, cache=_imagenes,
+    )
+    if firma:
+        # Firmado en el mismo proceso, con el firmante que este proceso ya armó
+        from .firma_pdf import firmar_con
+        pdf = firmar_con(pdf, **firma)
+    return pdf
+
+
+# ======================================================
+# 🏊 POOL Y CONTRAPRESIÓN
+# ======================================================
+_pool = None
+_cupos = None
+_lock = threading.Lock()
+_local_iniciado = False
+
+
+def _procesos():
+    return int(getattr(settings, 'PDF_RENDER_PROCESOS', 1))
+
+
+def _rutas_css():
+    return {tipo: ruta_css(tipo) for tipo in HOJAS_DTE}
+
+
+def _obtener_pool():
+    global _pool, _cupos
+    with _lock:
+        if _pool is None:
+            procesos = _procesos()
+            _pool = ProcessPoolExecutor(
+                max_workers=procesos,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_iniciar_worker,
+                initargs=(_rutas_css(),),
+            )
+            pendientes = int(getattr(settings, 'PDF_RENDER_MAX_PENDIENTES', procesos * 4))
+            _cupos = threading.BoundedSemaphore(pendientes)
+        return _pool
+
+
+def renderizar(html, tipo_dte='01', base_url=None, firma=None):
+    """
+    Renderiza el HTML de un DTE y devuelve los bytes del PDF.
+    Con `firma` (firma_pdf.parametros) el PDF sale firmado.
+    """
+    global _local_iniciado
+
+    if _procesos() <= 0:
+        with _lock:
+            if not _local_iniciado:
+                _iniciar_worker(_rutas_css())
+                _local_iniciado = True
+        return _render_en_worker(html, tipo_dte, base_url, firma)
+
+    pool = _obtener_pool()
+    espera = float(getattr(settings, 'PDF_RENDER_ESPERA', 30))
+    if not _cupos.acquire(timeout=espera):
+        raise RenderizadorOcupado("Demasiados PDFs en cola, intente de nuevo.")
+
+    try:
+        futuro = pool.submit(_render_en_worker, html, tipo_dte, base_url, firma)
+    except Exception:
+        _cupos.release()
+        raise
+    futuro.add_done_callback(lambda _: _cupos.release())
+    return futuro.result(timeout=float(getattr(settings, 'PDF_RENDER_TIMEOUT', 120)))
+
+
+def cerrar():
+    """Detiene el pool (p. ej. al terminar un comando de gestión)."""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
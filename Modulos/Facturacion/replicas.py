@@ -0,0 +1,118 @@
+# ======================================================
+# 📚 RÉPLICA DE LECTURA (libros, reportes, exportaciones y búsquedas)
+# ======================================================
+"""
+Envía a la réplica (alias `replica` de DATABASES, ver settings) las
+lecturas de las vistas marcadas con `@lectura_replica`. Todo lo demás,
+y todas las escrituras, sigue en `default`.
+
+Leer lo que uno mismo escribió: ReplicaMiddleware (middleware.py) anota en
+la sesión la hora de la última escritura; durante REPLICA_RETRASO_SEGUNDOS
+esa sesión lee de la principal aunque la vista esté marcada, así un
+documento recién emitido aparece en el libro de inmediato. En código fuera
+de una vista, `usar_primaria()` fuerza lo mismo.
+
+Las empresas con shard propio (shards.py) leen siempre de su shard:
+RouterEmpresas va antes en DATABASE_ROUTERS.
+
+En local basta con dos archivos SQLite: `manage.py sincronizar_replica`
+copia la base principal sobre la réplica.
+"""
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from django.db import DEFAULT_DB_ALIAS
+from django.http import FileResponse
+
+ALIAS = 'replica'
+
+_leer_replica = contextvars.ContextVar('leer_replica', default=False)
+# Estado de la petición en curso: {'reciente': bool, 'escribio': bool}
+_peticion = contextvars.ContextVar('peticion_replica', default=None)
+
+
+def iniciar_peticion(escritura_reciente):
+    """Lo llama el middleware al empezar; devuelve el token para `terminar_peticion`."""
+    return _peticion.set({'reciente': escritura_reciente, 'escribio': False})
+
+
+def terminar_peticion(token):
+    """Devuelve True si la petición escribió en la base principal."""
+    escribio = _peticion.get()['escribio']
+    _peticion.reset(token)
+    return escribio
+
+
+@contextmanager
+def usar_replica():
+    token = _leer_replica.set(True)
+    try:
+        yield
+    finally:
+        _leer_replica.reset(token)
+
+
+@contextmanager
+def usar_primaria():
+    token = _leer_replica.set(False)
+    try:
+        yield
+    finally:
+        _leer_replica.reset(token)
+
+
+def _en_contexto(contexto, contenido):
+    """Consume una respuesta en streaming dentro del contexto de la vista."""
+    iterador = iter(contenido)
+    while True:
+        try:
+            bloque = contexto.run(next, iterador)
+        except StopIteration:
+            return
+        yield bloque
+
+
+def lectura_replica(vista):
+    """
+    Las consultas de la vista leen de la réplica. Si la respuesta es un
+    streaming, sus filas se leen después de la vista: se consumen dentro
+    de una copia del contexto (réplica, empresa y shard de la petición).
+    """
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        with usar_replica():
+            respuesta = vista(request, *args, **kwargs)
+            if respuesta.streaming and not isinstance(respuesta, FileResponse):
+                respuesta.streaming_content = _en_contexto(
+                    contextvars.copy_context(), respuesta.streaming_content
+                )
+        return respuesta
+    return envoltura
+
+
+class RouterReplica:
+
+    def db_for_read(self, model, **hints):
+        if not _leer_replica.get():
+            return None
+        peticion = _peticion.get()
+        if peticion is not None and (peticion['reciente'] or peticion['escribio']):
+            return DEFAULT_DB_ALIAS
+        return ALIAS
+
+    def db_for_write(self, model, **hints):
+        peticion = _peticion.get()
+        if peticion is not None:
+            peticion['escribio'] = True
+        # También para instancias leídas de la réplica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La réplica recibe el esquema desde la principal
+        return False if db == ALIAS else None
@@ -0,0 +1,179 @@
+# ======================================================
+# 🔢 SECUENCIAS (numeración de DTE, compras y productos)
+# ======================================================
+"""
+Toda la numeración pasa por aquí, con un contador `Secuencia` por
+(empresa, serie). Avanzar el contador es un único UPDATE
+`siguiente = siguiente + n` sobre una fila, sin MAX() sobre la tabla del
+documento ni números que dependan de la hora o del azar.
+
+- El número se reserva en la misma transacción que guarda el documento
+  (DTE.save, registrar_venta, lotes): si se revierte, el número vuelve a
+  quedar libre y la serie no tiene huecos. La fila queda bloqueada hasta
+  el commit, así que otro documento de la misma serie espera su turno.
+- Con SECUENCIA_BLOQUE > 1 cada proceso reserva un bloque de números de
+  una vez y los entrega desde memoria (el resto del bloque, solo después
+  del commit de la reserva). Los workers ya no se disputan la fila, pero
+  los números sin usar de un bloque se pierden (huecos).
+
+Formato MH del número de control:
+DTE-<tipo>-<establecimiento><punto de venta>-<correlativo de 15 dígitos>,
+p. ej. DTE-01-M001P001-000000000000001.
+"""
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F, Max
+from django.db.models.functions import Length
+from django.utils.timezone import localdate
+
+from .models import DTE, Compra, Producto, Secuencia
+
+# (alias, empresa_id, serie) -> [siguiente, fin) ya reservados por este proceso
+_bloques = {}
+_candado = threading.Lock()
+
+
+def _reservar(serie, cantidad, empresa_id, inicial, using):
+    """Avanza el contador `cantidad` números y devuelve el primero."""
+    with transaction.atomic(using=using, savepoint=False):
+        filas = Secuencia.objects.using(using).filter(empresa_id=empresa_id, serie=serie)
+        if not filas.update(siguiente=F('siguiente') + cantidad):
+            # Serie nueva: el primer número sale de los datos existentes (una sola vez)
+            primero = inicial() if inicial else 1
+            try:
+                with transaction.atomic(using=using):
+                    Secuencia.objects.using(using).create(
+                        empresa_id=empresa_id, serie=serie, siguiente=primero + cantidad,
+                    )
+                return primero
+            except IntegrityError:
+                # Otro proceso la creó al mismo tiempo
+                filas.update(siguiente=F('siguiente') + cantidad)
+        return filas.values_list('siguiente', flat=True).get() - cantidad
+
+
+def reservar(serie, cantidad, empresa_id=None, inicial=None):
+    """Reserva `cantidad` números consecutivos en la transacción actual; devuelve el primero."""
+    return _reservar(serie, cantidad, empresa_id, inicial, router.db_for_write(Secuencia))
+
+
+def siguiente(serie, empresa_id=None, inicial=None):
+    """Siguiente número de la serie (desde el bloque del proceso si SECUENCIA_BLOQUE > 1)."""
+    using = router.db_for_write(Secuencia)
+    bloque = settings.SECUENCIA_BLOQUE
+    if bloque <= 1:
+        return _reservar(serie, 1, empresa_id, inicial, using)
+
+    clave = (using, empresa_id, serie)
+    with _candado:
+        actual = _bloques.get(clave)
+        if actual and actual[0] < actual[1]:
+            actual[0] += 1
+            return actual[0] - 1
+        primero = _reservar(serie, bloque, empresa_id, inicial, using)
+        resto = [primero + 1, primero + bloque]
+        if connections[using].in_atomic_block:
+            # Si la transacción se revierte la reserva se deshace: el resto del
+            # bloque solo se usa cuando ya está confirmado
+            transaction.on_commit(partial(_publicar, clave, resto), using=using)
+        else:
+            _bloques[clave] = resto
+        return primero
+
+
+def _publicar(clave, resto):
+    with _candado:
+        _bloques[clave] = resto
+
+
+def proximo(serie, empresa_id=None, inicial=None):
+    """Número que probablemente saldrá después (solo para mostrar; no reserva)."""
+    actual = _bloques.get((router.db_for_write(Secuencia), empresa_id, serie))
+    if actual and actual[0] < actual[1]:
+        return actual[0]
+    valor = Secuencia.objects.filter(empresa_id=empresa_id, serie=serie).values_list('siguiente', flat=True).first()
+    if valor is not None:
+        return valor
+    return inicial() if inicial else 1
+
+
+# ======================================================
+# 🧾 SERIES DEL SISTEMA
+# ======================================================
+def _serie_dte(empresa, tipo_dte):
+    return f"DTE-{tipo_dte}-{empresa.codigo_establecimiento}{empresa.codigo_punto_venta}"
+
+
+def _formato_control(serie, numero):
+    return f"{serie}-{numero:015d}"
+
+
+def _primer_correlativo(empresa_id, serie):
+    # Los correlativos tienen ancho fijo: el mayor es el último en orden de texto
+    ultimo = (
+        DTE.objects.filter(empresa_id=empresa_id, numero_control__startswith=f"{serie}-")
+        .order_by('-numero_control').values_list('numero_control', flat=True).first()
+    )
+    return int(ultimo.rsplit('-', 1)[1]) + 1 if ultimo else 1
+
+
+def numeros_con_correlativo(empresas, correlativo):
+    """
+    Números de control con ese correlativo en todas las series de DTE de las
+    empresas (dicts con codigo_establecimiento y codigo_punto_venta): buscar
+    "15" es una búsqueda exacta por el índice de numero_control.
+    """
+    numeros = set()
+    for empresa in empresas:
+        for tipo, _ in DTE.TIPO_DTE_CHOICES:
+            serie = f"DTE-{tipo}-{empresa['codigo_establecimiento']}{empresa['codigo_punto_venta']}"
+            numeros.add(_formato_control(serie, correlativo))
+    return sorted(numeros)
+
+
+def numero_control(empresa, tipo_dte):
+    """Número de control MH del próximo DTE de la empresa."""
+    serie = _serie_dte(empresa, tipo_dte)
+    numero = siguiente(serie, empresa.id, partial(_primer_correlativo, empresa.id, serie))
+    return _formato_control(serie, numero)
+
+
+def numeros_control(empresa, tipo_dte, cantidad):
+    """`cantidad` números de control consecutivos (emisión en lote), con una sola reserva."""
+    serie = _serie_dte(empresa, tipo_dte)
+    primero = reservar(serie, cantidad, empresa.id, partial(_primer_correlativo, empresa.id, serie))
+    return [_formato_control(serie, primero + i) for i in range(cantidad)]
+
+
+def _primer_codigo_producto(empresa_id):
+    # Continúa los códigos existentes; el más largo es el mayor (PRD10000 > PRD9999)
+    ultimo = (
+        Producto.objects.filter(empresa_id=empresa_id, codigo__regex=r'^PRD[0-9]+$')
+        .order_by(Length('codigo').desc(), '-codigo')
+        .values_list('codigo', flat=True).first()
+    )
+    return int(ultimo[3:]) + 1 if ultimo else 1
+
+
+def codigo_producto(empresa_id=None, reservar_numero=True):
+    """Código PRD0001, PRD0002... de la empresa. Con reservar_numero=False solo lo muestra."""
+    inicial = partial(_primer_codigo_producto, empresa_id)
+    if reservar_numero:
+        numero = siguiente('PRD', empresa_id, inicial)
+    else:
+        numero = proximo('PRD', empresa_id, inicial)
+    return f"PRD{numero:04d}"
+
+
+def _primera_compra():
+    # Continúa la numeración anterior (basada en el id de Compra)
+    return (Compra.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0) + 1
+
+
+def numeros_compra(empresa_id=None):
+    """(comprobante, registro) de una compra nueva: COMP-AAAAMMDD-0001 y REG-00001."""
+    numero = siguiente('COMPRA', empresa_id, _primera_compra)
+    return f"COMP-{localdate():%Y%m%d}-{numero:04d}", f"REG-{numero:05d}"
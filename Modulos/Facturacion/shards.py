@@ -0,0 +1,96 @@
+# ======================================================
+# 🗄️ SHARDS POR EMPRESA (router de bases de datos)
+# ======================================================
+"""
+Modo opcional en el que cada `Empresa` guarda sus datos en su propio alias
+de DATABASES (un archivo SQLite en desarrollo, un esquema de PostgreSQL en
+producción). Se activa definiendo DATABASE_SHARDS (ver settings).
+
+- `Empresa.base_datos` indica el alias; vacío = base principal.
+- El router envía los modelos de empresa (`MODELOS_POR_EMPRESA`) al alias
+  activo en `empresa_actual` (el middleware lo toma de `request.tenant`)
+  o al de la instancia relacionada (`dte.detalles`, `detalle.producto`...).
+- `Empresa`, `User`, `Perfil` y las sesiones siguen en la base principal.
+  Cada shard tiene una copia de la fila de su empresa y usuarios de
+  relleno (sin contraseña ni perfil) para que sus llaves foráneas sean
+  válidas; las señales los mantienen.
+
+Comandos: `crear_shard`, `migrar_shards` y `mover_empresa`. El worker de
+emisión procesa un shard por proceso (`procesar_emisiones --base-datos`).
+"""
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+
+from .empresa_actual import base_datos_actual
+from .replicas import ALIAS as REPLICA
+
+MODELOS_POR_EMPRESA = {
+    'cliente', 'producto', 'proveedor', 'compra', 'dte', 'detalledte',
+    'inventario', 'cierreinventario', 'resumenventasdiario', 'trabajoemision', 'secuencia',
+    'lotecontingencia',
+}
+
+# (alias, user_id) ya verificados en este proceso
+_usuarios_copiados = set()
+
+
+def es_shard(alias):
+    return alias not in (None, DEFAULT_DB_ALIAS, REPLICA)
+
+
+def es_de_empresa(modelo):
+    return modelo._meta.app_label == 'Facturacion' and modelo._meta.model_name in MODELOS_POR_EMPRESA
+
+
+class RouterEmpresas:
+
+    def _alias(self, model, **hints):
+        if not es_de_empresa(model):
+            return None
+        instancia = hints.get('instance')
+        # Solo se sigue a instancias de un shard (no de la principal ni de la réplica)
+        if instancia is not None and es_shard(instancia._state.db) and es_de_empresa(type(instancia)):
+            return instancia._state.db
+        return base_datos_actual()
+
+    db_for_read = _alias
+    db_for_write = _alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Empresa y User viven en la principal y tienen copia en cada shard
+        if not es_de_empresa(type(obj1)) or not es_de_empresa(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Todas las tablas existen en todos los alias (así las FK se validan)
+        return None
+
+
+# ======================================================
+# 📋 COPIAS EN EL SHARD
+# ======================================================
+def copiar_empresa(empresa, alias):
+    """Crea o actualiza en el shard la fila de la empresa (mismo id)."""
+    from .models import Empresa
+
+    valores = {
+        f.attname: getattr(empresa, f.attname)
+        for f in Empresa._meta.concrete_fields if not f.primary_key
+    }
+    if not Empresa.objects.using(alias).filter(pk=empresa.pk).update(**valores):
+        Empresa.objects.using(alias).bulk_create([Empresa(pk=empresa.pk, **valores)])
+
+
+def asegurar_usuario(alias, user_id):
+    """Usuario de relleno en el shard para las FK `usuario` de DTE y trabajos."""
+    if not user_id or alias in (None, DEFAULT_DB_ALIAS) or (alias, user_id) in _usuarios_copiados:
+        return
+    if not User.objects.using(alias).filter(pk=user_id).exists():
+        username = User.objects.filter(pk=user_id).values_list('username', flat=True).first()
+        # bulk_create no dispara post_save: no se crea Perfil en el shard
+        User.objects.using(alias).bulk_create(
+            [User(pk=user_id, username=username or f'usuario-{user_id}', password='!', is_active=False)],
+            ignore_conflicts=True,
+        )
+    _usuarios_copiados.add((alias, user_id))
@@ -1,10 +1,107 @@
 # signals.py
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Perfil
+from .models import Perfil, Empresa, DTE, DetalleDTE, Cliente, Proveedor, Producto, Compra, TrabajoEmision
+from .empresa_actual import empresa_actual
+from . import busqueda, middleware, pdf_cache, shards
 
 @receiver(post_save, sender=User)
 def crear_perfil(sender, instance, created, **kwargs):
     if created:
         Perfil.objects.create(user=instance, rol='Empleado')  # rol por defecto
+
+
+# ======================================================
+# 🏢 EMPRESA POR DEFECTO DE LOS REGISTROS NUEVOS
+# ======================================================
+@receiver(pre_save, sender=Cliente)
+@receiver(pre_save, sender=Producto)
+@receiver(pre_save, sender=Proveedor)
+@receiver(pre_save, sender=Compra)
+def asignar_empresa_actual(sender, instance, **kwargs):
+    # Sin esto, lo creado desde una petición quedaría fuera de `por_empresa`
+    if instance.empresa_id is None:
+        instance.empresa_id = empresa_actual()
+
+
+# ======================================================
+# 🏢 INVALIDAR CONTEXTO DEL USUARIO (middleware)
+# ======================================================
+@receiver([post_save, post_delete], sender=Perfil)
+def invalidar_contexto_perfil(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: middleware.invalidar_usuario(user_id))
+
+
+@receiver([post_save, post_delete], sender=Empresa)
+def invalidar_contexto_empresa(sender, instance, **kwargs):
+    transaction.on_commit(middleware.invalidar_empresas)
+
+
+# ======================================================
+# 🗄️ COPIAS EN EL SHARD DE LA EMPRESA (shards.py)
+# ======================================================
+@receiver(post_save, sender=Empresa)
+def copiar_empresa_a_shard(sender, instance, using=None, **kwargs):
+    if instance.base_datos and instance.base_datos != using:
+        shards.copiar_empresa(instance, instance.base_datos)
+
+
+@receiver(pre_save, sender=DTE)
+@receiver(pre_save, sender=TrabajoEmision)
+def copiar_usuario_a_shard(sender, instance, using=None, **kwargs):
+    shards.asegurar_usuario(using, instance.usuario_id)
+
+
+# ======================================================
+# 🗂️ INVALIDAR CACHÉ DE PDF
+# ======================================================
+@receiver([post_save, post_delete], sender=DTE)
+def invalidar_pdf_dte(sender, instance, **kwargs):
+    pdf_cache.invalidar_dte(instance.id)
+
+
+@receiver([post_save, post_delete], sender=DetalleDTE)
+def invalidar_pdf_detalle(sender, instance, **kwargs):
+    pdf_cache.invalidar_dte(instance.dte_id)
+
+
+@receiver([post_save, post_delete], sender=Cliente)
+def invalidar_pdf_cliente(sender, instance, **kwargs):
+    for dte_id in DTE.objects.filter(cliente_id=instance.id).values_list('id', flat=True):
+        pdf_cache.invalidar_dte(dte_id)
+
+
+# ======================================================
+# 🔎 ÍNDICE DE BÚSQUEDA
+# ======================================================
+@receiver(post_save, sender=Cliente)
+def indexar_cliente(sender, instance, created, update_fields=None, **kwargs):
+    busqueda.indexar('cliente', instance)
+    if not created and (update_fields is None or 'nombre' in update_fields):
+        busqueda.reindexar_dtes_de_cliente(instance.id, using=instance._state.db)
+
+
+@receiver(post_save, sender=Proveedor)
+def indexar_proveedor(sender, instance, **kwargs):
+    busqueda.indexar('proveedor', instance)
+
+
+@receiver(post_save, sender=Producto)
+def indexar_producto(sender, instance, **kwargs):
+    busqueda.indexar('producto', instance)
+
+
+@receiver(post_save, sender=DTE)
+def indexar_dte(sender, instance, **kwargs):
+    busqueda.indexar('dte', instance)
+
+
+@receiver(post_delete, sender=Cliente)
+@receiver(post_delete, sender=Proveedor)
+@receiver(post_delete, sender=Producto)
+@receiver(post_delete, sender=DTE)
+def quitar_de_busqueda(sender, instance, using=None, **kwargs):
+    busqueda.quitar(sender._meta.model_name, instance.id, using=using)
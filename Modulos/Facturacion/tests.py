@@ -1,3 +1,1596 @@
-from django.test import TestCase
+import base64
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock, skipIf
 
-# Create your tests here.
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509.oid import NameOID
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.utils import ConnectionHandler
+from django.db.models import Count, Q, Sum
+from django.db.models.signals import post_save
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import openpyxl
+from openpyxl.utils import get_column_letter
+
+from . import (
+    autocompletar, busqueda, cola_escrituras, contingencia, emision, existencias, exportaciones, firma, firma_pdf, mh,
+    paginacion, pdf_cache, qr, renderizador, replicas, secuencias, shards, signals,
+)
+from .cola_escrituras import escritura_serializada
+from .empresa_actual import usar_empresa
+from .firma_pdf import ErrorFirmaPDF
+from .middleware import ContextoUsuarioMiddleware, cargar_perfil
+from .models import (
+    DTE, CierreInventario, Cliente, Compra, DetalleDTE, Empresa, Inventario, Perfil, Producto, Proveedor,
+    ResumenVentasDiario, Secuencia, StockInsuficiente, TrabajoEmision, calcular_iva, totales_diferidos,
+)
+from .permisos import rol_requerido
+
+
+# ======================================================
+# 🧰 DATOS DE PRUEBA
+# ======================================================
+def crear_empresa(numero):
+    return Empresa.objects.create(
+        nombre=f"Empresa {numero}", nit=f"0614-00000{numero}-101-0", nrc=f"1000{numero}", direccion="San Salvador",
+    )
+
+
+def crear_usuario(nombre, empresa, rol='Administrador'):
+    # models.py y signals.py crean el perfil al crear el usuario: aquí se crea una sola vez
+    post_save.disconnect(signals.crear_perfil, sender=User)
+    try:
+        usuario = User.objects.create_user(nombre, password='clave')
+    finally:
+        post_save.connect(signals.crear_perfil, sender=User)
+    usuario.perfil.rol = rol
+    usuario.perfil.empresa = empresa
+    usuario.perfil.save()
+    return usuario
+
+
+class DatosEmpresas(TestCase):
+    """Dos empresas con su cliente y producto, y un usuario de la primera."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa, cls.otra = crear_empresa(1), crear_empresa(2)
+        cls.cliente = Cliente.objects.create(empresa=cls.empresa, nombre="Juan Pérez", nit="0614-123456-001-0", direccion="x")
+        cls.cliente_otra = Cliente.objects.create(empresa=cls.otra, nombre="Ana López", nit="0614-654321-001-0", direccion="y")
+        cls.producto = Producto.objects.create(empresa=cls.empresa, codigo="P1", descripcion="Café", precio_unitario=Decimal('2.50'))
+        cls.producto_otra = Producto.objects.create(empresa=cls.otra, codigo="P1", descripcion="Té", precio_unitario=Decimal('1.00'))
+        cls.usuario = crear_usuario('cajero', cls.empresa)
+
+    def setUp(self):
+        # Los ids de usuario se repiten entre pruebas: sin esto se leería el perfil cacheado de otra
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+
+# ======================================================
+# 📦 EMISIÓN EN LOTE
+# ======================================================
+class EmisionLoteTests(DatosEmpresas):
+
+    def lote(self, cliente, producto):
+        documentos = [{'cliente_id': cliente.id, 'detalles': [{'producto_id': producto.id, 'cantidad': 2}]}]
+        return self.client.post(reverse('emitir_dte_lote'), json.dumps(documentos), content_type='application/json')
+
+    def test_crea_dte_de_la_empresa_del_usuario(self):
+        respuesta = self.lote(self.cliente, self.producto)
+        self.assertEqual(respuesta.status_code, 200)
+        dte = DTE.objects.get(id=respuesta.json()['resultados'][0]['id'])
+        self.assertEqual(dte.empresa, self.empresa)
+        self.assertEqual(dte.subtotal, Decimal('5.00'))
+
+    def test_rechaza_cliente_de_otra_empresa(self):
+        respuesta = self.lote(self.cliente_otra, self.producto)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['clientes'], [self.cliente_otra.id])
+        self.assertFalse(DTE.objects.exists())
+
+    def test_rechaza_producto_de_otra_empresa(self):
+        respuesta = self.lote(self.cliente, self.producto_otra)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['productos'], [self.producto_otra.id])
+        self.assertFalse(DTE.objects.exists())
+
+    def test_documentos_validos_e_invalidos_en_el_mismo_lote(self):
+        linea = {'producto_id': self.producto.id, 'cantidad': 2}
+        documentos = [
+            {'cliente_id': self.cliente.id, 'detalles': [linea]},
+            {'cliente_id': self.cliente.id, 'detalles': 5},
+            {'cliente_id': self.cliente.id, 'detalles': {'producto_id': self.producto.id}},
+            'no es un objeto',
+            {'cliente_id': self.cliente.id, 'detalles': []},
+            {'cliente_id': self.cliente.id, 'tipo_dte': '99', 'detalles': [linea]},
+            {'cliente_id': self.cliente.id, 'detalles': [{'producto_id': self.producto.id, 'cantidad': '-1'}]},
+            {'cliente_id': self.cliente.id, 'detalles': [linea, linea], 'numero_control': 'LOTE-1'},
+            {'cliente_id': self.cliente.id, 'detalles': [linea], 'numero_control': 'LOTE-1'},
+        ]
+        respuesta = self.client.post(reverse('emitir_dte_lote'), json.dumps(documentos), content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual((datos['success'], datos['creados'], datos['fallidos']), (False, 2, 7))
+        self.assertEqual([r['success'] for r in datos['resultados']], [True] + [False] * 6 + [True, False])
+        self.assertEqual(
+            [r.get('error') for r in datos['resultados'][1:3]], ["'detalles' debe ser una lista."] * 2,
+        )
+        self.assertEqual(
+            sorted(DTE.objects.values_list('subtotal', flat=True)), [Decimal('5.00'), Decimal('10.00')],
+        )
+        self.assertEqual(DetalleDTE.objects.count(), 3)
+        # El lote no mueve inventario
+        self.assertFalse(Inventario.objects.exists())
+
+
+# ======================================================
+# ⏳ ESTADO DE LA EMISIÓN
+# ======================================================
+class EstadoEmisionTests(DatosEmpresas):
+
+    def trabajo(self, cliente, empresa, usuario=None):
+        dte = DTE.objects.create(empresa=empresa, cliente=cliente, tipo_dte='01')
+        return TrabajoEmision.objects.create(dte=dte, usuario=usuario)
+
+    def test_consulta_trabajo_de_su_empresa(self):
+        trabajo = self.trabajo(self.cliente, self.empresa)
+        respuesta = self.client.get(reverse('estado_emision', args=[trabajo.id]))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['estado'], 'Pendiente')
+
+    def test_no_expone_trabajos_de_otra_empresa(self):
+        trabajo = self.trabajo(self.cliente_otra, self.otra)
+        respuesta = self.client.get(reverse('estado_emision', args=[trabajo.id]))
+        self.assertEqual(respuesta.status_code, 404)
+
+    def test_sin_empresa_solo_sus_trabajos(self):
+        sin_empresa = crear_usuario('suelto', None)
+        propio = self.trabajo(self.cliente, self.empresa, usuario=sin_empresa)
+        ajeno = self.trabajo(self.cliente_otra, self.otra)
+        self.client.force_login(sin_empresa)
+        self.assertEqual(self.client.get(reverse('estado_emision', args=[propio.id])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('estado_emision', args=[ajeno.id])).status_code, 404)
+
+
+class ColaEmisionTests(DatosEmpresas):
+
+    def trabajo(self, **campos):
+        dte = DTE.objects.create(empresa=self.empresa, cliente=self.cliente, tipo_dte='01')
+        return TrabajoEmision.objects.create(dte=dte, **campos)
+
+    def test_reclama_el_mas_antiguo_una_sola_vez(self):
+        primero, segundo = self.trabajo(), self.trabajo()
+        tomado = emision.tomar_siguiente_trabajo()
+        self.assertEqual(tomado.id, primero.id)
+        self.assertEqual((tomado.estado, tomado.intentos), ('Procesando', 1))
+        self.assertEqual(emision.tomar_siguiente_trabajo().id, segundo.id)
+        self.assertIsNone(emision.tomar_siguiente_trabajo())
+
+    def test_respeta_disponible_desde(self):
+        self.trabajo(disponible_desde=timezone.now() + timedelta(minutes=5))
+        self.assertIsNone(emision.tomar_siguiente_trabajo())
+
+    def test_libera_trabajos_colgados(self):
+        colgado = self.trabajo(estado='Procesando')
+        activo = self.trabajo(estado='Procesando')
+        TrabajoEmision.objects.filter(id=colgado.id).update(actualizado=timezone.now() - timedelta(minutes=30))
+        self.assertEqual(emision.liberar_trabajos_colgados(minutos=10), 1)
+        self.assertEqual(TrabajoEmision.objects.get(id=colgado.id).estado, 'Pendiente')
+        self.assertEqual(TrabajoEmision.objects.get(id=activo.id).estado, 'Procesando')
+
+    @override_settings(EMISION_MAX_INTENTOS=2)
+    def test_reintenta_con_espera_y_luego_error(self):
+        trabajo = self.trabajo()
+        with mock.patch.object(emision, 'transmitir_a_hacienda', side_effect=RuntimeError('sin red')):
+            emision.procesar_trabajo(emision.tomar_siguiente_trabajo())
+            trabajo.refresh_from_db()
+            self.assertEqual((trabajo.estado, trabajo.intentos), ('Pendiente', 1))
+            self.assertGreater(trabajo.disponible_desde, timezone.now())
+            self.assertIsNone(emision.tomar_siguiente_trabajo())
+
+            TrabajoEmision.objects.filter(id=trabajo.id).update(disponible_desde=timezone.now())
+            emision.procesar_trabajo(emision.tomar_siguiente_trabajo())
+        trabajo.refresh_from_db()
+        self.assertEqual((trabajo.estado, trabajo.intentos, trabajo.error), ('Error', 2, 'sin red'))
+
+
+# ======================================================
+# 🏛️ TRANSMISIÓN AL MINISTERIO DE HACIENDA
+# ======================================================
+class CircuitoTests(SimpleTestCase):
+
+    def setUp(self):
+        self.reloj = 100.0
+        parche = mock.patch.object(mh.time, 'monotonic', lambda: self.reloj)
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.circuito = mh.Circuito(umbral=2, espera=30)
+
+    def test_se_abre_tras_fallos_seguidos(self):
+        self.circuito.fallo()
+        self.circuito.permitir()
+        self.assertEqual(self.circuito.estado, 'cerrado')
+        self.circuito.fallo()
+        self.assertEqual(self.circuito.estado, 'abierto')
+        with self.assertRaises(mh.CircuitoAbierto):
+            self.circuito.permitir()
+
+    def test_semiabierto_deja_pasar_una_sola_prueba(self):
+        self.circuito.fallo()
+        self.circuito.fallo()
+        self.reloj += 31
+        self.assertEqual(self.circuito.estado, 'semiabierto')
+        self.circuito.permitir()
+        with self.assertRaises(mh.CircuitoAbierto):
+            self.circuito.permitir()
+        self.circuito.exito()
+        self.assertEqual(self.circuito.estado, 'cerrado')
+        self.circuito.permitir()
+
+    def test_prueba_fallida_vuelve_a_abrir(self):
+        self.circuito.fallo()
+        self.circuito.fallo()
+        self.reloj += 31
+        self.circuito.permitir()
+        self.circuito.fallo()
+        self.assertEqual(self.circuito.estado, 'abierto')
+
+
+@override_settings(MH_REINTENTOS=2, MH_CIRCUITO_FALLOS=2, MH_CIRCUITO_SEGUNDOS=30)
+class ClienteMHTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cliente = mh.ClienteMH('http://mh.prueba', 'usuario', 'clave')
+        self.cliente.token = mock.Mock(return_value='token')
+        self.cliente.sesion.request = mock.Mock()
+        parche = mock.patch.object(mh.time, 'sleep')
+        self.espera = parche.start()
+        self.addCleanup(parche.stop)
+
+    def respuestas(self, *codigos):
+        self.cliente.sesion.request.side_effect = [
+            mock.Mock(status_code=codigo, json=mock.Mock(return_value=(
+                {'estado': 'PROCESADO', 'selloRecibido': 'SELLO'} if codigo == 200
+                else {'estado': 'RECHAZADO', 'descripcionMsg': 'NIT inválido'}
+            )))
+            for codigo in codigos
+        ]
+
+    def transmitir(self):
+        return self.cliente.transmitir({}, '01', 'CODIGO')
+
+    def test_reintenta_5xx_y_429(self):
+        self.respuestas(503, 429, 200)
+        self.assertEqual(self.transmitir()['selloRecibido'], 'SELLO')
+        self.assertEqual(self.cliente.sesion.request.call_count, 3)
+        self.assertEqual(self.espera.call_count, 2)
+
+    def test_rechazo_no_se_reintenta_ni_abre_el_circuito(self):
+        self.respuestas(400, 400)
+        for _ in range(2):
+            with self.assertRaises(mh.DocumentoRechazado):
+                self.transmitir()
+        self.assertEqual(self.cliente.sesion.request.call_count, 2)
+        self.assertEqual(self.cliente.circuito.estado, 'cerrado')
+
+    def test_401_renueva_el_token_una_vez(self):
+        self.respuestas(401, 200)
+        self.transmitir()
+        self.assertEqual(
+            [llamada.kwargs['renovar'] for llamada in self.cliente.token.call_args_list], [False, True],
+        )
+
+    def test_agotar_reintentos_abre_el_circuito(self):
+        self.respuestas(*[503] * 6)
+        for _ in range(2):
+            with self.assertRaises(mh.ErrorMH):
+                self.transmitir()
+        with self.assertRaises(mh.CircuitoAbierto):
+            self.transmitir()
+        # 3 intentos por transmisión; con el circuito abierto no se envía nada
+        self.assertEqual(self.cliente.sesion.request.call_count, 6)
+
+
+# ======================================================
+# 🚨 CONTINGENCIA
+# ======================================================
+class ContingenciaTests(DatosEmpresas):
+
+    def pendientes(self, cantidad, empresa=None, cliente=None):
+        return [
+            DTE.objects.create(
+                empresa=empresa or self.empresa, cliente=cliente or self.cliente, tipo_dte='01',
+                estado_mh='Contingencia', codigo_generacion=str(uuid.uuid4()).upper(),
+            )
+            for _ in range(cantidad)
+        ]
+
+    def test_arma_lotes_por_empresa_y_tamano(self):
+        self.pendientes(5)
+        self.pendientes(2, self.otra, self.cliente_otra)
+        DTE.objects.create(empresa=self.empresa, cliente=self.cliente, tipo_dte='01', estado_mh='Procesado')
+        lotes = contingencia.armar_lotes(tamano=3)
+        self.assertEqual([(l.empresa_id, l.documentos) for l in lotes],
+                         [(self.empresa.id, 3), (self.empresa.id, 2), (self.otra.id, 2)])
+        # Ningún DTE entra en dos lotes
+        self.assertEqual(contingencia.armar_lotes(tamano=3), [])
+        self.assertFalse(DTE.objects.filter(estado_mh='Contingencia', lote_contingencia__isnull=True).exists())
+
+    def test_conciliar_resultado_parcial_y_luego_completo(self):
+        dtes = self.pendientes(3)
+        lote, = contingencia.armar_lotes()
+        contingencia.conciliar(lote, dtes, {
+            'procesados': [{'codigoGeneracion': dtes[0].codigo_generacion, 'selloRecibido': 'SELLO0'}],
+            'rechazados': [{'codigoGeneracion': dtes[1].codigo_generacion}],
+        })
+        self.assertEqual((lote.estado, lote.procesados, lote.rechazados), ('Enviado', 1, 1))
+        self.assertEqual(
+            list(DTE.objects.order_by('id').values_list('estado_mh', 'sello_recepcion')),
+            [('Procesado', 'SELLO0'), ('Rechazado', None), ('Contingencia', None)],
+        )
+
+        contingencia.conciliar(lote, [dtes[2]], {
+            'procesados': [{'codigoGeneracion': dtes[2].codigo_generacion, 'selloRecibido': 'SELLO2'}],
+        })
+        self.assertEqual((lote.estado, lote.procesados, lote.rechazados), ('Completado', 2, 1))
+
+    def transmitir(self, cliente):
+        lote, = contingencia.armar_lotes()
+        with mock.patch.object(mh, 'cliente', return_value=cliente), \
+                mock.patch.object(contingencia.firma, 'firmar_lote', side_effect=lambda empresa, docs: docs):
+            return contingencia.transmitir_lote(lote)
+
+    def test_transmite_y_concilia_el_lote(self):
+        dtes = self.pendientes(2)
+        cliente = mock.Mock()
+        cliente.enviar_lote.return_value = 'LOTE-1'
+        cliente.consultar_lote.return_value = {
+            'procesados': [{'codigoGeneracion': d.codigo_generacion, 'selloRecibido': f"S{d.id}"} for d in dtes],
+        }
+        lote = self.transmitir(cliente)
+        self.assertEqual((lote.estado, lote.codigo_lote, lote.procesados), ('Completado', 'LOTE-1', 2))
+        cliente.consultar_lote.assert_called_once_with('LOTE-1')
+        self.assertEqual(DTE.objects.filter(estado_mh='Procesado').count(), 2)
+
+    def test_lote_rechazado_completo(self):
+        self.pendientes(2)
+        cliente = mock.Mock()
+        cliente.enviar_lote.side_effect = mh.DocumentoRechazado("MH rechazó el lote: NIT inválido")
+        lote = self.transmitir(cliente)
+        self.assertEqual((lote.estado, lote.rechazados), ('Error', 2))
+        cliente.consultar_lote.assert_not_called()
+        self.assertEqual(DTE.objects.filter(estado_mh='Rechazado').count(), 2)
+
+
+# ======================================================
+# 🔏 FIRMA JWS
+# ======================================================
+class FirmaJWSTests(SimpleTestCase):
+
+    documento = {'numero_control': 'DTE-01-M001P001-000000000000001', 'cliente': 'Juan Pérez', 'total': 2.83}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.rsa = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+        self.addCleanup(firma._llaves.clear)
+
+    def guardar_pem(self, llave, nombre, clave=None):
+        cifrado = serialization.BestAvailableEncryption(clave) if clave else serialization.NoEncryption()
+        ruta = os.path.join(self.directorio, nombre)
+        with open(ruta, 'wb') as archivo:
+            archivo.write(llave.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, cifrado))
+        return ruta
+
+    def test_rsa_ida_y_vuelta(self):
+        jws = firma.firmar(self.documento, self.rsa)
+        cabecera = json.loads(base64.urlsafe_b64decode(jws.split('.')[0] + '=='))
+        self.assertEqual(cabecera, {'alg': 'RS512', 'typ': 'JWS'})
+        self.assertEqual(firma.verificar(jws, self.rsa.public_key()), self.documento)
+
+    def test_ec_ida_y_vuelta(self):
+        curvas = ((ec.SECP256R1(), 'ES256', 32), (ec.SECP384R1(), 'ES384', 48), (ec.SECP521R1(), 'ES512', 66))
+        for curva, alg, ancho in curvas:
+            with self.subTest(alg=alg):
+                llave = ec.generate_private_key(curva)
+                jws = firma.firmar(self.documento, llave)
+                self.assertIn(alg, base64.urlsafe_b64decode(jws.split('.')[0] + '==').decode())
+                # r||s de ancho fijo, no DER
+                self.assertEqual(len(base64.urlsafe_b64decode(jws.split('.')[2] + '==')), 2 * ancho)
+                self.assertEqual(firma.verificar(jws, llave.public_key()), self.documento)
+
+    def test_contenido_alterado_no_verifica(self):
+        cabecera, _, firma_jws = firma.firmar(self.documento, self.rsa).split('.')
+        otro = firma.firmar(dict(self.documento, total=1.00), self.rsa).split('.')[1]
+        with self.assertRaises(InvalidSignature):
+            firma.verificar(f"{cabecera}.{otro}.{firma_jws}", self.rsa.public_key())
+
+    def test_llave_cargada_una_vez_por_version_del_archivo(self):
+        ruta = self.guardar_pem(self.rsa, '06140000000000.pem', b'secreta')
+        llave = firma.cargar_llave(ruta, b'secreta')
+        self.assertIs(firma.cargar_llave(ruta, b'secreta'), llave)
+        os.utime(ruta, ns=(0, os.stat(ruta).st_mtime_ns + 1))
+        self.assertIsNot(firma.cargar_llave(ruta, b'secreta'), llave)
+
+    def test_llave_con_clave_incorrecta(self):
+        ruta = self.guardar_pem(self.rsa, '06140000000000.pem', b'secreta')
+        with self.assertRaises(firma.ErrorFirma):
+            firma.cargar_llave(ruta, b'otra')
+
+    def test_lote_con_y_sin_llave(self):
+        empresa = Empresa(nit='0614-000000-000-0', nit_normalizado='06140000000000')
+        with override_settings(FIRMA_DIR=self.directorio, FIRMA_CLAVE='', FIRMA_PROCESOS=0):
+            self.assertEqual(firma.firmar_lote(empresa, [self.documento]), [self.documento])
+            self.guardar_pem(self.rsa, '06140000000000.pem')
+            jws, = firma.firmar_lote(empresa, [self.documento])
+        self.assertEqual(firma.verificar(jws, self.rsa.public_key()), self.documento)
+
+
+# ======================================================
+# 🗄️ ROUTERS DE BASES DE DATOS
+# ======================================================
+class RouterEmpresasTests(SimpleTestCase):
+
+    router = shards.RouterEmpresas()
+
+    def instancia(self, modelo, alias):
+        objeto = modelo()
+        objeto._state.db = alias
+        return objeto
+
+    def test_modelos_de_empresa_van_al_shard_activo(self):
+        self.assertIsNone(self.router.db_for_read(DTE))
+        with usar_empresa(2, 'empresa2'):
+            self.assertEqual(self.router.db_for_read(DTE), 'empresa2')
+            self.assertEqual(self.router.db_for_write(DetalleDTE), 'empresa2')
+            # Empresa, User y Perfil siguen en la principal
+            self.assertIsNone(self.router.db_for_read(Empresa))
+            self.assertIsNone(self.router.db_for_write(User))
+
+    def test_sigue_a_la_instancia_de_un_shard(self):
+        dte = self.instancia(DTE, 'empresa3')
+        with usar_empresa(2, 'empresa2'):
+            self.assertEqual(self.router.db_for_read(DetalleDTE, instance=dte), 'empresa3')
+            # Las instancias de la principal o de la réplica no fijan el alias
+            for alias in ('default', replicas.ALIAS):
+                dte = self.instancia(DTE, alias)
+                self.assertEqual(self.router.db_for_read(DetalleDTE, instance=dte), 'empresa2')
+
+    def test_relaciones(self):
+        dte = self.instancia(DTE, 'empresa2')
+        self.assertTrue(self.router.allow_relation(dte, self.instancia(Empresa, 'default')))
+        self.assertIsNone(self.router.allow_relation(dte, self.instancia(Cliente, 'empresa3')))
+
+
+class RouterReplicaTests(SimpleTestCase):
+
+    router = replicas.RouterReplica()
+
+    def test_solo_las_vistas_marcadas_leen_de_la_replica(self):
+        self.assertIsNone(self.router.db_for_read(DTE))
+        with replicas.usar_replica():
+            self.assertEqual(self.router.db_for_read(DTE), replicas.ALIAS)
+            with replicas.usar_primaria():
+                self.assertIsNone(self.router.db_for_read(DTE))
+            self.assertEqual(self.router.db_for_write(DTE), 'default')
+
+    def test_lee_lo_que_escribio(self):
+        with replicas.usar_replica():
+            token = replicas.iniciar_peticion(escritura_reciente=True)
+            self.assertEqual(self.router.db_for_read(DTE), 'default')
+            self.assertFalse(replicas.terminar_peticion(token))
+
+            token = replicas.iniciar_peticion(escritura_reciente=False)
+            self.assertEqual(self.router.db_for_read(DTE), replicas.ALIAS)
+            self.router.db_for_write(DTE)
+            self.assertEqual(self.router.db_for_read(DTE), 'default')
+            self.assertTrue(replicas.terminar_peticion(token))
+
+    def test_streaming_se_lee_de_la_replica(self):
+        @replicas.lectura_replica
+        def vista(request):
+            return StreamingHttpResponse(self.router.db_for_read(DTE) for _ in range(2))
+
+        respuesta = vista(None)
+        # Las filas se leen fuera de la vista, con su contexto
+        self.assertEqual(list(respuesta.streaming_content), [b'replica', b'replica'])
+
+    def test_no_migra_la_replica(self):
+        self.assertIs(self.router.allow_migrate(replicas.ALIAS, 'Facturacion'), False)
+        self.assertIsNone(self.router.allow_migrate('default', 'Facturacion'))
+
+
+# ======================================================
+# ✍️ SQLITE EN PRODUCCIÓN Y COLA DE ESCRITURAS
+# ======================================================
+class SqliteProduccionTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+
+    @skipIf(os.getenv('SQLITE_PRODUCCION') == '1', "perfil activado en el entorno")
+    def test_desactivado_por_defecto(self):
+        self.assertNotIn('init_command', settings.DATABASES['default'].get('OPTIONS', {}))
+
+    def test_pragmas_en_una_conexion_nueva(self):
+        bases = ConnectionHandler({'default': {'ENGINE': 'django.db.backends.dummy'}, 'produccion': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(self.directorio, 'produccion.sqlite3'),
+            'OPTIONS': dict(settings.SQLITE_OPCIONES_PRODUCCION),
+        }})
+        conexion = bases['produccion']
+        self.addCleanup(conexion.close)
+        with conexion.cursor() as cursor:
+            valores = {}
+            for pragma in ('journal_mode', 'busy_timeout', 'synchronous', 'temp_store'):
+                cursor.execute(f'PRAGMA {pragma}')
+                valores[pragma] = cursor.fetchone()[0]
+        self.assertEqual(valores, {
+            'journal_mode': 'wal',
+            'busy_timeout': int(settings.SQLITE_OPCIONES_PRODUCCION['timeout'] * 1000),
+            'synchronous': 1,  # NORMAL
+            'temp_store': 2,   # MEMORY
+        })
+
+
+class ColaEscriturasTests(SimpleTestCase):
+
+    def setUp(self):
+        self.addCleanup(self.reiniciar_cola)
+
+    def reiniciar_cola(self):
+        if cola_escrituras._escritor is not None:
+            cola_escrituras._escritor.shutdown()
+        cola_escrituras._escritor = cola_escrituras._cupos = None
+
+    def en_paralelo(self, vista, peticiones):
+        respuestas = []
+        hilos = [threading.Thread(target=lambda p=p: respuestas.append(vista(p))) for p in peticiones]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join(10)
+        return respuestas
+
+    def test_escritores_no_se_intercalan(self):
+        registro = []
+
+        @escritura_serializada
+        def vista(request):
+            numero = request.POST.get('n') or request.GET['n']
+            registro.append(('inicio', numero, threading.current_thread().name))
+            time.sleep(0.01)
+            registro.append(('fin', numero, threading.current_thread().name))
+            return HttpResponse(numero)
+
+        fabrica = RequestFactory()
+        with self.settings(SQLITE_COLA_ESCRITURAS=True, SQLITE_COLA_MAXIMO=16):
+            respuestas = self.en_paralelo(vista, [fabrica.post('/', {'n': str(n)}) for n in range(8)])
+            # Las lecturas no pasan por la cola
+            vista(fabrica.get('/', {'n': 'lectura'}))
+
+        self.assertEqual(sorted(int(r.content) for r in respuestas), list(range(8)))
+        escrituras, lectura = registro[:16], registro[16:]
+        for inicio, fin in zip(escrituras[::2], escrituras[1::2]):
+            self.assertEqual((inicio[0], fin[0], inicio[1]), ('inicio', 'fin', fin[1]))
+        self.assertTrue(all(nombre.startswith('escritor-sqlite') for _, _, nombre in escrituras))
+        self.assertEqual(lectura[0][2], threading.current_thread().name)
+
+    def test_cola_llena_responde_503(self):
+        ocupado, liberar = threading.Event(), threading.Event()
+
+        @escritura_serializada
+        def vista(request):
+            ocupado.set()
+            liberar.wait(10)
+            return HttpResponse('ok')
+
+        fabrica = RequestFactory()
+        with self.settings(SQLITE_COLA_ESCRITURAS=True, SQLITE_COLA_MAXIMO=1):
+            primera = []
+            hilo = threading.Thread(target=lambda: primera.append(vista(fabrica.post('/'))))
+            hilo.start()
+            self.assertTrue(ocupado.wait(10))
+            respuesta = vista(fabrica.post('/'))
+            liberar.set()
+            hilo.join(10)
+
+        self.assertEqual((respuesta.status_code, respuesta['Retry-After']), (503, '2'))
+        self.assertEqual(primera[0].content, b'ok')
+
+
+# ======================================================
+# 📑 PAGINACIÓN POR CURSOR
+# ======================================================
+class PaginacionTests(DatosEmpresas):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        dtes = [DTE.objects.create(empresa=cls.empresa, cliente=cls.cliente, tipo_dte='01') for _ in range(7)]
+        # Fechas repetidas: el desempate por id debe mantener el orden
+        ayer = timezone.now() - timedelta(days=1)
+        DTE.objects.filter(id__in=[d.id for d in dtes[:4]]).update(fecha_emision=ayer)
+        cls.orden = list(DTE.objects.order_by('-fecha_emision', '-id').values_list('id', flat=True))
+
+    def paginas(self, tamano=3):
+        vistas, cursor = [], None
+        while True:
+            pagina = paginacion.paginar(DTE.objects.all(), paginacion.ORDEN_DTE, despues=cursor, tamano=tamano)
+            vistas.append(pagina)
+            cursor = pagina.siguiente
+            if not cursor:
+                return vistas
+
+    def test_recorre_todo_una_vez_y_en_orden(self):
+        paginas = self.paginas()
+        self.assertEqual([len(p) for p in paginas], [3, 3, 1])
+        self.assertEqual([d.id for p in paginas for d in p], self.orden)
+        self.assertIsNone(paginas[0].anterior)
+
+    def test_antes_devuelve_la_pagina_previa(self):
+        paginas = self.paginas()
+        previa = paginacion.paginar(DTE.objects.all(), paginacion.ORDEN_DTE, antes=paginas[2].anterior, tamano=3)
+        self.assertEqual([d.id for d in previa], [d.id for d in paginas[1]])
+        primera = paginacion.paginar(DTE.objects.all(), paginacion.ORDEN_DTE, antes=previa.anterior, tamano=3)
+        self.assertEqual([d.id for d in primera], [d.id for d in paginas[0]])
+        self.assertIsNone(primera.anterior)
+
+    def test_sin_offset(self):
+        cursor = self.paginas()[1].siguiente
+        with CaptureQueriesContext(connection) as consultas:
+            paginacion.paginar(DTE.objects.all(), paginacion.ORDEN_DTE, despues=cursor, tamano=3)
+        self.assertNotIn('OFFSET', consultas.captured_queries[0]['sql'].upper())
+
+    def test_cursor_invalido(self):
+        # Texto cualquiera y un cursor con menos valores que el orden
+        for cursor in ('basura', paginacion._codificar(DTE.objects.first(), ('id',))):
+            with self.subTest(cursor=cursor), self.assertRaises(paginacion.CursorInvalido):
+                paginacion.paginar(DTE.objects.all(), paginacion.ORDEN_DTE, despues=cursor)
+        # En la vista: la primera página
+        respuesta = self.client.get(reverse('lista_dte_json'), {'despues': 'basura', 'tamano': 3})
+        self.assertEqual([d['id'] for d in respuesta.json()['resultados']], self.orden[:3])
+
+
+# ======================================================
+# 🏢 AISLAMIENTO ENTRE EMPRESAS
+# ======================================================
+class AislamientoEmpresasTests(DatosEmpresas):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.dte_propio = DTE.objects.create(empresa=cls.empresa, cliente=cls.cliente, tipo_dte='01')
+        cls.dte_ajeno = DTE.objects.create(empresa=cls.otra, cliente=cls.cliente_otra, tipo_dte='01')
+
+    def clientes(self, q):
+        return [c['id'] for c in self.client.get(reverse('buscar_cliente'), {'q': q}).json()['resultados']]
+
+    def sugerencias(self, q):
+        return [fila[0] for fila in self.client.get(reverse('autocompletar_dte'), {'q': q}).json()['r']]
+
+    def test_manager_sin_empresa_no_devuelve_nada(self):
+        self.assertFalse(Cliente.por_empresa.exists())
+        with usar_empresa(self.empresa.id):
+            self.assertEqual(list(Cliente.por_empresa.all()), [self.cliente])
+        with usar_empresa(None, todas=True):
+            self.assertEqual(Cliente.por_empresa.count(), 2)
+
+    def test_usuario_de_una_empresa_no_ve_la_otra(self):
+        self.assertEqual(self.clientes('Ana'), [])
+        self.assertEqual(self.clientes('0614-654321-001-0'), [])
+        self.assertEqual(self.sugerencias('Ana'), [])
+        self.assertEqual(self.sugerencias('Juan'), [self.dte_propio.id])
+
+    def test_usuario_sin_empresa_no_ve_ninguna(self):
+        self.client.force_login(crear_usuario('suelto', None, rol='Empleado'))
+        self.assertEqual(self.clientes('Juan'), [])
+        self.assertEqual(self.sugerencias('Juan'), [])
+        self.assertEqual(self.client.get(reverse('buscar_dte'), {'q': 'Juan'}).json()['resultados'], [])
+        self.assertEqual(self.client.get(reverse('exportar_anexo_csv', args=['compras'])).status_code, 403)
+
+    def test_administrador_sin_empresa_ve_todas(self):
+        self.client.force_login(crear_usuario('admin', None))
+        self.assertEqual(self.clientes('Ana'), [self.cliente_otra.id])
+        self.assertEqual(self.sugerencias('Ana'), [self.dte_ajeno.id])
+
+    def test_cache_de_sugerencias_no_cruza_el_alcance(self):
+        self.client.force_login(crear_usuario('admin', None))
+        self.assertEqual(self.sugerencias('Ana'), [self.dte_ajeno.id])
+        # Misma consulta, también sin empresa activa, pero sin permiso para todas
+        self.client.force_login(crear_usuario('suelto', None, rol='Empleado'))
+        self.assertEqual(self.sugerencias('Ana'), [])
+
+
+# ======================================================
+# 🪪 CONTEXTO DEL USUARIO (middleware)
+# ======================================================
+class ContextoUsuarioTests(DatosEmpresas):
+
+    def autorizar(self, roles):
+        """Pasa una petición por ContextoUsuarioMiddleware y rol_requerido."""
+        request = RequestFactory().get('/')
+        request.user = self.usuario
+        request._messages = CookieStorage(request)
+        vista = rol_requerido(roles)(lambda request: HttpResponse('ok'))
+        return ContextoUsuarioMiddleware(vista)(request)
+
+    def test_autorizacion_con_cache_no_consulta(self):
+        self.assertEqual(self.autorizar(['Empleado']).status_code, 200)
+        with self.assertNumQueries(0):
+            respuesta = self.autorizar(['Empleado'])
+        self.assertEqual(respuesta.content, b'ok')
+
+    def test_cambio_de_perfil_se_aplica_al_confirmar(self):
+        self.assertEqual(self.autorizar(['Contador']).status_code, 200)
+        perfil = Perfil.objects.get(user=self.usuario)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            perfil.rol = 'Empleado'
+            perfil.save()
+            # Sin confirmar la transacción se sigue usando el perfil cacheado
+            self.assertEqual(self.autorizar(['Contador']).status_code, 200)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.autorizar(['Contador']).status_code, 302)
+        self.assertEqual(self.autorizar(['Empleado']).status_code, 200)
+
+    def test_cambio_de_empresa_invalida_a_todos(self):
+        self.assertEqual(cargar_perfil(self.usuario).empresa.nombre, "Empresa 1")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.empresa.nombre = "Empresa Uno"
+            self.empresa.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(cargar_perfil(self.usuario).empresa.nombre, "Empresa Uno")
+        with self.assertNumQueries(0):
+            cargar_perfil(self.usuario)
+
+
+# ======================================================
+# 🔎 BÚSQUEDA
+# ======================================================
+class BusquedaTests(DatosEmpresas):
+
+    def test_coincidencias_de_otras_empresas_no_desplazan_las_propias(self):
+        # Textos cortos: mejor puntaje bm25 que el cliente de la empresa 1
+        Cliente.objects.bulk_create([
+            Cliente(empresa=self.otra, nombre="Juan", nit=f"0614-9999{i:02d}-001-0", direccion="z") for i in range(40)
+        ])
+        busqueda.reconstruir()
+        with usar_empresa(self.empresa.id):
+            encontrados = busqueda.buscar(Cliente.por_empresa.all(), 'cliente', 'juan', respaldo=Q(nombre__icontains='juan'))
+        self.assertEqual(encontrados, [self.cliente])
+
+    def test_respeta_el_limite(self):
+        Cliente.objects.bulk_create([
+            Cliente(empresa=self.empresa, nombre=f"Juan {i}", nit=f"0614-8888{i:02d}-001-0", direccion="z") for i in range(15)
+        ])
+        busqueda.reconstruir()
+        with usar_empresa(self.empresa.id):
+            encontrados = busqueda.buscar(Cliente.por_empresa.all(), 'cliente', 'juan', respaldo=Q(), limite=10)
+        self.assertEqual(len(encontrados), 10)
+        self.assertTrue(all(c.empresa_id == self.empresa.id for c in encontrados))
+
+
+class DocumentosNormalizadosTests(DatosEmpresas):
+    """NIT/DUI/NRC exactos por la columna normalizada, con o sin guiones."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.con_dui = Cliente.objects.create(
+            empresa=cls.empresa, nombre="María Gómez", dui="01234567-8", nrc="123456-7", direccion="z",
+        )
+        cls.dte = DTE.objects.create(empresa=cls.empresa, cliente=cls.cliente, tipo_dte='01')
+
+    def ids(self, vista, q):
+        return [fila['id'] for fila in self.client.get(reverse(vista), {'q': q}).json()['resultados']]
+
+    def test_save_normaliza_los_documentos(self):
+        self.assertEqual(
+            (self.cliente.nit_normalizado, self.con_dui.dui_normalizado, self.con_dui.nrc_normalizado),
+            ('06141234560010', '012345678', '1234567'),
+        )
+        self.con_dui.dui = "9876543-21"
+        self.con_dui.save(update_fields=['dui'])
+        self.assertEqual(Cliente.objects.get(id=self.con_dui.id).dui_normalizado, '987654321')
+
+    def test_busqueda_exacta_con_y_sin_guiones(self):
+        casos = [
+            (self.cliente, ('0614-123456-001-0', '06141234560010', '0614 123456 001 0')),
+            (self.con_dui, ('01234567-8', '012345678', '123456-7', '1234567')),
+        ]
+        # Un documento completo no pasa por el índice de búsqueda
+        falla = mock.Mock(side_effect=AssertionError("no debió usar el índice de búsqueda"))
+        with mock.patch.object(busqueda, 'buscar', falla), mock.patch.object(busqueda, 'filtrar', falla):
+            for cliente, consultas in casos:
+                for q in consultas:
+                    with self.subTest(q=q):
+                        self.assertEqual(self.ids('buscar_cliente', q), [cliente.id])
+                        self.assertEqual(self.ids('lista_clientes_json', q), [cliente.id])
+            self.assertEqual(self.ids('buscar_dte', '06141234560010'), [self.dte.id])
+            # El cliente de otra empresa no se encuentra aunque el NIT coincida
+            self.assertEqual(
+                [c.id for c in Cliente.por_documento('0614654321-0010', Cliente.objects.filter(empresa=self.empresa))],
+                [],
+            )
+
+    def test_fila_rellenada_por_la_migracion(self):
+        migracion = importlib.import_module('Modulos.Facturacion.migrations.0017_documentos_normalizados')
+        # Filas anteriores a la migración: columnas normalizadas vacías
+        Cliente.objects.filter(id__in=[self.cliente.id, self.con_dui.id]).update(
+            nit_normalizado='', dui_normalizado='', nrc_normalizado='',
+        )
+        self.assertEqual(self.ids('buscar_cliente', '0614-123456-001-0'), [self.cliente.id])  # respaldo por nombre/NIT
+        with usar_empresa(self.empresa.id):
+            self.assertFalse(Cliente.por_documento('0614-123456-001-0').exists())
+
+        migracion.normalizar_documentos(django_apps, mock.Mock(connection=connection))
+        self.assertEqual(
+            list(Cliente.objects.filter(id=self.con_dui.id).values_list('dui_normalizado', 'nrc_normalizado')),
+            [('012345678', '1234567')],
+        )
+        with usar_empresa(self.empresa.id):
+            self.assertEqual(list(Cliente.por_documento('0614-123456-001-0')), [self.cliente])
+            self.assertEqual(list(Cliente.por_documento('01234567-8')), [self.con_dui])
+        self.assertEqual(Empresa.objects.get(id=self.empresa.id).nit_normalizado, '06140000011010')
+
+
+class AutocompletarTests(DatosEmpresas):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.dtes = {}
+        for empresa, nombre in [
+            (cls.empresa, "Juan Pérez"), (cls.empresa, "Juana Ríos"), (cls.empresa, "Juao Díaz"),
+            (cls.empresa, "Juan 漢字"), (cls.empresa, "José Ñúñez"),
+            (cls.empresa, "Carla Ruiz"), (cls.otra, "Carla Soto"),
+        ]:
+            cliente = cls.cliente if nombre == cls.cliente.nombre else Cliente.objects.create(
+                empresa=empresa, nombre=nombre, direccion="z",
+            )
+            cls.dtes[nombre] = DTE.objects.create(empresa=empresa, cliente=cliente, tipo_dte='01').id
+
+    def sugerencias(self, q, **parametros):
+        return self.client.get(reverse('autocompletar_dte'), {'q': q, **parametros})
+
+    def ids(self, q):
+        return {fila[0] for fila in self.sugerencias(q).json()['r']}
+
+    def test_prefijo_sin_acentos_ni_mayusculas(self):
+        jose = {self.dtes["José Ñúñez"]}
+        for q in ('jose', 'JOSÉ', 'José ñu', '  jose   NUÑ '):
+            with self.subTest(q=q):
+                self.assertEqual(self.ids(q), jose)
+
+    def test_limite_superior_del_rango(self):
+        # 'juan' incluye 'juana' y nombres con caracteres altos, pero no 'juao'
+        self.assertEqual(
+            self.ids('juan'), {self.dtes["Juan Pérez"], self.dtes["Juana Ríos"], self.dtes["Juan 漢字"]},
+        )
+        self.assertEqual(self.ids('juan 漢'), {self.dtes["Juan 漢字"]})
+        self.assertEqual(self.ids('juao'), {self.dtes["Juao Díaz"]})
+
+    def test_cache_por_empresa(self):
+        with usar_empresa(self.empresa.id):
+            filas = autocompletar.sugerencias('carla')
+            with self.assertNumQueries(0):
+                self.assertEqual(autocompletar.sugerencias('Carla '), filas)
+        self.assertEqual([fila[0] for fila in filas], [self.dtes["Carla Ruiz"]])
+
+        # Misma consulta con la caché caliente: otra empresa obtiene sus propios DTE
+        with usar_empresa(self.otra.id):
+            self.assertEqual([fila[0] for fila in autocompletar.sugerencias('carla')], [self.dtes["Carla Soto"]])
+        self.client.force_login(crear_usuario('vendedor', self.otra))
+        self.assertEqual(self.ids('carla'), {self.dtes["Carla Soto"]})
+
+    def test_devuelve_seq_y_exige_minimo(self):
+        respuesta = self.sugerencias('j', seq='7')
+        self.assertEqual(respuesta.json(), {'seq': '7', 'r': []})
+        self.assertIn('private', respuesta['Cache-Control'])
+
+    def test_rechaza_anonimos(self):
+        self.client.logout()
+        respuesta = self.sugerencias('juan')
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertTrue(respuesta.url.startswith(reverse('login')))
+
+
+# ======================================================
+# 🔢 NUMERACIÓN DE DTE
+# ======================================================
+class NumeracionTests(DatosEmpresas):
+
+    def dte(self, empresa=None, cliente=None, **campos):
+        return DTE.objects.create(empresa=empresa or self.empresa, cliente=cliente or self.cliente, tipo_dte='01', **campos)
+
+    def test_series_consecutivas_por_empresa(self):
+        numeros = [self.dte().numero_control for _ in range(3)]
+        self.assertEqual(numeros, [f"DTE-01-M001P001-{i:015d}" for i in (1, 2, 3)])
+        # La otra empresa numera su propia serie desde 1
+        self.assertEqual(self.dte(self.otra, self.cliente_otra).numero_control, "DTE-01-M001P001-000000000000001")
+
+    def test_numero_revertido_se_reutiliza(self):
+        self.dte()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.assertTrue(self.dte().numero_control.endswith('2'))
+            raise RuntimeError
+        self.assertEqual(self.dte().numero_control, "DTE-01-M001P001-000000000000002")
+
+    def test_editar_por_id_con_numero_repetido_en_otra_empresa(self):
+        propio, ajeno = self.dte(), self.dte(self.otra, self.cliente_otra)
+        self.assertEqual(propio.numero_control, ajeno.numero_control)
+        # Administrador sin empresa: el único que ve todas las empresas
+        self.client.force_login(crear_usuario('admin', None))
+        self.assertEqual(self.client.get(reverse('editar_dte', args=[ajeno.id])).status_code, 200)
+        respuesta = self.client.post(
+            reverse('actualizar_dte', args=[ajeno.id]), json.dumps({'condicion_pago': 'Crédito'}),
+            content_type='application/json',
+        )
+        self.assertTrue(respuesta.json()['success'])
+        propio.refresh_from_db()
+        ajeno.refresh_from_db()
+        self.assertEqual((propio.condicion_pago, ajeno.condicion_pago), ('Contado', 'Crédito'))
+
+    def test_editar_dte_de_otra_empresa_no_existe(self):
+        ajeno = self.dte(self.otra, self.cliente_otra)
+        self.assertEqual(self.client.get(reverse('editar_dte', args=[ajeno.id])).status_code, 404)
+
+    def test_busqueda_por_correlativo_corto(self):
+        dte = self.dte(numero_control="DTE-01-M001P001-000000000000015")
+        self.dte(self.otra, self.cliente_otra, numero_control="DTE-01-M001P001-000000000000015")
+        encontrados = self.client.get(reverse('buscar_dte'), {'q': '15'}).json()
+        self.assertEqual([d['id'] for d in encontrados['resultados']], [dte.id])
+        sugerencias = self.client.get(reverse('autocompletar_dte'), {'q': '15'}).json()['r']
+        self.assertEqual([fila[0] for fila in sugerencias], [dte.id])
+
+
+@override_settings(SECUENCIA_BLOQUE=5)
+class BloquesSecuenciaTests(DatosEmpresas):
+
+    def setUp(self):
+        super().setUp()
+        secuencias._bloques.clear()
+        self.addCleanup(secuencias._bloques.clear)
+
+    def siguiente(self):
+        return secuencias.siguiente('PRUEBA', self.empresa.id)
+
+    def contador(self):
+        return Secuencia.objects.get(empresa=self.empresa, serie='PRUEBA').siguiente
+
+    def test_bloque_se_entrega_desde_memoria(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.siguiente(), 1)
+        self.assertEqual(self.contador(), 6)
+        with self.assertNumQueries(0):
+            self.assertEqual([self.siguiente() for _ in range(4)], [2, 3, 4, 5])
+        # Bloque agotado: se reserva el siguiente
+        self.assertEqual(self.siguiente(), 6)
+        self.assertEqual(self.contador(), 11)
+
+    def test_bloque_revertido_no_se_publica(self):
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.assertEqual(self.siguiente(), 1)
+                raise RuntimeError
+        self.assertEqual(secuencias._bloques, {})
+        self.assertEqual(self.siguiente(), 1)
+
+    def test_cada_empresa_con_su_bloque(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.siguiente(), 1)
+            self.assertEqual(secuencias.siguiente('PRUEBA', self.otra.id), 1)
+        self.assertEqual(self.siguiente(), 2)
+        self.assertEqual(secuencias.siguiente('PRUEBA', self.otra.id), 2)
+
+    def test_lote_reserva_numeros_consecutivos(self):
+        numeros = secuencias.numeros_control(self.empresa, '01', 3)
+        self.assertEqual(numeros, [f"DTE-01-M001P001-{i:015d}" for i in (1, 2, 3)])
+        dte = DTE.objects.create(empresa=self.empresa, cliente=self.cliente, tipo_dte='01')
+        self.assertEqual(dte.numero_control, "DTE-01-M001P001-000000000000004")
+
+
+# ======================================================
+# 🧮 TOTALES, IVA Y RESUMEN DIARIO
+# ======================================================
+class TotalesTests(DatosEmpresas):
+
+    def setUp(self):
+        super().setUp()
+        self.dte = DTE.objects.create(empresa=self.empresa, cliente=self.cliente, tipo_dte='01')
+        self.producto.precio_unitario = Decimal('0.50')
+        self.producto.save()
+
+    def linea(self, cantidad, dte=None):
+        return DetalleDTE.objects.create(dte=dte or self.dte, producto=self.producto, cantidad=cantidad, precio_unitario=self.producto.precio_unitario)
+
+    def assertResumenCuadra(self):
+        """El resumen diario suma exactamente lo guardado en los DTE activos."""
+        campos = dict(cantidad=Count('id'), subtotal=Sum('subtotal'), iva=Sum('iva'), total=Sum('total'))
+        dtes = DTE.objects.filter(estado='Activo').aggregate(**campos)
+        resumen = ResumenVentasDiario.objects.aggregate(**{k: Sum(k) for k in campos})
+        normalizar = lambda d: {k: Decimal(v or 0) for k, v in d.items()}
+        self.assertEqual(normalizar(resumen), normalizar(dtes))
+
+    def assertFila(self, subtotal, iva):
+        fila = DTE.objects.values_list('subtotal', 'iva', 'total').get(pk=self.dte.pk)
+        self.assertEqual(fila, (Decimal(subtotal), Decimal(iva), Decimal(subtotal) + Decimal(iva)))
+
+    def test_iva_medio_centavo_hacia_arriba(self):
+        self.assertEqual(calcular_iva(Decimal('0.50')), Decimal('0.07'))  # 0.065
+        self.assertEqual(calcular_iva(Decimal('1.50')), Decimal('0.20'))  # 0.195
+        self.assertEqual(calcular_iva(Decimal('2.50')), Decimal('0.33'))  # 0.325
+
+    def test_lineas_creadas_editadas_y_eliminadas(self):
+        detalle = self.linea(1)
+        self.assertFila('0.50', '0.07')
+        # La instancia en memoria queda igual a la fila
+        self.assertEqual((detalle.dte.subtotal, detalle.dte.iva), (Decimal('0.50'), Decimal('0.07')))
+        self.assertResumenCuadra()
+
+        detalle.cantidad = 5
+        detalle.save()
+        self.assertFila('2.50', '0.33')
+        self.assertResumenCuadra()
+
+        detalle.delete()
+        self.assertFila('0.00', '0.00')
+        self.assertResumenCuadra()
+
+    def test_edicion_diferida(self):
+        with totales_diferidos():
+            for _ in range(3):
+                self.linea(1)
+        self.assertFila('1.50', '0.20')
+        self.assertResumenCuadra()
+
+    def test_dte_guardado_con_iva_sin_redondear(self):
+        # Como registrar_venta antes: subtotal * 0.13 con más de 2 decimales
+        DTE.objects.create(
+            empresa=self.empresa, cliente=self.cliente, subtotal=Decimal('0.50'),
+            iva=Decimal('0.065'), total=Decimal('0.565'),
+        )
+        self.assertResumenCuadra()
+
+    def test_anular_y_eliminar(self):
+        self.linea(3)
+        otro = DTE.objects.create(empresa=self.empresa, cliente=self.cliente, tipo_dte='01')
+        self.linea(1, dte=otro)
+        self.assertResumenCuadra()
+        otro.estado = 'Anulado'
+        otro.save()
+        self.assertResumenCuadra()
+        self.dte.delete()
+        self.assertResumenCuadra()
+        self.assertFalse(ResumenVentasDiario.objects.filter(cantidad__gt=0).exists())
+
+
+# ======================================================
+# 🛒 CATÁLOGO
+# ======================================================
+class CatalogoTests(DatosEmpresas):
+
+    def test_no_carga_la_tabla_de_clientes(self):
+        Cliente.objects.bulk_create([
+            Cliente(empresa=self.empresa, nombre=f"Cliente {i}", nit=f"0614-7777{i:02d}-001-0", direccion="z") for i in range(30)
+        ])
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('catalogo_productos'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn(b'Cliente 7', respuesta.content)
+        self.assertFalse([c for c in consultas.captured_queries if 'facturacion_cliente' in c['sql'].lower()])
+
+    def test_buscador_de_clientes_por_empresa(self):
+        resultados = self.client.get(reverse('buscar_cliente'), {'q': 'ana'}).json()['resultados']
+        self.assertEqual(resultados, [])
+        resultados = self.client.get(reverse('buscar_cliente'), {'q': 'juan'}).json()['resultados']
+        self.assertEqual([c['id'] for c in resultados], [self.cliente.id])
+
+
+# ======================================================
+# 📦 EXISTENCIAS
+# ======================================================
+class ExistenciasTests(DatosEmpresas):
+
+    def setUp(self):
+        super().setUp()
+        Producto.objects.filter(id=self.producto.id).update(inventario=10)
+        self.segundo = Producto.objects.create(
+            empresa=self.empresa, codigo="P2", descripcion="Azúcar", precio_unitario=Decimal('1.00'),
+        )
+
+    def existencias(self):
+        return dict(Producto.objects.filter(empresa=self.empresa).values_list('id', 'inventario'))
+
+    def registrar(self, *movimientos, **opciones):
+        with usar_empresa(self.empresa.id):
+            return existencias.registrar_movimientos(
+                [{'producto_id': pid, 'tipo': tipo, 'cantidad': cantidad} for pid, tipo, cantidad in movimientos],
+                **opciones,
+            )
+
+    def test_aplica_el_neto_por_producto(self):
+        netos = self.registrar(
+            (self.producto.id, 'Entrada', 5), (self.producto.id, 'Salida', 12), (str(self.segundo.id), 'Entrada', 4),
+        )
+        self.assertEqual(netos, {self.producto.id: -7, self.segundo.id: 4})
+        self.assertEqual(self.existencias(), {self.producto.id: 3, self.segundo.id: 4})
+        self.assertEqual(Inventario.objects.count(), 3)
+
+    def test_sin_stock_no_aplica_ningun_movimiento(self):
+        with self.assertRaises(StockInsuficiente) as error:
+            self.registrar((self.segundo.id, 'Entrada', 4), (self.producto.id, 'Salida', 11))
+        self.assertEqual(error.exception.productos, [self.producto.id])
+        self.assertEqual(self.existencias(), {self.producto.id: 10, self.segundo.id: 0})
+        self.assertFalse(Inventario.objects.exists())
+
+    def test_productos_de_otra_empresa_o_inexistentes(self):
+        for validar in (True, False):
+            with self.subTest(validar_stock=validar), self.assertRaises(existencias.ProductosDesconocidos) as error:
+                self.registrar(
+                    (self.producto.id, 'Salida', 1), (self.producto_otra.id, 'Entrada', 1), (999999, 'Salida', 1),
+                    validar_stock=validar,
+                )
+            self.assertEqual(error.exception.productos, [self.producto_otra.id, 999999])
+        self.assertEqual(self.existencias()[self.producto.id], 10)
+        self.assertFalse(Inventario.objects.exists())
+
+    def test_movimiento_no_valido(self):
+        for movimiento in (('abc', 'Salida', 1), (self.producto.id, 'Ajuste', 1), (self.producto.id, 'Salida', 0)):
+            with self.subTest(movimiento=movimiento), self.assertRaises(ValueError):
+                self.registrar(movimiento)
+
+    def test_salida_valida_stock_en_la_misma_sentencia(self):
+        producto = Producto.objects.get(id=self.producto.id)
+        # Otra venta descontó entre la lectura y la salida: la instancia dice 10
+        Producto.objects.filter(id=producto.id).update(inventario=2)
+        with self.assertRaises(StockInsuficiente):
+            Inventario(producto=producto, tipo='Salida', cantidad=3).save(validar_stock=True)
+        self.assertEqual(self.existencias()[producto.id], 2)
+        self.assertFalse(Inventario.objects.exists())
+
+        Inventario(producto=producto, tipo='Salida', cantidad=2).save(validar_stock=True)
+        self.assertEqual(self.existencias()[producto.id], 0)
+        self.assertEqual(producto.inventario, 8)  # instancia: 10 leído - 2
+
+    def test_registrar_venta(self):
+        url = reverse('registrar_venta')
+        respuesta = self.client.post(url, {'producto_id': self.producto.id, 'cantidad': 11, 'cliente_id': self.cliente.id})
+        self.assertEqual((respuesta.status_code, respuesta.json()['mensaje']), (400, 'Stock insuficiente'))
+        self.assertFalse(DTE.objects.exists())
+
+        respuesta = self.client.post(url, {'producto_id': self.producto.id, 'cantidad': 4, 'cliente_id': self.cliente.id})
+        self.assertEqual(respuesta.json()['nuevo_stock'], 6)
+        self.assertEqual(DTE.objects.get().subtotal, Decimal('10.00'))
+
+
+class ExistenciaFechaTests(DatosEmpresas):
+    """Existencias a una fecha: último cierre + movimientos posteriores."""
+
+    D1, D2, D3, D4, D5 = (date(2025, 3, dia) for dia in (1, 2, 3, 4, 5))
+
+    def setUp(self):
+        super().setUp()
+        # Entrada 10 el día 1, salida 4 el día 3, entrada 2 el día 5
+        self.uno = self.mover(self.D1, 'Entrada', 10)
+        self.mover(self.D3, 'Salida', 4)
+        self.mover(self.D5, 'Entrada', 2)
+
+    def mover(self, fecha, tipo, cantidad):
+        # bulk_create no toca Producto.inventario; fecha es auto_now_add
+        movimiento, = Inventario.objects.bulk_create([Inventario(producto=self.producto, tipo=tipo, cantidad=cantidad)])
+        Inventario.objects.filter(id=movimiento.id).update(fecha=fecha)
+        return movimiento
+
+    def saldos(self, fecha):
+        return {
+            'uno': existencias.existencia_a_fecha(self.producto.id, fecha),
+            'varios': existencias.existencias_a_fecha(fecha, Producto.objects.filter(id=self.producto.id)).get().existencia,
+        }
+
+    def assertExistencia(self, fecha, esperada):
+        self.assertEqual(self.saldos(fecha), {'uno': esperada, 'varios': esperada}, fecha)
+
+    def test_sin_cierres_suma_todos_los_movimientos(self):
+        self.assertExistencia(date(2025, 2, 28), 0)
+        self.assertExistencia(self.D1, 10)
+        self.assertExistencia(self.D4, 6)
+        self.assertExistencia(self.D5, 8)
+
+    def test_el_dia_del_cierre_y_despues(self):
+        self.assertEqual(existencias.cerrar_inventario(hasta=self.D3), 2)
+        self.assertEqual(
+            list(CierreInventario.objects.order_by('fecha').values_list('fecha', 'entradas', 'salidas', 'saldo')),
+            [(self.D1, 10, 0, 10), (self.D3, 0, 4, 6)],
+        )
+        # Sin el movimiento del día 1 el saldo solo puede salir del cierre
+        Inventario.objects.filter(id=self.uno.id).delete()
+        self.assertExistencia(date(2025, 2, 28), 0)
+        self.assertExistencia(self.D2, 10)
+        self.assertExistencia(self.D3, 6)
+        self.assertExistencia(self.D5, 8)
+
+        kardex = existencias.movimientos_rango(self.producto.id, self.D2, self.D5)
+        self.assertEqual((kardex['saldo_inicial'], kardex['saldo_final']), (10, 8))
+        self.assertEqual([m.cantidad for m in kardex['movimientos']], [4, 2])
+
+    def test_cierre_incremental(self):
+        self.assertEqual(existencias.cerrar_inventario(hasta=self.D3), 2)
+        self.assertEqual(existencias.cerrar_inventario(hasta=self.D3), 0)
+        self.assertEqual(existencias.cerrar_inventario(hasta=self.D4), 0)
+
+        salida = io.StringIO()
+        call_command('cerrar_inventario', hasta='2025-03-05', stdout=salida)
+        self.assertIn('1 cierre(s)', salida.getvalue())
+        self.assertEqual(CierreInventario.objects.get(fecha=self.D5).saldo, 8)
+        self.assertEqual(existencias.cerrar_inventario(hasta=self.D5), 0)
+        self.assertEqual(CierreInventario.objects.count(), 3)
+
+    def test_reporte_de_inventario_a_fecha(self):
+        existencias.cerrar_inventario(hasta=self.D3)
+        Producto.objects.filter(id=self.producto.id).update(inventario=8)
+
+        respuesta = self.client.get(reverse('inventario'), {'fecha': '2025-03-04'})
+        self.assertEqual(respuesta.context['fecha'], self.D4)
+        self.assertEqual({p.id: p.existencia for p in respuesta.context['productos']}, {self.producto.id: 6})
+
+        # Sin fecha (o con una fecha no válida) se muestra la existencia actual
+        for parametros in ({}, {'fecha': '2025-02-30'}):
+            respuesta = self.client.get(reverse('inventario'), parametros)
+            self.assertEqual({p.id: p.existencia for p in respuesta.context['productos']}, {self.producto.id: 8})
+
+
+# ======================================================
+# 🛍️ COMPRAS Y ANEXOS F07
+# ======================================================
+class CompraAnexosTests(DatosEmpresas):
+
+    def anexo(self, nombre):
+        respuesta = self.client.get(reverse('exportar_anexo_csv', args=[nombre]))
+        return b''.join(respuesta.streaming_content).decode('utf-8')
+
+    def test_compra_solo_en_el_anexo_de_compras(self):
+        proveedor = Proveedor.objects.create(
+            empresa=self.empresa, nombre="Distribuidora Sur", nit="0614-111111-001-1", direccion="z",
+        )
+        respuesta = self.client.post(reverse('registrar_compra'), {
+            'producto': self.producto.id, 'proveedor': proveedor.id, 'cantidad': 4, 'precio_compra': '10.00',
+        })
+        self.assertRedirects(respuesta, reverse('libro_compras'), fetch_redirect_response=False)
+        compra = Compra.objects.get()
+        self.assertEqual(compra.empresa, self.empresa)
+
+        self.assertIn(compra.comprobante_numero, self.anexo('compras'))
+        self.assertNotIn(compra.comprobante_numero, self.anexo('ventas-contribuyentes'))
+        self.assertFalse(DTE.objects.exists())
+        self.assertFalse(ResumenVentasDiario.objects.exists())
+
+    def test_migracion_quita_los_ccf_espejo(self):
+        migracion = importlib.import_module('Modulos.Facturacion.migrations.0025_quitar_ccf_de_compras')
+        venta = DTE.objects.create(empresa=self.empresa, cliente=self.cliente, tipo_dte='03', subtotal=Decimal('10.00'))
+        DTE.objects.create(
+            empresa=self.empresa, cliente=self.cliente, tipo_dte='03', numero_control='COMP-20261018-0001',
+            subtotal=Decimal('20.00'), codigo_generacion="Compra a proveedor: Distribuidora Sur",
+        )
+        self.assertEqual(ResumenVentasDiario.objects.get().cantidad, 2)
+
+        migracion.quitar_ccf_de_compras(django_apps, mock.Mock(connection=connection))
+        self.assertEqual(list(DTE.objects.values_list('id', flat=True)), [venta.id])
+        dia = ResumenVentasDiario.objects.get()
+        self.assertEqual((dia.cantidad, dia.subtotal, dia.total), (1, venta.subtotal, venta.total))
+        self.assertEqual((dia.emitido_del, dia.emitido_al), (venta.numero_control, venta.numero_control))
+
+
+class LibroComprasExcelTests(DatosEmpresas):
+
+    def test_exporta_encabezado_filas_y_anchos(self):
+        compra = {'registro_nrc': '1001', 'compras_gravadas': Decimal('100.00'), 'iva_13': Decimal('13.00'),
+                  'total': Decimal('113.00')}
+        # 21:30 en El Salvador ya es el día siguiente en UTC: la fecha del libro es la local
+        tarde = timezone.make_aware(datetime(2026, 10, 17, 21, 30))
+        Compra.objects.create(
+            empresa=self.empresa, fecha=tarde, comprobante_numero='COMP-2', proveedor='Distribuidora Uno',
+            precio_unitario=Decimal('25.00'), **compra,
+        )
+        Compra.objects.create(
+            empresa=self.empresa, fecha=tarde - timedelta(days=3), comprobante_numero='COMP-1',
+            proveedor='Distribuidora Dos', **compra,
+        )
+        Compra.objects.create(empresa=self.otra, comprobante_numero='AJENA', proveedor='Otra', **compra)
+
+        respuesta = self.client.get(reverse('exportar_libro_compras_excel'))
+        self.assertTrue(respuesta.streaming)
+        self.assertIn('Libro_Compras.xlsx', respuesta['Content-Disposition'])
+        hoja = openpyxl.load_workbook(io.BytesIO(b''.join(respuesta.streaming_content)))['Libro de Compras']
+
+        self.assertEqual([c.value for c in hoja[1]], [encabezado for encabezado, _, _ in exportaciones.COLUMNAS_COMPRAS])
+        self.assertTrue(hoja['A1'].font.bold)
+        self.assertEqual(hoja.max_row, 3)
+        self.assertEqual(
+            [c.value for c in hoja[2]],
+            [1, '17/10/2026', 'COMP-2', '1001', 'Distribuidora Uno', 25, 100, '=G2*0.13', '=G2+H2'],
+        )
+        self.assertEqual(hoja['C3'].value, 'COMP-1')
+        self.assertEqual(hoja['G2'].number_format, '#,##0.00')
+        for indice, (_, ancho, _) in enumerate(exportaciones.COLUMNAS_COMPRAS, start=1):
+            self.assertEqual(hoja.column_dimensions[get_column_letter(indice)].width, ancho)
+
+
+# ======================================================
+# 🗂️ CACHÉ DE PDF
+# ======================================================
+class CachePdfTests(DatosEmpresas):
+
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, True)
+        ajuste = self.settings(PDF_CACHE_DIR=directorio, PDF_CACHE_ACTIVO=True)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.dte = DTE.objects.create(empresa=self.empresa, cliente=self.cliente, tipo_dte='01')
+        self.detalle = DetalleDTE.objects.create(
+            dte=self.dte, producto=self.producto, cantidad=1, precio_unitario=self.producto.precio_unitario,
+        )
+        self.generar = mock.Mock(return_value=b'%PDF-1.7')
+
+    def clave(self, extra=None):
+        dte = DTE.objects.select_related('empresa', 'cliente').get(id=self.dte.id)
+        return pdf_cache.clave_pdf(dte, renderizador.plantilla_dte('01'), renderizador.ruta_css('01'), extra)
+
+    def obtener(self):
+        dte = DTE.objects.select_related('empresa', 'cliente').get(id=self.dte.id)
+        return pdf_cache.obtener_pdf(dte, renderizador.plantilla_dte('01'), renderizador.ruta_css('01'), self.generar)
+
+    def test_clave_cambia_con_las_entradas_del_render(self):
+        original = self.clave()
+        self.assertEqual(self.clave(), original)
+        self.assertNotEqual(self.clave(extra={'certificado': 'empresa.p12'}), original)
+
+        DTE.objects.filter(id=self.dte.id).update(condicion_pago='Crédito')
+        por_dte = self.clave()
+        self.assertNotEqual(por_dte, original)
+
+        DetalleDTE.objects.filter(id=self.detalle.id).update(cantidad=3)
+        self.assertNotEqual(self.clave(), por_dte)
+
+    def test_qr_guardado_no_cambia_la_clave(self):
+        original = self.clave()
+        qr.guardar(DTE.objects.select_related('empresa', 'cliente').get(id=self.dte.id))
+        self.assertEqual(self.clave(), original)
+
+    def test_se_genera_una_vez_hasta_que_cambia(self):
+        self.assertEqual(self.obtener(), b'%PDF-1.7')
+        self.obtener()
+        self.assertEqual(self.generar.call_count, 1)
+        # Nueva línea: la señal borra la caché del DTE y la clave es otra
+        DetalleDTE.objects.create(dte=self.dte, producto=self.producto, cantidad=1, precio_unitario=self.producto.precio_unitario)
+        self.assertFalse(os.path.exists(os.path.join(settings.PDF_CACHE_DIR, str(self.dte.id))))
+        self.obtener()
+        self.assertEqual(self.generar.call_count, 2)
+
+    def test_expulsa_los_menos_usados(self):
+        carpeta = os.path.join(settings.PDF_CACHE_DIR, '1')
+        os.makedirs(carpeta)
+        for uso, nombre in enumerate(('b.pdf', 'a.pdf', 'c.pdf')):
+            ruta = os.path.join(carpeta, nombre)
+            with open(ruta, 'wb') as archivo:
+                archivo.write(b'x' * 100)
+            os.utime(ruta, (uso, uso))
+        with mock.patch.object(pdf_cache, '_limite_bytes', return_value=200):
+            self.assertEqual(pdf_cache.expulsar(), 1)
+        self.assertEqual(sorted(os.listdir(carpeta)), ['a.pdf', 'c.pdf'])
+
+
+# ======================================================
+# 🔳 CÓDIGOS QR
+# ======================================================
+class QrTests(DatosEmpresas):
+
+    def setUp(self):
+        super().setUp()
+        qr.svg_qr.cache_clear()
+        self.dte = DTE.objects.create(
+            empresa=self.empresa, cliente=self.cliente, tipo_dte='01', numero_control='DTE-01-M001P001-000000000000001',
+            subtotal=Decimal('10.00'), iva=Decimal('1.30'), total=Decimal('11.30'),
+        )
+
+    def ver(self):
+        respuesta = self.client.get(reverse('ver_dte', args=[self.dte.id]))
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def guardado(self):
+        return DTE.objects.values_list('qr_texto', 'qr_svg').get(id=self.dte.id)
+
+    def test_ver_dte_reutiliza_el_svg_guardado(self):
+        self.ver()
+        texto, svg = self.guardado()
+        self.assertEqual(texto, 'DTE-01-M001P001-000000000000001|0614-000001-101-0|0614-123456-001-0|11.30')
+        self.assertTrue(svg.startswith('<svg'))
+
+        # Segunda visita: ni se genera (ni del LRU) ni se vuelve a guardar
+        qr.svg_qr.cache_clear()
+        with mock.patch.object(qr, 'svg_qr', side_effect=AssertionError("no debió generarse")), \
+                CaptureQueriesContext(connection) as consultas:
+            respuesta = self.ver()
+        self.assertIn(qr.datauri(svg), respuesta.content.decode())
+        self.assertFalse([c for c in consultas.captured_queries if c['sql'].startswith('UPDATE')])
+
+    def test_se_regenera_si_cambia_el_total_o_el_nit(self):
+        self.ver()
+        _, original = self.guardado()
+
+        DTE.objects.filter(id=self.dte.id).update(total=Decimal('12.30'))
+        self.ver()
+        texto, por_total = self.guardado()
+        self.assertTrue(texto.endswith('|12.30'))
+        self.assertNotEqual(por_total, original)
+
+        Cliente.objects.filter(id=self.cliente.id).update(nit='0614-111111-001-0')
+        self.ver()
+        texto, por_nit = self.guardado()
+        self.assertIn('|0614-111111-001-0|', texto)
+        self.assertNotIn(por_nit, (original, por_total))
+
+    def test_version_fija_y_desborde(self):
+        lado = 4 * settings.QR_VERSION + 17 + 8  # módulos de la versión más el margen
+        self.assertEqual(len(qr._matriz(qr.texto_qr(self.dte))), lado)
+        # El texto más largo posible (numero_control 50, NIT 20, total de 10 dígitos) cabe en la versión fija
+        self.assertEqual(len(qr._matriz('|'.join(['D' * 50, '0' * 20, '0' * 20, '9' * 8 + '.99']))), lado)
+
+        largo = 'x' * 300
+        self.assertGreater(len(qr._matriz(largo)), lado)
+        svg = qr.svg_qr(largo)
+        self.assertIn(f'viewBox="0 0 {len(qr._matriz(largo))} ', svg)
+        self.assertIn(f'width="{settings.QR_TAMANO}"', svg)
+
+
+# ======================================================
+# 🖋️ FIRMA DE PDF (pyHanko)
+# ======================================================
+def pdf_minimo():
+    """PDF de una página en blanco con su tabla xref."""
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 200] >>",
+    ]
+    contenido = b"%PDF-1.7\n"
+    posiciones = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posiciones.append(len(contenido))
+        contenido += b"%d 0 obj\n%s\nendobj\n" % (numero, objeto)
+    xref = len(contenido)
+    contenido += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    contenido += b"".join(b"%010d 00000 n \n" % posicion for posicion in posiciones)
+    contenido += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, xref)
+    return contenido
+
+
+class FirmaPdfTests(DatosEmpresas):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        llave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        nombre = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Empresa 1 (pruebas)")])
+        ahora = timezone.now()
+        cls.certificado = (
+            x509.CertificateBuilder()
+            .subject_name(nombre).issuer_name(nombre)
+            .public_key(llave.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(ahora - timedelta(days=1)).not_valid_after(ahora + timedelta(days=1))
+            .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+            .sign(llave, hashes.SHA256())
+        )
+        cls.p12 = pkcs12.serialize_key_and_certificates(
+            b"pruebas", llave, cls.certificado, None, serialization.BestAvailableEncryption(b"clave"),
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+        self.addCleanup(firma_pdf._firmantes.clear)
+        configuracion = self.settings(FIRMA_PDF_ACTIVA=True, FIRMA_DIR=self.directorio, FIRMA_CLAVE='clave')
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+
+    def guardar_p12(self):
+        with open(firma_pdf.ruta_certificado(self.empresa), 'wb') as archivo:
+            archivo.write(self.p12)
+
+    def test_firma_y_valida(self):
+        from asn1crypto import x509 as asn1_x509
+        from pyhanko.pdf_utils.reader import PdfFileReader
+        from pyhanko.sign.validation import validate_pdf_signature
+        from pyhanko_certvalidator import ValidationContext
+
+        self.guardar_p12()
+        parametros = firma_pdf.parametros(self.empresa)
+        self.assertEqual(parametros['ruta'], os.path.join(self.directorio, '06140000011010.p12'))
+
+        firmado = firma_pdf.firmar_con(pdf_minimo(), **parametros)
+        self.assertTrue(firmado.startswith(pdf_minimo()))  # firma incremental
+
+        incrustada, = PdfFileReader(io.BytesIO(firmado)).embedded_signatures
+        self.assertEqual(incrustada.field_name, 'FirmaOMNIGEST')
+        raiz = asn1_x509.Certificate.load(self.certificado.public_bytes(serialization.Encoding.DER))
+        estado = validate_pdf_signature(incrustada, ValidationContext(trust_roots=[raiz], allow_fetching=False))
+        self.assertTrue(estado.bottom_line, estado.pretty_print_details())
+        self.assertEqual(estado.signing_cert.subject.native['common_name'], "Empresa 1 (pruebas)")
+
+        # El firmante se arma una vez por proceso
+        firma_pdf.firmar_con(pdf_minimo(), **parametros)
+        self.assertEqual(len(firma_pdf._firmantes), 1)
+
+    def test_clave_incorrecta(self):
+        self.guardar_p12()
+        with self.settings(FIRMA_CLAVE='otra'), self.assertLogs('pyhanko', 'ERROR'):
+            with self.assertRaises(ErrorFirmaPDF):
+                firma_pdf.firmar_con(pdf_minimo(), **firma_pdf.parametros(self.empresa))
+
+    def test_desactivada_o_sin_certificado(self):
+        # Sin certificado de la empresa: el PDF sale sin firmar
+        self.assertIsNone(firma_pdf.parametros(self.empresa))
+        self.guardar_p12()
+        self.assertIsNotNone(firma_pdf.parametros(self.empresa))
+        with self.settings(FIRMA_PDF_ACTIVA=False):
+            self.assertIsNone(firma_pdf.parametros(self.empresa))
+            with self.assertRaisesMessage(CommandError, 'FIRMA_PDF_ACTIVA'):
+                call_command('firmar_pdfs', mes='2026-10')
+
+        salida = io.StringIO()
+        call_command('firmar_pdfs', mes='2001-01', stdout=salida)
+        self.assertIn('No hay DTE en ese mes.', salida.getvalue())
+        with self.assertRaisesMessage(CommandError, 'AAAA-MM'):
+            call_command('firmar_pdfs', mes='octubre')
+
+
+# ======================================================
+# 🖨️ PLANTILLAS DE IMPRESIÓN
+# ======================================================
+class PlantillasPdfTests(DatosEmpresas):
+
+    def test_todas_las_plantillas_sin_request(self):
+        for tipo, plantilla in renderizador.PLANTILLAS_DTE.items():
+            with self.subTest(tipo=tipo):
+                dte = DTE.objects.create(empresa=self.empresa, cliente=self.cliente, tipo_dte=tipo)
+                DetalleDTE.objects.create(dte=dte, producto=self.producto, cantidad=2, precio_unitario=self.producto.precio_unitario)
+                html = emision.html_comprobante(dte, plantilla)
+                self.assertIn(dte.numero_control, html)
+                self.assertIn(self.cliente.nombre, html)
+                self.assertNotIn('<form', html)
+                self.assertNotIn('csrfmiddlewaretoken', html)
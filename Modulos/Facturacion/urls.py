@@ -33,18 +33,22 @@ urlpatterns = [
 
     # --- Clientes ---
     path('clientes/', views.lista_clientes, name='lista_clientes'),
+    path('clientes/json/', views.lista_clientes_json, name='lista_clientes_json'),
+    path('clientes/buscar/', views.buscar_cliente, name='buscar_cliente'),
     path('clientes/crear/', views.crear_cliente, name='crear_cliente'),
     path('clientes/editar/<int:id>/', views.editar_cliente, name='editar_cliente'),
     path('clientes/eliminar/<int:id>/', views.eliminar_cliente, name='eliminar_cliente'),
 
     # --- Proveedores ---
     path('proveedores/', views.lista_proveedores, name='lista_proveedores'),
+    path('proveedores/json/', views.lista_proveedores_json, name='lista_proveedores_json'),
     path('proveedores/nuevo/', views.crear_proveedor, name='crear_proveedor'),
     path('proveedores/editar/<int:id>/', views.editar_proveedor, name='editar_proveedor'),
     path('proveedores/eliminar/<int:id>/', views.eliminar_proveedor, name='eliminar_proveedor'),
 
     # --- Productos e Inventario ---
     path('productos/', views.lista_productos, name='lista_productos'),
+    path('productos/json/', views.lista_productos_json, name='lista_productos_json'),
     path('productos/crear/', views.crear_producto, name='crear_producto'),
     path('productos/editar/<int:id>/', views.editar_producto, name='editar_producto'),
     path('productos/eliminar/<int:id>/', views.eliminar_producto, name='eliminar_producto'),
@@ -61,19 +65,24 @@ urlpatterns = [
     # ======================================================
     path('menu/facturacion/', views.menu_facturacion, name='menu_facturacion'),
     path('dte/', views.lista_dte, name='lista_dte'),
+    path('dte/json/', views.lista_dte_json, name='lista_dte_json'),
     path('dte/crear/', views.crear_dte, name='crear_dte'),
     path('dte/nuevo/<str:tipo_dte>/', views.crear_dte, name='crear_dte_tipo'),
     path('dte/modal/<str:tipo>/', views.modal_dte, name='modal_dte'),
+    path('dte/lote/', views.emitir_dte_lote, name='emitir_dte_lote'),
     path('dte/generar/<str:tipo>/', views.generar_dte, name='generar_dte'),
+    path('dte/emision/<int:trabajo_id>/', views.estado_emision, name='estado_emision'),
     path('dte/ver/<int:dte_id>/', views.ver_dte, name='ver_dte'),
+    path('dte/pdf/<int:id>/', views.descargar_pdf_dte, name='descargar_pdf_dte'),
 
     # --- JSON y Búsqueda ---
     path('dte/ver/<int:id>/json/', ver_dte_json, name='ver_dte_json'),  # ✅ para el modal de edición
     path('dte/buscar/', buscar_dte, name='buscar_dte'),
+    path('dte/autocompletar/', views.autocompletar_dte, name='autocompletar_dte'),
 
     # --- Edición ---
-    path('dte/editar/<str:numero_control>/', views.editar_dte, name='editar_dte'),
-    path('dte/actualizar/<str:numero_control>/', views.actualizar_dte, name='actualizar_dte'),
+    path('dte/editar/<int:id>/', views.editar_dte, name='editar_dte'),
+    path('dte/actualizar/<int:id>/', views.actualizar_dte, name='actualizar_dte'),
     path('dte/editar-datos/<int:id>/', editar_datos_dte, name='editar_datos_dte'),
 
     # --- Anulación ---
@@ -86,6 +95,7 @@ urlpatterns = [
     path('libros/ventas/', views.libro_ventas, name='libro_ventas'),
     path('reportes/ventas/', reporte_ventas, name='reporte_ventas'),
     path('libros/compras/exportar/', views.exportar_libro_compras_excel, name='exportar_libro_compras_excel'),
+    path('libros/anexos/<str:anexo>/', views.exportar_anexo_csv, name='exportar_anexo_csv'),
 
     # ======================================================
     # ⚙️ ADMINISTRACIÓN
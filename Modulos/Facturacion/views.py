@@ -3,11 +3,9 @@
 # ======================================================
 import os
 import io
-import qrcode
 import json
 import time
 import base64
-import uuid
 import tempfile
 import threading
 import openpyxl
@@ -20,10 +18,11 @@ from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.db import IntegrityError
-from django.db.models import Q
+from django.db import IntegrityError, router, transaction
+from django.db.models import F, Q
 from django.http import JsonResponse, HttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.timezone import now, localtime
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
@@ -31,16 +30,25 @@ from django.template.loader import render_to_string
 from django.conf import settings
 from django.core.mail import EmailMessage, send_mail
 from openpyxl.styles import Alignment, Font, Border, Side
-from weasyprint import HTML, CSS
-from django.db.models import Max
+from django.db.models import Max, Min, Sum
 
 # Modelos y formularios
 from .models import (
     DTE, Perfil, Cliente, Proveedor, Producto,
-    Inventario, Compra, DetalleDTE, Empresa
+    Inventario, Compra, DetalleDTE, Empresa, TrabajoEmision, StockInsuficiente,
+    ResumenVentasDiario, calcular_iva, parece_documento,
 )
+from .emision import encolar_emision, estado_trabajo, generar_pdf_dte
+from .lotes import ReferenciasAjenas, crear_dtes_en_lote
+from .exportaciones import ANEXOS, exportar_anexo, exportar_libro_compras
+from . import autocompletar, busqueda, existencias, qr, secuencias
+from .empresa_actual import empresa_actual, todas_las_empresas
+from .paginacion import paginar_peticion, ORDEN_DTE, ORDEN_PRODUCTO, ORDEN_RECIENTES
 from .forms import ClienteForm, ProveedorForm, ProductoForm
+from .middleware import cargar_perfil
 from .permisos import rol_requerido
+from .replicas import lectura_replica
+from .cola_escrituras import escritura_serializada
 from openpyxl.styles import Font, PatternFill, Alignment
 from django.http import HttpResponse
 from django.contrib.auth.decorators import login_required
@@ -81,7 +89,7 @@ def iniciar_sesion(request):
 
         if user is not None:
             login(request, user)
-            perfil = Perfil.objects.filter(user=user).select_related('empresa').first()
+            perfil = cargar_perfil(user)
 
             if not perfil:
                 logout(request)
@@ -90,8 +98,8 @@ def iniciar_sesion(request):
 
             if not perfil.empresa:
                 messages.warning(request, "No se encontró empresa asignada al usuario.")
-            else:
-                request.session['empresa_id'] = perfil.empresa.id
+            elif request.session.get('empresa_id') != perfil.empresa_id:
+                request.session['empresa_id'] = perfil.empresa_id
 
             messages.success(request, f"Inicio de sesión exitoso como {perfil.rol}.")
             return redirect('menu_principal')
@@ -154,36 +162,53 @@ def menu_principal(request):
     Muestra el menú principal con el rol y empresa del usuario logueado.
     No genera error si el perfil no tiene empresa asignada.
     """
-    perfil = Perfil.objects.select_related('empresa').filter(user=request.user).first()
-
-    # Si no hay perfil asociado al usuario
-    if not perfil:
+    # Si no hay perfil asociado al usuario (request.rol lo carga ContextoUsuarioMiddleware)
+    if not request.rol:
         messages.error(request, "No se encontró un perfil asociado al usuario.")
         return redirect('logout')
 
     # Si el perfil no tiene empresa, evitar error 500
-    if not perfil.empresa:
+    if not request.tenant:
         empresa_nombre = "Sin empresa asignada"
     else:
-        empresa_nombre = perfil.empresa.nombre
-        request.session['empresa_id'] = perfil.empresa.id  # Guardar en sesión
+        empresa_nombre = request.tenant.nombre
+        # Guardar en sesión solo si cambió (evita reescribir la sesión en cada visita)
+        if request.session.get('empresa_id') != request.tenant.id:
+            request.session['empresa_id'] = request.tenant.id
 
     # 🔹 Contexto enviado al template
     contexto = {
-        'rol': perfil.rol,
+        'rol': request.rol,
         'empresa': empresa_nombre
     }
 
-    print("Rol:", perfil.rol)
-    print("Empresa mostrada:", empresa_nombre)
-
     return render(request, 'Facturacion/menu_principal.html', contexto)
 
 # 📄 Lista de documentos emitidos
 @rol_requerido(['Administrador', 'Contador', 'Empleado'])
 def lista_dte(request):
-    dtes = DTE.objects.all().order_by('-fecha_emision')
-    return render(request, 'Facturacion/lista_dte.html', {'dtes': dtes})
+    # El SVG del QR (qr.py) solo lo usa ver_dte
+    dtes = paginar_peticion(request, DTE.por_empresa.select_related('cliente').defer('qr_svg'), ORDEN_DTE)
+    return render(request, 'Facturacion/lista_dte.html', {'dtes': dtes, 'pagina': dtes})
+
+
+def _dte_json(d):
+    return {
+        "id": d.id,
+        "tipo_dte": d.get_tipo_dte_display(),
+        "numero_control": d.numero_control,
+        "cliente": d.cliente.nombre,
+        "fecha": localtime(d.fecha_emision).strftime("%Y-%m-%d %H:%M"),
+        "total": f"{d.total:.2f}",
+        "estado": d.estado,
+    }
+
+
+@rol_requerido(['Administrador', 'Contador', 'Empleado'])
+def lista_dte_json(request):
+    """Página de DTE en JSON (?despues=<cursor> para la siguiente)."""
+    pagina = paginar_peticion(request, DTE.por_empresa.select_related('cliente').defer('qr_svg'), ORDEN_DTE)
+    return JsonResponse(pagina.como_dict(_dte_json))
 
 
 # 🧾 Crear nuevo documento
@@ -210,7 +235,7 @@ def crear_dte(request, tipo_dte=None):
 # ❌ Anular documento
 @rol_requerido(['Administrador', 'Contador'])
 def anular_dte(request, id):
-    dte = get_object_or_404(DTE, id=id)
+    dte = get_object_or_404(DTE.por_empresa, id=id)
     dte.estado = 'Anulado'
     dte.save()
     messages.success(request, f'Documento {dte.numero_control} ha sido anulado correctamente.')
@@ -219,17 +244,28 @@ def anular_dte(request, id):
 
 # 📊 Reporte de ventas
 @rol_requerido(['Administrador', 'Contador'])
+@lectura_replica
 def reporte_ventas(request):
     """
     Muestra los últimos 10 comprobantes emitidos, 
     ordenados del más reciente al más antiguo.
     """
-    dtes = DTE.objects.filter(estado='Activo').order_by('-fecha_emision')[:10]
+    dtes = DTE.por_empresa.filter(estado='Activo').select_related('cliente').defer('qr_svg').order_by('-fecha_emision')[:10]
     total_general = sum(d.total for d in dtes)
 
+    # 📅 Totales de los últimos días desde el resumen diario
+    resumen = list(
+        ResumenVentasDiario.por_empresa
+        .filter(cantidad__gt=0)
+        .values('fecha')
+        .annotate(documentos=Sum('cantidad'), subtotal=Sum('subtotal'), iva=Sum('iva'), total_dia=Sum('total'))
+        .order_by('-fecha')[:10]
+    )
+
     return render(request, 'Facturacion/ventas.html', {
         'dtes': dtes,
-        'total': total_general
+        'total': total_general,
+        'resumen': resumen,
     })
 
 
@@ -237,19 +273,16 @@ def reporte_ventas(request):
 @login_required
 def menu_facturacion(request):
     """ Muestra menú general de facturación con diseño coherente """
-    perfil = getattr(request.user, 'perfil', None)
-    rol = perfil.rol if perfil else 'Sin Rol'
-
     return render(request, 'Facturacion/menu_facturacion.html', {
-        'rol': rol,
-        'empresa': getattr(perfil, 'empresa', 'Sin empresa asignada')
+        'rol': request.rol or 'Sin Rol',
+        'empresa': request.tenant or 'Sin empresa asignada'
     })
 
 
 # 🧾 Vista individual de factura tipo 01
 @login_required
 def nueva_factura(request, tipo):
-    dte = get_object_or_404(DTE, tipo_dte=tipo)
+    dte = get_object_or_404(DTE.por_empresa, tipo_dte=tipo)
     return render(request, 'Facturacion/factura01.html', {
         'dte': dte,
         'empresa': dte.empresa,
@@ -258,141 +291,55 @@ def nueva_factura(request, tipo):
 
 
 # ======================================================
-# ⚙️ GENERAR DTE (Simulación de envío con PDF y JSON usando SendGrid API)
+# ⚙️ GENERAR DTE (encola la emisión: MH, PDF, JSON y correo)
 # ======================================================
 @csrf_exempt
 @login_required
 def generar_dte(request, tipo):
     """
-    Simula el envío del DTE al Ministerio y envía al cliente:
-    - El aviso de aprobación.
-    - Adjuntos: comprobante en PDF y JSON.
+    Encola el envío del DTE al Ministerio y al cliente.
+    El worker `procesar_emisiones` realiza la aprobación MH, genera
+    el PDF y el JSON y envía el correo; aquí solo se devuelve el trabajo.
     """
-    import sendgrid
-    from sendgrid.helpers.mail import Mail, Email, To, Content, Attachment, FileContent, FileName, FileType, Disposition
-    import base64
-
     try:
-        dte = DTE.objects.filter(tipo_dte=tipo).last()
+        dte = DTE.por_empresa.filter(tipo_dte=tipo).last()
         if not dte:
             return JsonResponse({'success': False, 'error': 'No se encontró el documento.'})
 
-        # ⏳ Simulación del proceso de generación
-        time.sleep(2)
-        dte.codigo_generacion = f"MH-{int(time.time())}"
-        dte.sello_recepcion = f"SELLO-{int(time.time())}"
-        dte.save()
-
-        # =====================================================
-        # 🔹 Crear JSON temporal (compatible con Render)
-        # =====================================================
-        temp_dir = tempfile.gettempdir()
-        json_filename = f"DTE_{dte.numero_control}.json"
-        json_path = os.path.join(temp_dir, json_filename)
-
-        dte_json = {
-            "tipo_dte": dte.tipo_dte,
-            "numero_control": dte.numero_control,
-            "cliente": dte.cliente.nombre if dte.cliente else "Sin cliente",
-            "correo": dte.cliente.correo if dte.cliente else "",
-            "fecha_emision": dte.fecha_emision.strftime("%Y-%m-%d"),
-            "total": float(dte.total),
-            "codigo_generacion": dte.codigo_generacion,
-            "sello_recepcion": dte.sello_recepcion,
-        }
+        trabajo = encolar_emision(dte, usuario=request.user)
 
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(dte_json, f, ensure_ascii=False, indent=4)
-
-        # =====================================================
-        # 🔹 Generar PDF con WeasyPrint
-        # =====================================================
-        html_content = render_to_string("Facturacion/factura01.html", {
-            "dte": dte,
-            "empresa": dte.empresa,
-            "cliente": dte.cliente,
-            "editable": False,
-            "qr_data": None,
+        return JsonResponse({
+            'success': True,
+            'trabajo_id': trabajo.id,
+            'estado': trabajo.estado,
+            'msg': '⏳ DTE en cola de envío al Ministerio de Hacienda.'
         })
 
-        # ✅ Opción 2: Ruta automática para desarrollo y producción
-        dev_css = os.path.join(settings.BASE_DIR, 'Modulos', 'Facturacion', 'static', 'css', 'factura01.css')
-        prod_css = os.path.join(settings.BASE_DIR, 'staticfiles_dev', 'css', 'factura01.css')
-
-        if os.path.exists(prod_css):
-            css_path = prod_css
-            print(f"📁 Usando CSS de producción: {css_path}")
-        else:
-            css_path = dev_css
-            print(f"📁 Usando CSS local: {css_path}")
-
-        pdf_buffer = BytesIO()
-        HTML(string=html_content).write_pdf(pdf_buffer, stylesheets=[CSS(filename=css_path)])
-        pdf_buffer.seek(0)
-
-        # =====================================================
-        # 🔹 Envío de correo con SendGrid API
-        # =====================================================
-        if dte.cliente and dte.cliente.correo:
-            print(f"🚀 Enviando correo a: {dte.cliente.correo}")
-
-            sg = sendgrid.SendGridAPIClient(api_key=os.environ.get("SENDGRID_API_KEY"))
-
-            # Configuración básica del correo
-            from_email = Email("manuelito2327@gmail.com", "OMNIGEST Facturación Electrónica")
-            to_email = To(dte.cliente.correo)
-            subject = "📄 Comprobante Electrónico Aprobado - OMNIGEST"
-            content = Content(
-                "text/plain",
-                f"""Estimado {dte.cliente.nombre},
-
-Su documento electrónico tipo {dte.get_tipo_dte_display()} ha sido aprobado por el Ministerio de Hacienda.
-
-Adjunto encontrará su comprobante en formato PDF y JSON.
-
-Saludos cordiales,
-Equipo OMNIGEST"""
-            )
-
-            mail = Mail(from_email, to_email, subject, content)
-
-            # 📎 Adjuntar PDF
-            pdf_data = base64.b64encode(pdf_buffer.read()).decode()
-            mail.add_attachment(
-                Attachment(
-                    FileContent(pdf_data),
-                    FileName(f"DTE_{dte.numero_control}.pdf"),
-                    FileType("application/pdf"),
-                    Disposition("attachment")
-                )
-            )
-
-            # 📎 Adjuntar JSON
-            with open(json_path, "rb") as jf:
-                json_data = base64.b64encode(jf.read()).decode()
-                mail.add_attachment(
-                    Attachment(
-                        FileContent(json_data),
-                        FileName(json_filename),
-                        FileType("application/json"),
-                        Disposition("attachment")
-                    )
-                )
-
-            # 📤 Enviar correo con SendGrid
-            response = sg.client.mail.send.post(request_body=mail.get())
-
-            if response.status_code in [200, 202]:
-                print("✅ Correo enviado correctamente con SendGrid API.")
-            else:
-                print(f"❌ Error SendGrid: {response.status_code} -> {response.body}")
-
-        return JsonResponse({'success': True, 'msg': '✅ DTE enviado exitosamente con adjuntos.'})
-
     except Exception as e:
         print(f"❌ Error general en generar_dte: {e}")
         return JsonResponse({'success': False, 'error': str(e)})
 
+
+@login_required
+def estado_emision(request, trabajo_id):
+    """Devuelve el avance de un trabajo de emisión (para consulta periódica)."""
+    trabajos = TrabajoEmision.objects.select_related('dte')
+    # Solo trabajos de la empresa del usuario; sin empresa, solo los que él encoló
+    if request.tenant:
+        trabajos = trabajos.filter(dte__empresa_id=request.tenant.id)
+    else:
+        trabajos = trabajos.filter(usuario=request.user)
+    trabajo = get_object_or_404(trabajos, id=trabajo_id)
+    return JsonResponse(estado_trabajo(trabajo))
+
+@login_required
+def descargar_pdf_dte(request, id):
+    """Descarga el PDF del comprobante (servido desde la caché si no cambió)."""
+    dte = get_object_or_404(DTE.por_empresa.select_related('empresa', 'cliente'), id=id)
+    response = HttpResponse(generar_pdf_dte(dte), content_type="application/pdf")
+    response["Content-Disposition"] = f'attachment; filename="DTE_{dte.numero_control}.pdf"'
+    return response
+
 # ======================================================
 # ✏️ EDITAR CAMPOS DEL CLIENTE EN UN DTE
 # ======================================================
@@ -401,13 +348,12 @@ Equipo OMNIGEST"""
 def editar_datos_dte(request, id):
     """
     Permite modificar datos del cliente (nombre, correo, NIT, dirección)
-    y reenviar el comprobante actualizado (PDF + JSON) al cliente.
+    y encola el reenvío del comprobante actualizado (PDF + JSON) al cliente.
     """
-    dte = get_object_or_404(DTE, id=id)
+    dte = get_object_or_404(DTE.por_empresa, id=id)
 
     if request.method == "POST":
         try:
-            import json, tempfile
             data = json.loads(request.body.decode('utf-8'))
 
             # 🔹 Actualizar datos del cliente
@@ -418,84 +364,13 @@ def editar_datos_dte(request, id):
             cliente.direccion = data.get('direccion', cliente.direccion)
             cliente.save()
 
-            # 🔹 Simular nuevo código MH
-            time.sleep(2)
-            dte.codigo_generacion = "MH-" + str(int(time.time()))
-            dte.sello_recepcion = "SELLO-" + str(int(time.time()))
-            dte.save()
-
-            # 🔹 Crear JSON actualizado
-            json_path = tempfile.gettempdir() + f"\\DTE_{dte.numero_control}.json"
-
-            dte_json = {
-                "tipo_dte": dte.tipo_dte,
-                "numero_control": dte.numero_control,
-                "cliente": cliente.nombre,
-                "correo": cliente.correo,
-                "fecha_emision": dte.fecha_emision.strftime("%Y-%m-%d"),
-                "total": float(dte.total),
-                "codigo_generacion": dte.codigo_generacion,
-                "sello_recepcion": dte.sello_recepcion,
-            }
-
-            with open(json_path, "w", encoding="utf-8") as f:
-                json.dump(dte_json, f, ensure_ascii=False, indent=4)
-
-            # 🔹 Crear PDF actualizado con factura01.html
-            from io import BytesIO
-            from django.template.loader import render_to_string
-            from xhtml2pdf import pisa
-
-            pdf_buffer = BytesIO()
-            # 📄 Renderizar la factura con tu plantilla HTML original
-            html_content = render_to_string("Facturacion/factura01.html", {
-                 "dte": dte,
-                "empresa": dte.empresa,
-                "cliente": dte.cliente,
-                "editable": False,
-                "qr_data": None,
-            })
-
-            # 🎨 Agregar tus estilos CSS reales
-            css_path = os.path.join(settings.BASE_DIR, 'Modulos', 'Facturacion', 'static', 'css', 'factura01.css')
-            pdf_buffer = BytesIO()
-
-            # 🖨️ Generar PDF con WeasyPrint (idéntico a lo que ves en el navegador)
-            HTML(string=html_content, base_url=request.build_absolute_uri("/")).write_pdf(
-            pdf_buffer, stylesheets=[CSS(filename=css_path)]
-            )
-
-            pdf_buffer.seek(0)
-
-            # 🔹 Enviar correo al cliente con los adjuntos
-            if cliente.correo:
-                from django.core.mail import EmailMessage
-
-                email = EmailMessage(
-                    subject="📄 DTE Actualizado y Aprobado - OMNIGEST",
-                    body=(
-                        f"Estimado {cliente.nombre},\n\n"
-                        "Su documento electrónico ha sido actualizado y aprobado "
-                        "por el Ministerio de Hacienda.\n\n"
-                        "Adjunto encontrará su comprobante actualizado en PDF y JSON.\n\n"
-                        "Saludos,\nEquipo OMNIGEST"
-                    ),
-                    from_email="facturacion@omnigest.com",
-                    to=[cliente.correo],
-                )
-
-                # Adjuntar PDF actualizado
-                email.attach(f"DTE_{dte.numero_control}.pdf", pdf_buffer.read(), "application/pdf")
-
-                # Adjuntar JSON actualizado
-                with open(json_path, "r", encoding="utf-8") as f:
-                    email.attach(f"DTE_{dte.numero_control}.json", f.read(), "application/json")
-
-                email.send(fail_silently=False)
+            # 🔹 Nuevo código MH, PDF, JSON y correo en el worker de emisión
+            trabajo = encolar_emision(dte, usuario=request.user, motivo='Actualizacion')
 
             return JsonResponse({
                 "status": "ok",
-                "msg": "Documento actualizado y reenviado al cliente con comprobantes adjuntos."
+                "trabajo_id": trabajo.id,
+                "msg": "Documento actualizado. El comprobante se reenviará al cliente con sus adjuntos."
             })
 
         except Exception as e:
@@ -507,7 +382,7 @@ def editar_datos_dte(request, id):
 @login_required
 def ver_dte_json(request, id):
     """Devuelve los datos del DTE en formato JSON para edición rápida"""
-    dte = get_object_or_404(DTE, id=id)
+    dte = get_object_or_404(DTE.por_empresa, id=id)
     return JsonResponse({
         "id": dte.id,
         "tipo_dte": dte.tipo_dte,
@@ -533,27 +408,48 @@ def menu_catalogos(request):
 @rol_requerido(['Administrador', 'Empleado'])
 def lista_clientes(request):
     """
-    Lista los clientes con opción de filtrar por nombre o DUI.
-    Si no hay búsqueda, muestra los últimos 20 registros.
+    Lista los clientes con opción de filtrar por nombre o DUI,
+    de los más recientes a los más antiguos, paginados por cursor.
     """
     query = request.GET.get('q', '').strip()
-
-    if query:
-        # 🔹 Filtra por nombre o DUI
-        clientes = Cliente.objects.filter(
-            Q(nombre__icontains=query) | Q(dui__icontains=query)
-        ).order_by('-id')
-    else:
-        # 🔹 Si no hay búsqueda, muestra los últimos 20
-        clientes = Cliente.objects.all().order_by('-id')[:20]
+    clientes = paginar_peticion(request, _filtrar_clientes(query), ORDEN_RECIENTES)
 
     context = {
         'clientes': clientes,
+        'pagina': clientes,
         'query': query,  # Mantiene el texto del buscador
     }
     return render(request, 'Facturacion/clientes.html', context)
 
 
+def _filtrar_clientes(query):
+    # 🔹 NIT/DUI/NRC completo (con o sin guiones): igualdad sobre la columna normalizada
+    if parece_documento(query):
+        exactos = Cliente.por_documento(query)
+        if exactos.exists():
+            return exactos
+    # 🔹 Filtra por nombre, NIT, DUI o NRC con el índice de búsqueda
+    return busqueda.filtrar(
+        Cliente.por_empresa.all(), 'cliente', query,
+        respaldo=Q(nombre__icontains=query) | Q(dui__icontains=query),
+    )
+
+
+@rol_requerido(['Administrador', 'Empleado'])
+def lista_clientes_json(request):
+    query = request.GET.get('q', '').strip()
+    pagina = paginar_peticion(request, _filtrar_clientes(query), ORDEN_RECIENTES)
+    return JsonResponse(pagina.como_dict(lambda c: {
+        "id": c.id,
+        "nombre": c.nombre,
+        "dui": c.dui,
+        "nit": c.nit,
+        "nrc": c.nrc,
+        "correo": c.correo,
+        "telefono": c.telefono,
+    }))
+
+
 @rol_requerido(['Administrador', 'Empleado'])
 def crear_cliente(request):
     if request.method == 'POST':
@@ -569,7 +465,7 @@ def crear_cliente(request):
 
 @rol_requerido(['Administrador', 'Contador'])
 def editar_cliente(request, id):
-    cliente = get_object_or_404(Cliente, id=id)
+    cliente = get_object_or_404(Cliente.por_empresa, id=id)
 
     if request.method == 'POST':
         form = ClienteForm(request.POST, instance=cliente)  # ✅ Ojo aquí, instance=cliente
@@ -586,7 +482,7 @@ def editar_cliente(request, id):
 
 @rol_requerido(['Administrador'])
 def eliminar_cliente(request, id):
-    cliente = get_object_or_404(Cliente, id=id)
+    cliente = get_object_or_404(Cliente.por_empresa, id=id)
     cliente.delete()
     messages.success(request, "Cliente eliminado correctamente.")
     return redirect('lista_clientes')
@@ -599,24 +495,44 @@ def eliminar_cliente(request, id):
 @login_required
 def lista_proveedores(request):
     """
-    Lista los proveedores con opción de filtrar por nombre o NIT.
-    Si no hay búsqueda, muestra los últimos 20 registros.
+    Lista los proveedores con opción de filtrar por nombre o NIT,
+    de los más recientes a los más antiguos, paginados por cursor.
     """
     query = request.GET.get('q', '').strip()
-
-    if query:
-        proveedores = Proveedor.objects.filter(
-            Q(nombre__icontains=query) | Q(nit__icontains=query)
-        ).order_by('-id')
-    else:
-        proveedores = Proveedor.objects.all().order_by('-id')[:20]
+    proveedores = paginar_peticion(request, _filtrar_proveedores(query), ORDEN_RECIENTES)
 
     return render(request, 'Facturacion/proveedores.html', {
         'proveedores': proveedores,
+        'pagina': proveedores,
         'query': query,
     })
 
 
+def _filtrar_proveedores(query):
+    if parece_documento(query):
+        exactos = Proveedor.por_documento(query)
+        if exactos.exists():
+            return exactos
+    return busqueda.filtrar(
+        Proveedor.por_empresa.all(), 'proveedor', query,
+        respaldo=Q(nombre__icontains=query) | Q(nit__icontains=query),
+    )
+
+
+@login_required
+def lista_proveedores_json(request):
+    query = request.GET.get('q', '').strip()
+    pagina = paginar_peticion(request, _filtrar_proveedores(query), ORDEN_RECIENTES)
+    return JsonResponse(pagina.como_dict(lambda p: {
+        "id": p.id,
+        "nombre": p.nombre,
+        "nit": p.nit,
+        "nrc": p.nrc,
+        "telefono": p.telefono,
+        "correo": p.correo,
+    }))
+
+
 @login_required
 def crear_proveedor(request):
     if request.method == 'POST':
@@ -632,7 +548,7 @@ def crear_proveedor(request):
 
 @login_required
 def editar_proveedor(request, id):
-    proveedor = get_object_or_404(Proveedor, id=id)
+    proveedor = get_object_or_404(Proveedor.por_empresa, id=id)
 
     if request.method == 'POST':
         form = ProveedorForm(request.POST, instance=proveedor)
@@ -647,7 +563,7 @@ def editar_proveedor(request, id):
 
 @login_required
 def eliminar_proveedor(request, id):
-    proveedor = get_object_or_404(Proveedor, id=id)
+    proveedor = get_object_or_404(Proveedor.por_empresa, id=id)
     proveedor.delete()
     messages.success(request, f"Proveedor '{proveedor.nombre}' eliminado correctamente.")
     return redirect('lista_proveedores')
@@ -659,31 +575,41 @@ def eliminar_proveedor(request, id):
 from django.db.models import Max, Q
 from django.http import JsonResponse
 
+def _filtrar_productos(query):
+    return busqueda.filtrar(
+        Producto.por_empresa.all(), 'producto', query,
+        respaldo=Q(codigo__icontains=query) | Q(descripcion__icontains=query),
+    )
+
+
 @login_required
 def lista_productos(request):
     query = request.GET.get('q', '')
-    productos = Producto.objects.all().order_by('codigo')
-    if query:
-        productos = productos.filter(
-            Q(codigo__icontains=query) |
-            Q(descripcion__icontains=query)
-        )
+    productos = paginar_peticion(request, _filtrar_productos(query), ORDEN_PRODUCTO)
     return render(request, 'Facturacion/productos.html', {
         'productos': productos,
+        'pagina': productos,
         'query': query
     })
 
 
-def generar_codigo_producto():
-    ultimo = Producto.objects.aggregate(ultimo=Max('codigo'))['ultimo']
-    if ultimo:
-        try:
-            numero = int(ultimo.replace('PRD', '')) + 1
-        except:
-            numero = 1
-    else:
-        numero = 1
-    return f"PRD{numero:04d}"
+@login_required
+def lista_productos_json(request):
+    query = request.GET.get('q', '')
+    pagina = paginar_peticion(request, _filtrar_productos(query), ORDEN_PRODUCTO)
+    return JsonResponse(pagina.como_dict(lambda p: {
+        "id": p.id,
+        "codigo": p.codigo,
+        "descripcion": p.descripcion,
+        "unidad_medida": p.unidad_medida,
+        "precio_unitario": f"{p.precio_unitario:.2f}",
+        "inventario": p.inventario,
+    }))
+
+
+def generar_codigo_producto(reservar=True):
+    """Siguiente código PRD de la empresa (secuencia; reservar=False solo lo muestra)."""
+    return secuencias.codigo_producto(empresa_actual(), reservar_numero=reservar)
 
 
 @login_required
@@ -701,7 +627,7 @@ def crear_producto(request):
     else:
         form = ProductoForm()
         # Autogenera el código en el formulario (solo visual)
-        nuevo_codigo = generar_codigo_producto()
+        nuevo_codigo = generar_codigo_producto(reservar=False)
         return render(request, 'Facturacion/form_producto.html', {
             'form': form,
             'nuevo_codigo': nuevo_codigo
@@ -710,7 +636,7 @@ def crear_producto(request):
 
 @login_required
 def editar_producto(request, id):
-    producto = get_object_or_404(Producto, id=id)
+    producto = get_object_or_404(Producto.por_empresa, id=id)
 
     if request.method == 'POST':
         form = ProductoForm(request.POST, instance=producto)
@@ -732,7 +658,7 @@ def editar_producto(request, id):
 
 @login_required
 def eliminar_producto(request, id):
-    producto = get_object_or_404(Producto, id=id)
+    producto = get_object_or_404(Producto.por_empresa, id=id)
     producto.delete()
     messages.success(request, f"Producto '{producto.descripcion}' eliminado correctamente.")
     return redirect('inventario')
@@ -745,24 +671,27 @@ def eliminar_producto(request, id):
 @login_required
 def inventario(request):
     query = request.GET.get('q', '')
-    productos = Producto.objects.all().order_by('codigo')
-    if query:
-        productos = productos.filter(Q(codigo__icontains=query) | Q(descripcion__icontains(query)))
-    return render(request, 'Facturacion/inventario.html', {'productos': productos, 'query': query})
-
-def generar_comprobante_unico():
-    """Genera un número único tipo COMP-20251113-0001"""
-    ultimo = Compra.objects.aggregate(max_id=Max('id'))['max_id'] or 0
-    return f"COMP-{now().strftime('%Y%m%d')}-{(ultimo + 1):04d}"
-
+    # ?fecha=AAAA-MM-DD: existencias al cierre de ese día (último cierre + movimientos posteriores)
+    try:
+        fecha = parse_date(request.GET.get('fecha', ''))
+    except ValueError:
+        fecha = None
+    if fecha:
+        productos = existencias.existencias_a_fecha(fecha, _filtrar_productos(query))
+    else:
+        productos = _filtrar_productos(query).annotate(existencia=F('inventario'))
+    productos = paginar_peticion(request, productos, ORDEN_PRODUCTO)
+    return render(request, 'Facturacion/inventario.html', {
+        'productos': productos, 'pagina': productos, 'query': query, 'fecha': fecha,
+    })
 
-def generar_registro_unico():
-    """Genera un número único tipo REG-00001"""
-    ultimo = Compra.objects.aggregate(max_id=Max('id'))['max_id'] or 0
-    return f"REG-{(ultimo + 1):05d}"
+def generar_numeros_compra():
+    """Comprobante y registro únicos (COMP-20251113-0001, REG-00001) de la secuencia de compras."""
+    return secuencias.numeros_compra(empresa_actual())
 
 
 @login_required
+@escritura_serializada
 def registrar_compra(request):
     if request.method == 'POST':
         try:
@@ -785,21 +714,21 @@ def registrar_compra(request):
             precio_compra = Decimal(precio_compra_str)
 
             # Buscar producto y proveedor
-            producto = Producto.objects.get(id=producto_id)
-            proveedor = Proveedor.objects.get(id=proveedor_id)
+            producto = Producto.por_empresa.get(id=producto_id)
+            proveedor = Proveedor.por_empresa.get(id=proveedor_id)
 
             # 🧮 Cálculos (precio_compra = total de la compra)
             subtotal = precio_compra  # el usuario ya ingresa el total
             precio_unitario = subtotal / cantidad  # cálculo automático
-            iva_13 = subtotal * Decimal('0.13')
+            iva_13 = calcular_iva(subtotal)
             total = subtotal + iva_13
 
             # Generar comprobantes únicos
-            comprobante_numero = generar_comprobante_unico()
-            registro_nrc = generar_registro_unico()
+            comprobante_numero, registro_nrc = generar_numeros_compra()
 
             # 💾 Guardar la compra
             Compra.objects.create(
+                empresa=request.tenant,
                 fecha=now(),
                 comprobante_numero=comprobante_numero,
                 registro_nrc=registro_nrc,
@@ -823,22 +752,8 @@ def registrar_compra(request):
                 producto.precio_unitario = precio_unitario
                 producto.save()
 
-            # 🧾 Crear DTE vinculado
-            empresa = Empresa.objects.first()
-            cliente = Cliente.objects.first()
-            if empresa and cliente:
-                DTE.objects.create(
-                    empresa=empresa,
-                    cliente=cliente,
-                    tipo_dte='03',
-                    numero_control=comprobante_numero,
-                    subtotal=subtotal,
-                    iva=iva_13,
-                    total=total,
-                    codigo_generacion=f"Compra a proveedor: {proveedor.nombre}",
-                    estado='Activo',
-                    fecha_emision=now()
-                )
+            # La compra solo va al libro y al anexo de compras: no se crea un
+            # CCF (sería una venta en el libro de ventas y en el anexo F07)
 
             messages.success(request, f"✅ Compra registrada correctamente: {cantidad} unidades por ${subtotal} (Precio unitario ${precio_unitario:.2f})")
             return redirect('libro_compras')
@@ -848,8 +763,8 @@ def registrar_compra(request):
             return redirect('registrar_compra')
 
     # 🔽 Mostrar formulario
-    productos = Producto.objects.all().order_by('descripcion')
-    proveedores = Proveedor.objects.all().order_by('nombre')
+    productos = Producto.por_empresa.all().order_by('descripcion')
+    proveedores = Proveedor.por_empresa.all().order_by('nombre')
 
     return render(request, 'Facturacion/form_compra.html', {
         'productos': productos,
@@ -861,10 +776,11 @@ def registrar_compra(request):
 # ======================================================
 
 @login_required
+@lectura_replica
 def libro_compras(request):
     query = request.GET.get('q', '').strip()
 
-    compras_qs = Compra.objects.all().order_by('-fecha', '-id')
+    compras_qs = Compra.por_empresa.all().order_by('-fecha', '-id')
 
     if query:
         compras_qs = compras_qs.filter(
@@ -895,96 +811,36 @@ def libro_compras(request):
     })
 
 @login_required
+@lectura_replica
 def exportar_libro_compras_excel(request):
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.utils import get_column_letter
-    from django.http import HttpResponse
-    from decimal import Decimal
+    """Exporta el libro de compras a Excel en streaming (memoria constante)."""
+    return exportar_libro_compras(Compra.por_empresa.all())
 
-    # 📘 Obtener los datos igual que en la vista libro_compras
-    compras = [
-        {
-            "fecha": c.fecha.strftime("%d/%m/%Y"),
-            "comprobante": c.comprobante_numero,
-            "registro": c.registro_nrc,
-            "proveedor": c.proveedor,
-            "precio_unitario": float(c.precio_unitario) if hasattr(c, "precio_unitario") else 0.0,
-            "gravadas": float(c.compras_gravadas),
-        }
-        for c in Compra.objects.all().order_by('-fecha')
-    ]
 
-    # 📗 Crear archivo Excel
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Libro de Compras"
+@login_required
+@lectura_replica
+def exportar_anexo_csv(request, anexo):
+    """
+    Descarga un anexo CSV del F07 (compras, ventas a consumidor final o a
+    contribuyentes) para un rango de fechas ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD.
+    Por defecto, el mes en curso.
+    """
+    if anexo not in ANEXOS:
+        return JsonResponse({'error': 'Anexo no válido.'}, status=404)
+    # Las filas se leen fuera de la vista: la empresa se resuelve aquí
+    if request.tenant is None and not todas_las_empresas():
+        return JsonResponse({'error': 'Su usuario no está asociado a ninguna empresa.'}, status=403)
 
-    # Encabezados
-    encabezados = [
-        "N°", "Fecha", "Comprobante N°", "Registro N°", "Proveedor",
-        "Precio Unitario", "Compras Gravadas", "IVA 13%", "Total"
-    ]
-    ws.append(encabezados)
-
-    # 🟦 Estilos de encabezado
-    header_font = Font(bold=True, color="000000")
-    header_fill = PatternFill(start_color="B7DEE8", end_color="B7DEE8", fill_type="solid")
-    center_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_alignment
-
-    # 🧱 Borde de celdas
-    thin_border = Border(
-        left=Side(style="thin"),
-        right=Side(style="thin"),
-        top=Side(style="thin"),
-        bottom=Side(style="thin")
-    )
+    hoy = timezone.localdate()
+    try:
+        desde = datetime.strptime(request.GET['desde'], '%Y-%m-%d').date() if request.GET.get('desde') else hoy.replace(day=1)
+        hasta = datetime.strptime(request.GET['hasta'], '%Y-%m-%d').date() if request.GET.get('hasta') else hoy
+    except ValueError:
+        return JsonResponse({'error': 'Formato de fecha inválido, use AAAA-MM-DD.'}, status=400)
+    if desde > hasta:
+        return JsonResponse({'error': 'La fecha inicial es posterior a la final.'}, status=400)
 
-    # 🧮 Agregar filas de datos
-    for i, compra in enumerate(compras, start=2):
-        fila = [
-            i - 1,
-            compra["fecha"],
-            compra["comprobante"],
-            compra["registro"],
-            compra["proveedor"],
-            compra["precio_unitario"],
-            compra["gravadas"],
-            f"=G{i}*0.13",   # IVA 13% (columna G)
-            f"=G{i}+H{i}"    # Total = Gravadas + IVA
-        ]
-        ws.append(fila)
-
-    # 🔲 Aplicar bordes y alineación a todas las celdas
-    for row in ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
-        for cell in row:
-            cell.border = thin_border
-            cell.alignment = center_alignment
-
-    # 📏 Ajustar ancho de columnas automáticamente
-    for col in ws.columns:
-        max_length = 0
-        column = get_column_letter(col[0].column)
-        for cell in col:
-            try:
-                if cell.value:
-                    max_length = max(max_length, len(str(cell.value)))
-            except:
-                pass
-        ws.column_dimensions[column].width = max_length + 2
-
-    # 💾 Preparar respuesta HTTP
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = 'attachment; filename="Libro_Compras.xlsx"'
-    wb.save(response)
-    return response
+    return exportar_anexo(anexo, desde, hasta, empresa_id=request.tenant.id if request.tenant else None)
 
 
 
@@ -993,51 +849,37 @@ def exportar_libro_compras_excel(request):
 # ======================================================
 
 @login_required
+@lectura_replica
 def libro_ventas(request):
     """
     Genera el libro de ventas agrupado por día (zona horaria local),
     mostrando los 10 días más recientes.
+    Lee el resumen diario de ventas: el costo no depende del historial.
     """
-    from collections import defaultdict
-    from django.utils.timezone import localtime
-    from datetime import datetime
-
-    dtes = DTE.objects.filter(tipo_dte='01', estado='Activo').order_by('fecha_emision')
-
-    ventas_por_dia = defaultdict(lambda: {'ventas_gravadas': 0, 'total': 0, 'emitido_del': None, 'emitido_al': None})
-
-    for dte in dtes:
-        # 🔹 Convierte a hora local antes de agrupar
-        fecha_local = localtime(dte.fecha_emision)
-        dia = fecha_local.strftime("%d/%m/%Y")
-
-        ventas_por_dia[dia]['ventas_gravadas'] += float(dte.subtotal)
-        ventas_por_dia[dia]['total'] += float(dte.total)
-
-        if not ventas_por_dia[dia]['emitido_del']:
-            ventas_por_dia[dia]['emitido_del'] = dte.numero_control
-        ventas_por_dia[dia]['emitido_al'] = dte.numero_control
+    dias = (
+        ResumenVentasDiario.por_empresa
+        .filter(tipo_dte='01', cantidad__gt=0)
+        .values('fecha')
+        .annotate(
+            ventas_gravadas=Sum('subtotal'),
+            total_dia=Sum('total'),
+            emitido_del=Min('emitido_del'),
+            emitido_al=Max('emitido_al'),
+        )
+        .order_by('-fecha')[:10]
+    )
 
-    # Convertir a lista y ordenar por fecha descendente
     ventas = [
         {
-            'dia': dia,
-            'emitido_del': data['emitido_del'],
-            'emitido_al': data['emitido_al'],
-            'ventas_gravadas': round(data['ventas_gravadas'], 2),
-            'total': round(data['total'], 2),
+            'dia': d['fecha'].strftime("%d/%m/%Y"),
+            'emitido_del': d['emitido_del'],
+            'emitido_al': d['emitido_al'],
+            'ventas_gravadas': round(d['ventas_gravadas'], 2),
+            'total': round(d['total_dia'], 2),
         }
-        for dia, data in ventas_por_dia.items()
+        for d in dias
     ]
 
-    # 🧭 Ordenar de más reciente a más antigua
-    ventas.sort(key=lambda x: datetime.strptime(x['dia'], "%d/%m/%Y"), reverse=True)
-
-    # Mostrar solo las últimas 10
-    ventas = ventas[:10]
-
-    print(f"📘 DTE encontrados: {len(dtes)}, días únicos: {len(ventas)}")  # para depurar
-
     return render(request, 'Facturacion/libro_ventas.html', {'ventas': ventas})
 
 
@@ -1069,29 +911,15 @@ def eliminar_usuario(request, user_id):
     messages.success(request, "Usuario eliminado correctamente.")
     return redirect('lista_usuarios')
 
-def _generar_numero_control(tipo):
-    """Genera un número de control ficticio único."""
-    return f"DTE-{tipo}-" + uuid.uuid4().hex[:8].upper()
-
-
-def _generar_qr_datauri(text):
-    """Genera un QR embebido en formato base64."""
-    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M)
-    qr.add_data(text)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    bio = io.BytesIO()
-    img.save(bio, format="PNG")
-    return f"data:image/png;base64,{base64.b64encode(bio.getvalue()).decode()}"
-
 @csrf_exempt
 @login_required
+@escritura_serializada
 def modal_dte(request, tipo):
     """Crea y carga el DTE con datos del catálogo (producto, cliente, totales)"""
     from .models import Empresa, Cliente, DTE
     from django.utils import timezone
 
-    empresa = Empresa.objects.first()
+    empresa = request.tenant or Empresa.objects.first()
     if not empresa:
         empresa = Empresa.objects.create(
             nombre="Omnigest S.A. de C.V.",
@@ -1103,7 +931,7 @@ def modal_dte(request, tipo):
             representante_legal="Sucursal Salvador del Mundo"
         )
 
-    cliente = Cliente.objects.first()
+    cliente = Cliente.por_empresa.first()
     producto = None
 
     if request.method == 'POST':
@@ -1114,7 +942,7 @@ def modal_dte(request, tipo):
 
         # Buscar o crear cliente
         if cliente_id:
-            cliente = Cliente.objects.filter(id=cliente_id).first()
+            cliente = Cliente.por_empresa.filter(id=cliente_id).first()
         elif nuevo_cliente:
             cliente = Cliente.objects.create(
                 nombre=nuevo_cliente,
@@ -1136,7 +964,6 @@ def modal_dte(request, tipo):
         empresa=empresa,
         cliente=cliente,
         tipo_dte=tipo,
-        numero_control=f"DTE-{tipo}-{uuid.uuid4().hex[:8].upper()}",
         fecha_emision=timezone.now(),
         condicion_pago="Contado",
         subtotal=producto['subtotal'] if producto else 0,
@@ -1164,15 +991,61 @@ def modal_dte(request, tipo):
         'producto': producto
     })
 
+@csrf_exempt
+@login_required
+@require_POST
+def emitir_dte_lote(request):
+    """
+    Crea DTE en lote desde un ERP.
+    Recibe un arreglo JSON de documentos (o {"documentos": [...], "emitir": true})
+    y devuelve el resultado de cada documento por su índice.
+    """
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'error': 'JSON inválido.'}, status=400)
+
+    emitir = False
+    if isinstance(data, dict):
+        emitir = bool(data.get('emitir', False))
+        data = data.get('documentos')
+    if not isinstance(data, list) or not data:
+        return JsonResponse({'success': False, 'error': 'Se esperaba una lista de documentos.'}, status=400)
+
+    maximo = getattr(settings, 'LOTE_MAX_DOCUMENTOS', 5000)
+    if len(data) > maximo:
+        return JsonResponse({'success': False, 'error': f'Máximo {maximo} documentos por lote.'}, status=400)
+
+    empresa = request.tenant or Empresa.objects.first()
+    if not empresa:
+        return JsonResponse({'success': False, 'error': 'No hay empresa configurada.'}, status=400)
+
+    try:
+        resultados = crear_dtes_en_lote(data, empresa, usuario=request.user, emitir=emitir)
+    except ReferenciasAjenas as e:
+        return JsonResponse({
+            'success': False, 'error': str(e), 'clientes': e.clientes, 'productos': e.productos,
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+    creados = sum(1 for r in resultados if r['success'])
+    return JsonResponse({
+        'success': creados == len(resultados),
+        'creados': creados,
+        'fallidos': len(resultados) - creados,
+        'resultados': resultados,
+    })
+
 @login_required
 def ver_dte(request, dte_id):
     """
     Muestra el DTE (desde el botón Editar o QR), con productos incluidos.
     Si el usuario es Administrador, el modal será editable.
     """
-    from .models import DTE, DetalleDTE, Perfil
+    from .models import DTE, DetalleDTE
 
-    dte = get_object_or_404(DTE, id=dte_id)
+    dte = get_object_or_404(DTE.por_empresa.select_related('empresa', 'cliente'), id=dte_id)
     empresa = dte.empresa
     cliente = dte.cliente
 
@@ -1180,12 +1053,10 @@ def ver_dte(request, dte_id):
     detalles = DetalleDTE.objects.filter(dte=dte).select_related('producto')
 
     # 🔹 Verificar si el usuario es Administrador
-    perfil = Perfil.objects.filter(user=request.user).first()
-    es_admin = perfil and perfil.rol.lower() == 'administrador'
+    es_admin = (request.rol or '').lower() == 'administrador'
 
-    # 🔹 Generar QR
-    qr_text = f"{dte.numero_control}|{empresa.nit}|{cliente.nit}|{dte.total:.2f}"
-    qr_data = _generar_qr_datauri(qr_text)
+    # 🔹 QR (guardado en el DTE por el worker de emisión; ver qr.py)
+    qr_data = qr.qr_dte(dte)
 
     # 🔹 Plantilla según tipo
     plantillas_dte = {
@@ -1245,13 +1116,14 @@ def validar_admin(request):
         return JsonResponse({'success': False, 'error': str(e)})
 
 @login_required
-def editar_dte(request, numero_control):
+def editar_dte(request, id):
     """
     Carga el DTE para edición (solo si usuario tiene permisos de administrador).
+    Por id: el número de control solo es único dentro de cada empresa.
     """
     from .models import Empresa, Cliente, DTE, DetalleDTE
 
-    dte = get_object_or_404(DTE, numero_control=numero_control)
+    dte = get_object_or_404(DTE.por_empresa, id=id)
     detalles = dte.detalles.all()
 
     if request.method == 'POST':
@@ -1278,7 +1150,7 @@ def editar_dte(request, numero_control):
 
 @csrf_exempt
 @login_required
-def actualizar_dte(request, numero_control):
+def actualizar_dte(request, id):
     """
     Actualiza un DTE y recalcula totales para reflejarlo en reportes y libros.
     """
@@ -1286,7 +1158,7 @@ def actualizar_dte(request, numero_control):
     import json
 
     try:
-        dte = DTE.objects.filter(numero_control=numero_control).select_related('cliente', 'empresa').first()
+        dte = DTE.por_empresa.filter(id=id).select_related('cliente', 'empresa').first()
         if not dte:
             return JsonResponse({'success': False, 'error': 'No se encontró el documento.'})
 
@@ -1312,13 +1184,12 @@ def actualizar_dte(request, numero_control):
             dte.cliente.direccion = data['direccion']
         dte.cliente.save()
 
-        # 🔹 Recalcular subtotal e IVA
-        if hasattr(dte, 'detalles') and dte.detalles.exists():
-            subtotal = sum(Decimal(det.total_item) for det in dte.detalles.all())
-        else:
+        # 🔹 Recalcular subtotal e IVA (suma en la base de datos)
+        subtotal = dte.detalles.aggregate(s=Sum('total_item'))['s']
+        if subtotal is None:
             subtotal = (dte.total / Decimal('1.13')).quantize(Decimal('0.01'))
 
-        iva = (subtotal * Decimal('0.13')).quantize(Decimal('0.01'))
+        iva = calcular_iva(subtotal)
         dte.subtotal = subtotal
         dte.iva = iva
         dte.total = subtotal + iva
@@ -1337,19 +1208,27 @@ def actualizar_dte(request, numero_control):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
     
+@login_required
+@lectura_replica
 def buscar_dte(request):
     """Busca documentos DTE por cliente o número de control"""
     q = request.GET.get("q", "").strip()
     resultados = []
 
     if q:
-        # 🔹 Filtramos por cliente o número de control
-        dtes = (
-            DTE.objects.filter(
-                Q(cliente__nombre__icontains=q) | Q(numero_control__icontains=q)
+        dtes = []
+        if parece_documento(q):
+            # 🔹 NIT/DUI/NRC del cliente: búsqueda exacta por índice
+            dtes = list(
+                DTE.por_empresa.filter(cliente__in=Cliente.por_documento(q))
+                .select_related("cliente").defer("qr_svg")
+                .order_by("-fecha_emision")[:10]
             )
-            .select_related("cliente")
-            .order_by("-fecha_emision")[:10]  # ✅ Solo los 10 más recientes
+        # 🔹 Cliente o número de control, ordenados por relevancia (índice de búsqueda)
+        dtes = dtes or busqueda.buscar(
+            DTE.por_empresa.select_related("cliente").defer("qr_svg"), 'dte', q,
+            respaldo=Q(cliente__nombre__icontains=q) | Q(numero_control__icontains=q),
+            limite=10,
         )
 
         resultados = [
@@ -1368,20 +1247,56 @@ def buscar_dte(request):
 
     return JsonResponse({"resultados": resultados})
 
+@login_required
+@lectura_replica
+def autocompletar_dte(request):
+    """
+    Sugerencias del buscador de DTE: {"seq", "r": [[id, tipo, número, cliente, fecha, total, estado], ...]}.
+    `seq` se devuelve tal cual para que el navegador descarte respuestas viejas.
+    """
+    respuesta = JsonResponse({
+        "seq": request.GET.get("seq", ""),
+        "r": autocompletar.sugerencias(request.GET.get("q", "")),
+    })
+    respuesta["Cache-Control"] = f"private, max-age={settings.AUTOCOMPLETAR_CACHE_SEGUNDOS}"
+    return respuesta
+
+
+@login_required
+@lectura_replica
+def buscar_cliente(request):
+    """Selector de clientes del catálogo: NIT/DUI/NRC exacto o nombre."""
+    q = request.GET.get("q", "").strip()
+    clientes = []
+    if q:
+        if parece_documento(q):
+            clientes = list(Cliente.por_documento(q).only('id', 'nombre', 'correo', 'nit', 'dui')[:10])
+        clientes = clientes or busqueda.buscar(
+            Cliente.por_empresa.only('id', 'nombre', 'correo', 'nit', 'dui'), 'cliente', q,
+            respaldo=Q(nombre__icontains=q) | Q(nit__icontains=q) | Q(dui__icontains=q),
+            limite=10,
+        )
+    return JsonResponse({"resultados": [
+        {"id": c.id, "nombre": c.nombre, "correo": c.correo, "documento": c.nit or c.dui}
+        for c in clientes
+    ]})
+
+
 @login_required
 def catalogo_productos(request):
     """
     Muestra los productos en stock, permite seleccionar cantidad, cliente y generar un DTE.
+    El cliente se elige con el buscador (buscar_cliente), sin cargar la tabla de clientes.
     """
-    from .models import Producto, Cliente
-    productos = Producto.objects.all().order_by('descripcion')
-    clientes = Cliente.objects.all().order_by('nombre')
+    from .models import Producto
+    productos = paginar_peticion(request, Producto.por_empresa.all(), ORDEN_PRODUCTO)
     return render(request, 'Facturacion/catalogo_productos.html', {
         'productos': productos,
-        'clientes': clientes
+        'pagina': productos,
     })
 
 @login_required
+@escritura_serializada
 def registrar_venta(request):
     if request.method == "POST":
         try:
@@ -1397,12 +1312,12 @@ def registrar_venta(request):
             if not producto_id or not cantidad:
                 return JsonResponse({'status': 'error', 'mensaje': 'Faltan datos del producto o cantidad.'}, status=400)
 
-            producto = get_object_or_404(Producto, id=int(producto_id))
+            producto = get_object_or_404(Producto.por_empresa, id=int(producto_id))
             cantidad = int(cantidad)
 
             # 🧾 Buscar o crear cliente
             if cliente_id:
-                cliente = get_object_or_404(Cliente, id=int(cliente_id))
+                cliente = get_object_or_404(Cliente.por_empresa, id=int(cliente_id))
             elif nuevo_cliente:
                 cliente = Cliente.objects.create(
                     nombre=nuevo_cliente,
@@ -1411,13 +1326,13 @@ def registrar_venta(request):
                 )
                 print(f"👤 Nuevo cliente creado: {cliente.nombre}")
             else:
-                cliente, _ = Cliente.objects.get_or_create(
+                cliente, _ = Cliente.por_empresa.get_or_create(
                     nombre="Consumidor Final",
                     defaults={"correo": "consumidor@omnigest.com"}
                 )
 
             # ⚙️ Empresa por defecto
-            empresa = Empresa.objects.first()
+            empresa = request.tenant or Empresa.objects.first()
             if not empresa:
                 empresa = Empresa.objects.create(
                     nombre="OMNIGEST S.A. de C.V.",
@@ -1428,40 +1343,37 @@ def registrar_venta(request):
                     correo="info@omnigest.com"
                 )
 
-            # ⚠️ Validar stock
-            if producto.inventario < cantidad:
-                return JsonResponse({'status': 'error', 'mensaje': 'Stock insuficiente'}, status=400)
-
             # 🧮 Cálculos
             subtotal = producto.precio_unitario * Decimal(cantidad)
-            iva = subtotal * Decimal('0.13')
+            iva = calcular_iva(subtotal)
             total = subtotal + iva
 
-            # 📦 Descontar inventario (una sola vez)
-            #producto.inventario -= cantidad
-            #producto.save()
-
-            # 🧾 Crear DTE
-            dte = DTE.objects.create(
-                empresa=empresa,
-                cliente=cliente,
-                tipo_dte='01',
-                numero_control=f"DTE-01-{now().strftime('%Y%m%d%H%M%S')}",
-                subtotal=subtotal,
-                iva=iva,
-                total=total,
-                codigo_generacion=f"VENTA-{now().strftime('%H%M%S')}",
-                estado='Activo',
-                fecha_emision=now()
-            )
+            try:
+                with transaction.atomic(using=router.db_for_write(Inventario)):
+                    # 📦 Descontar inventario validando el stock en la misma sentencia
+                    Inventario(
+                        producto=producto,
+                        tipo='Salida',
+                        cantidad=cantidad,
+                        descripcion=f"Venta a {cliente.nombre}"
+                    ).save(validar_stock=True)
+
+                    # 🧾 Crear DTE
+                    dte = DTE.objects.create(
+                        empresa=empresa,
+                        cliente=cliente,
+                        tipo_dte='01',
+                        subtotal=subtotal,
+                        iva=iva,
+                        total=total,
+                        codigo_generacion=f"VENTA-{now().strftime('%H%M%S')}",
+                        estado='Activo',
+                        fecha_emision=now()
+                    )
+            except StockInsuficiente:
+                return JsonResponse({'status': 'error', 'mensaje': 'Stock insuficiente'}, status=400)
 
-            # 📦 Registrar movimiento de inventario
-            Inventario.objects.create(
-                producto=producto,
-                tipo='Salida',
-                cantidad=cantidad,
-                descripcion=f"Venta a {cliente.nombre}"
-            )
+            producto.refresh_from_db(fields=['inventario'])
 
             return JsonResponse({
                 "status": "ok",